@@ -0,0 +1,56 @@
+"""
+Fotos de entrada dos benchmarks: as imagens de referencia_cor como estão (mp=0) ou ampliadas para
+~N megapixels e regravadas em JPEG (qualidade 92, como sai do celular). As ampliações são geradas uma
+vez por execução e, com cache_dir, reaproveitadas entre execuções.
+"""
+import math
+import os
+
+import cv2
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+REF_DIR = os.path.join(ROOT, "referencia_cor")
+
+# (imagem, papel no pipeline, campo do /analisar)
+CASOS = [
+    ("rosto.png", "skin_face", "rosto"),
+    ("interno_braco.png", "skin_arm", "braco_interno"),
+    ("cabelo.png", "hair", "cabelo"),
+    ("rosto_papel.jpg", "papel", "rosto_com_papel"),
+]
+
+
+def rotulo_mp(mp):
+    return "orig" if not mp else "%gMP" % mp
+
+
+def ampliar(path, megapixels, quality=92):
+    """Amplia (INTER_CUBIC) até ~megapixels e devolve os bytes JPEG."""
+    img = cv2.imread(path, cv2.IMREAD_COLOR)
+    h, w = img.shape[:2]
+    escala = math.sqrt(megapixels * 1e6 / float(h * w))
+    grande = cv2.resize(img, (int(w * escala), int(h * escala)), interpolation=cv2.INTER_CUBIC)
+    ok, buf = cv2.imencode(".jpg", grande, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    return buf.tobytes()
+
+
+def carregar(mp=0, cache_dir=None):
+    """{imagem: bytes} de todos os CASOS na resolução mp (0 = arquivo original)."""
+    fotos = {}
+    for nome, _, _ in CASOS:
+        path = os.path.join(REF_DIR, nome)
+        if not mp:
+            with open(path, "rb") as f:
+                fotos[nome] = f.read()
+            continue
+        cache = os.path.join(cache_dir, "%s_%s.jpg" % (os.path.splitext(nome)[0], rotulo_mp(mp))) if cache_dir else None
+        if cache and os.path.isfile(cache):
+            with open(cache, "rb") as f:
+                fotos[nome] = f.read()
+            continue
+        fotos[nome] = ampliar(path, mp)
+        if cache:
+            os.makedirs(cache_dir, exist_ok=True)
+            with open(cache, "wb") as f:
+                f.write(fotos[nome])
+    return fotos
@@ -0,0 +1,114 @@
+"""
+Modelo de pele em tabela (processing/skin_lut.py) contra as regras HSV de segment_skin_region, nas fotos de
+pele de referencia_cor (originais ou ampliadas): concordância das máscaras e tempo.
+
+Para cada foto e modelo:
+  classificador: só a decisão por pixel (HSV = cvtColor HSV + dois inRange + OR; tabela = cvtColor + np.take);
+  segmentacao:   segment_skin_region inteiro (rosto do FaceMesh em rosto.png, morfologia, fallback);
+  concordancia:  pixels com a mesma decisão, IoU da pele e delta E76 da média LAB da região final.
+Sem --modelo, compara as tabelas geradas das próprias regras HSV (bgr 8 bits: idêntica; ycrcb 6 bits: a
+quantização) — para um modelo treinado, passe o .npz de scripts/treinar_pele_lut.py.
+
+Execute na raiz do projeto:
+    python -m backend.benchmarks.pele_lut [--modelo pele_lut.npz ...] [--mp 0 12] [--repeticoes 10]
+"""
+import argparse
+import os
+import sys
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+BACKEND = os.path.join(ROOT, "backend")
+sys.path.insert(0, BACKEND)
+
+import numpy as np
+
+FOTOS_PELE = ("rosto.png", "interno_braco.png")
+
+
+def p50_ms(fn, repeticoes):
+    fn()
+    tempos = []
+    for _ in range(repeticoes):
+        t0 = time.perf_counter()
+        fn()
+        tempos.append((time.perf_counter() - t0) * 1000)
+    return float(np.percentile(tempos, 50))
+
+
+def concordancia(a, b):
+    """(proporção de pixels iguais, IoU da pele) entre duas máscaras."""
+    a, b = a > 0, b > 0
+    uniao = np.count_nonzero(a | b)
+    return float(np.mean(a == b)), (np.count_nonzero(a & b) / uniao if uniao else 1.0)
+
+
+def media_lab(lab_uint8, mask):
+    from processing import histograma
+    from processing.segment import get_region_pixels_uint8
+    pixels = get_region_pixels_uint8(lab_uint8, mask)
+    return np.array(histograma.media(histograma.histogramas(pixels))) if len(pixels) else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--modelo", nargs="+", default=None, help=".npz de scripts/treinar_pele_lut.py")
+    parser.add_argument("--mp", type=float, nargs="+", default=[0, 12], help="0 = imagens originais")
+    parser.add_argument("--repeticoes", type=int, default=10)
+    parser.add_argument("--cache-dir", default=None, help="guarda as ampliações em disco entre execuções")
+    args = parser.parse_args()
+
+    os.environ.pop("COLORIMETRIA_PELE_LUT", None)
+    import cv2
+    from benchmarks.fixtures import carregar, rotulo_mp
+    from processing import config, skin_lut
+    from processing.pipeline import white_balance_from_paper
+    from processing.preprocess import preprocess_pipeline
+    from processing.segment import segment_face_mediapipe, segment_skin_region
+
+    config.PELE_LUT = ""    # segment_skin_region(modelo=None) = regras HSV
+    if args.modelo:
+        modelos = [(os.path.basename(path), skin_lut.TabelaPele.carregar(path)) for path in args.modelo]
+    else:
+        modelos = [
+            ("hsv bgr/8", skin_lut.TabelaPele(skin_lut.tabela_hsv("bgr", 8), "bgr", 8)),
+            ("hsv ycrcb/6", skin_lut.TabelaPele(skin_lut.tabela_hsv("ycrcb", 6), "ycrcb", 6)),
+        ]
+
+    print("%-22s %-16s %9s %9s %8s %7s %7s %9s %9s %7s" % (
+        "foto", "modelo", "hsv ms", "tab ms", "ganho", "iguais", "IoU", "seg hsv", "seg tab", "dE",
+    ))
+    for mp in args.mp:
+        fotos = carregar(mp, args.cache_dir)
+        # Como no /analisar (e no treino): correção de branco da foto com papel
+        wb = white_balance_from_paper(fotos["rosto_papel.jpg"])
+        for nome in FOTOS_PELE:
+            pre = preprocess_pipeline(fotos[nome], wb_correction=wb, max_side=config.MAX_LADO, lab_float=False)
+            bgr, scale = pre["bgr"], pre["scale"]
+            face = segment_face_mediapipe(bgr) if nome == "rosto.png" else None
+
+            def classificar_hsv():
+                return skin_lut.mascara_hsv(cv2.cvtColor(bgr, cv2.COLOR_BGR2HSV))
+
+            def segmentar_hsv():
+                return segment_skin_region(bgr, face, scale=scale)
+
+            t_hsv = p50_ms(classificar_hsv, args.repeticoes)
+            t_seg_hsv = p50_ms(segmentar_hsv, args.repeticoes)
+            ref = classificar_hsv()
+            ref_seg = segmentar_hsv()
+            ref_lab = media_lab(pre["lab_uint8"], ref_seg)
+            for rotulo, modelo in modelos:
+                t_tab = p50_ms(lambda: modelo.mascara(bgr), args.repeticoes)
+                t_seg_tab = p50_ms(lambda: segment_skin_region(bgr, face, scale=scale, modelo=modelo), args.repeticoes)
+                iguais, iou = concordancia(ref, modelo.mascara(bgr))
+                lab = media_lab(pre["lab_uint8"], segment_skin_region(bgr, face, scale=scale, modelo=modelo))
+                de = float(np.linalg.norm(lab - ref_lab)) if lab is not None and ref_lab is not None else float("nan")
+                print("%-22s %-16s %9.2f %9.2f %7.2fx %6.1f%% %7.3f %9.2f %9.2f %7.2f" % (
+                    "%s@%s" % (nome, rotulo_mp(mp)), rotulo, t_hsv, t_tab, t_hsv / t_tab, iguais * 100, iou,
+                    t_seg_hsv, t_seg_tab, de,
+                ), flush=True)
+
+
+if __name__ == "__main__":
+    main()
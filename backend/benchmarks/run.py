@@ -0,0 +1,281 @@
+"""
+Benchmark do pipeline de cor: cada etapa (load_image, preprocess_pipeline, segment_*, extract_region_features,
+get_white_balance_correction, lab_to_hex) e o handler /analisar inteiro, sobre as imagens de referencia_cor
+originais e ampliadas (12/24/48 MP). Para cada uma: latência (p50/p90/p99), vazão e pico de memória
+(tracemalloc: alocações do Python/NumPy, incluindo as imagens do OpenCV), e o mean_lab obtido.
+
+Com --salvar grava o resultado como baseline (JSON); sem ele compara com a baseline existente e sai com
+código 1 se alguma entrada ficar mais lenta que a tolerância (p50) ou se o mean_lab se afastar mais que
+--tolerancia-de (delta E76) — um ganho de velocidade que muda a resposta também é pego.
+Os caches de resposta e de features ficam desligados; o handler roda no próprio processo
+(COLORIMETRIA_WORKERS=0), sem o pool, salvo --workers.
+
+Execute na raiz do projeto:
+    python -m backend.benchmarks.run --salvar                 # grava benchmarks/baselines/padrao.json
+    python -m backend.benchmarks.run                          # compara com ela
+    python -m backend.benchmarks.run --mp 0 12 --etapas handler --tolerancia 0.15
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+BACKEND = os.path.join(ROOT, "backend")
+sys.path.insert(0, BACKEND)
+
+import numpy as np
+
+BASELINE_PADRAO = os.path.join(BACKEND, "benchmarks", "baselines", "padrao.json")
+ETAPAS = (
+    "load_image", "preprocess_pipeline", "get_white_balance_correction", "segment_face_mediapipe",
+    "segment_skin_region", "segment_hair_region", "extract_region_features", "lab_to_hex", "handler",
+)
+
+
+def medir(fn, repeticoes, megapixels=None):
+    """Roda fn uma vez (aquecimento), repeticoes vezes cronometrado e uma vez sob tracemalloc."""
+    resultado = fn()
+    tempos = []
+    for _ in range(repeticoes):
+        t0 = time.perf_counter()
+        fn()
+        tempos.append((time.perf_counter() - t0) * 1000)
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        fn()
+        pico = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    tempos = np.asarray(tempos)
+    media = float(tempos.mean())
+    medida = {
+        "n": repeticoes,
+        "p50_ms": round(float(np.percentile(tempos, 50)), 3),
+        "p90_ms": round(float(np.percentile(tempos, 90)), 3),
+        "p99_ms": round(float(np.percentile(tempos, 99)), 3),
+        "media_ms": round(media, 3),
+        "por_s": round(1000.0 / media, 2) if media > 0 else None,
+        "pico_mb": round(pico / 1048576.0, 2),
+    }
+    if megapixels:
+        medida["mp_por_s"] = round(megapixels * 1000.0 / media, 2) if media > 0 else None
+    return medida, resultado
+
+
+def _mean_lab(lista):
+    return [round(float(v), 4) for v in lista[:3]] if lista else None
+
+
+def bench_etapas(fotos, mp, etapas, repeticoes):
+    """Etapas isoladas, por imagem. Retorna {chave: medida}."""
+    from processing import config
+    from processing.extract import extract_region_features_uint8
+    from processing.preprocess import get_white_balance_correction, load_image, preprocess_pipeline
+    from processing.segment import (
+        get_region_pixels_uint8, segment_face_mediapipe, segment_hair_region, segment_skin_region,
+    )
+    from benchmarks.fixtures import CASOS, rotulo_mp
+
+    resultados = {}
+
+    def registrar(etapa, nome, fn, megapixels=None):
+        """Mede fn como etapa/nome (se a etapa foi pedida). Retorna a medida ou None."""
+        if etapa not in etapas:
+            return None
+        medida, _ = medir(fn, repeticoes, megapixels)
+        resultados["%s/%s@%s" % (etapa, nome, rotulo_mp(mp))] = medida
+        return medida
+
+    for nome, papel, _ in CASOS:
+        data = fotos[nome]
+        img = load_image(data, max_side=config.MAX_LADO)
+        h, w = img.shape[:2]
+        # Como pipeline.region_features: só o LAB uint8
+        pre = preprocess_pipeline(data, max_side=config.MAX_LADO, lab_float=False)
+        megapixels = h * w / (pre["scale"] ** 2) / 1e6
+        registrar("load_image", nome, lambda: load_image(data, max_side=config.MAX_LADO), megapixels)
+        registrar("preprocess_pipeline", nome, lambda: preprocess_pipeline(data, max_side=config.MAX_LADO, lab_float=False), megapixels)
+        if papel == "papel":
+            registrar("get_white_balance_correction", nome, lambda: get_white_balance_correction(img))
+            continue
+
+        bgr, scale, hsv = pre["bgr"], pre["scale"], pre["hsv"]
+        face_mask = None
+        if papel == "skin_face":
+            face_mask = segment_face_mediapipe(bgr)
+            registrar("segment_face_mediapipe", nome, lambda: segment_face_mediapipe(bgr))
+        if papel == "hair":
+            mask = segment_hair_region(bgr, None, scale=scale)
+            registrar("segment_hair_region", nome, lambda: segment_hair_region(bgr, None, scale=scale))
+        else:
+            mask = segment_skin_region(bgr, face_mask, scale=scale, hsv=hsv)
+            registrar("segment_skin_region", nome, lambda: segment_skin_region(bgr, face_mask, scale=scale, hsv=hsv))
+
+        pixels = get_region_pixels_uint8(pre["lab_uint8"], mask)
+        medida = registrar("extract_region_features", nome,
+                           lambda: extract_region_features_uint8(pixels, cluster_engine=config.CLUSTER_ENGINE))
+        if medida is not None:
+            features = extract_region_features_uint8(pixels, cluster_engine=config.CLUSTER_ENGINE)
+            medida["mean_lab"] = _mean_lab((features or {}).get("mean_lab"))
+    return resultados
+
+
+def bench_lab_to_hex(etapas, repeticoes, n=1000):
+    """lab_to_hex escalar (n chamadas) vs lab_to_hex_batch (uma chamada com n cores)."""
+    if "lab_to_hex" not in etapas:
+        return {}
+    from processing.recommend import lab_to_hex, lab_to_hex_batch
+    rng = np.random.default_rng(0)
+    lab = np.column_stack([rng.uniform(0, 100, n), rng.uniform(-60, 60, n), rng.uniform(-60, 60, n)])
+    linhas = lab.tolist()
+    escalar, _ = medir(lambda: [lab_to_hex(*row) for row in linhas], max(1, repeticoes // 2))
+    lote, _ = medir(lambda: lab_to_hex_batch(lab), repeticoes)
+    return {"lab_to_hex/escalar_x%d" % n: escalar, "lab_to_hex/lote_x%d" % n: lote}
+
+
+def bench_handler(cliente, fotos, mp, etapas, repeticoes):
+    """POST /analisar com as quatro fotos; registra skin_mean_lab e hair_mean_lab da resposta."""
+    if "handler" not in etapas:
+        return {}
+    from benchmarks.fixtures import CASOS, rotulo_mp
+
+    def chamar():
+        files = {campo: (nome, fotos[nome]) for nome, _, campo in CASOS}
+        r = cliente.post("/analisar", files=files)
+        r.raise_for_status()
+        return r.json()
+
+    medida, resposta = medir(chamar, repeticoes)
+    perfil = resposta["perfil_cromatico"]
+    medida["mean_lab"] = _mean_lab(perfil.get("skin_mean_lab"))
+    medida["hair_mean_lab"] = _mean_lab(perfil.get("hair_mean_lab"))
+    return {"handler/analisar@%s" % rotulo_mp(mp): medida}
+
+
+def _delta_e(a, b):
+    if not a or not b:
+        return None
+    return float(np.linalg.norm(np.subtract(a, b)))
+
+
+def comparar(atual, base, tolerancia, tolerancia_de, piso_ms):
+    """Linhas (chave, p50 base, p50 atual, razão, dE, problemas) e se houve regressão."""
+    linhas = []
+    falhou = False
+    for chave, medida in sorted(atual.items()):
+        ref = base.get(chave)
+        if ref is None:
+            linhas.append((chave, None, medida["p50_ms"], None, None, "nova"))
+            continue
+        razao = medida["p50_ms"] / ref["p50_ms"] if ref["p50_ms"] else None
+        problemas = []
+        if razao is not None and razao > 1 + tolerancia and medida["p50_ms"] - ref["p50_ms"] > piso_ms:
+            problemas.append("LENTO")
+        des = [d for d in (_delta_e(medida.get(k), ref.get(k)) for k in ("mean_lab", "hair_mean_lab")) if d is not None]
+        de = max(des) if des else None
+        if de is not None and de > tolerancia_de:
+            problemas.append("COR")
+        falhou = falhou or bool(problemas)
+        linhas.append((chave, ref["p50_ms"], medida["p50_ms"], razao, de, " ".join(problemas)))
+    return linhas, falhou
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--mp", type=float, nargs="+", default=[0, 12, 24, 48], help="0 = imagens originais")
+    parser.add_argument("--etapas", nargs="+", default=list(ETAPAS), choices=ETAPAS)
+    parser.add_argument("--repeticoes", type=int, default=5)
+    parser.add_argument("--baseline", default=BASELINE_PADRAO)
+    parser.add_argument("--salvar", action="store_true", help="grava o resultado como baseline em vez de comparar")
+    parser.add_argument("--tolerancia", type=float, default=0.25, help="regressão de p50 aceita (0.25 = +25%%)")
+    parser.add_argument("--tolerancia-de", type=float, default=0.5, help="deriva máxima do mean_lab (delta E76)")
+    parser.add_argument("--piso-ms", type=float, default=1.0, help="ignora regressões menores que isso (ruído)")
+    parser.add_argument("--workers", type=int, default=0, help="COLORIMETRIA_WORKERS do handler (0 = no processo)")
+    parser.add_argument("--cache-dir", default=None, help="guarda as ampliações em disco entre execuções")
+    parser.add_argument("--saida", default=None, help="grava também o resultado desta execução neste JSON")
+    args = parser.parse_args()
+
+    # Antes de importar processing.config: sem caches (toda repetição roda o pipeline) e handler no processo
+    os.environ["COLORIMETRIA_CACHE_MB"] = "0"
+    os.environ["COLORIMETRIA_FEATURES_CACHE_MB"] = "0"
+    os.environ.pop("COLORIMETRIA_CACHE_SQLITE", None)
+    os.environ["COLORIMETRIA_WORKERS"] = str(args.workers)
+    os.chdir(BACKEND)
+
+    import cv2
+    from benchmarks.fixtures import carregar
+    from processing import config
+
+    resultados = bench_lab_to_hex(args.etapas, args.repeticoes)
+    cliente = None
+    if "handler" in args.etapas:
+        from fastapi.testclient import TestClient
+        import main as app_main
+        cliente = TestClient(app_main.app)
+        cliente.__enter__()
+    try:
+        for mp in args.mp:
+            t0 = time.perf_counter()
+            fotos = carregar(mp, args.cache_dir)
+            print("fixtures %s: %.1fs" % ("orig" if not mp else "%g MP" % mp, time.perf_counter() - t0), flush=True)
+            resultados.update(bench_etapas(fotos, mp, args.etapas, args.repeticoes))
+            if cliente is not None:
+                resultados.update(bench_handler(cliente, fotos, mp, args.etapas, args.repeticoes))
+    finally:
+        if cliente is not None:
+            cliente.__exit__(None, None, None)
+
+    execucao = {
+        "meta": {
+            "data": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "opencv": cv2.__version__,
+            "maquina": platform.machine(),
+            "cpus": os.cpu_count(),
+            "max_lado": config.MAX_LADO,
+            "cluster": config.CLUSTER_ENGINE,
+            "repeticoes": args.repeticoes,
+        },
+        "resultados": resultados,
+    }
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as f:
+            json.dump(execucao, f, indent=1, ensure_ascii=False)
+
+    print("%-52s %10s %10s %10s %8s %9s" % ("entrada", "p50 (ms)", "p90 (ms)", "por s", "pico MB", "MP/s"))
+    for chave, m in sorted(resultados.items()):
+        print("%-52s %10.2f %10.2f %10.2f %8.1f %9s" % (
+            chave, m["p50_ms"], m["p90_ms"], m["por_s"] or 0, m["pico_mb"],
+            "%.1f" % m["mp_por_s"] if m.get("mp_por_s") else "-"))
+
+    if args.salvar:
+        os.makedirs(os.path.dirname(os.path.abspath(args.baseline)), exist_ok=True)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(execucao, f, indent=1, ensure_ascii=False)
+        print("Baseline gravada em %s" % args.baseline)
+        return 0
+    if not os.path.isfile(args.baseline):
+        print("Sem baseline em %s (rode com --salvar)." % args.baseline)
+        return 0
+
+    with open(args.baseline, encoding="utf-8") as f:
+        base = json.load(f)
+    linhas, falhou = comparar(resultados, base.get("resultados", {}), args.tolerancia, args.tolerancia_de, args.piso_ms)
+    print("\nComparação com %s (%s)" % (args.baseline, base.get("meta", {}).get("data", "?")))
+    print("%-52s %10s %10s %7s %7s  %s" % ("entrada", "base p50", "p50", "razão", "dE76", ""))
+    for chave, p50_base, p50, razao, de, problemas in linhas:
+        print("%-52s %10s %10.2f %7s %7s  %s" % (
+            chave, "%.2f" % p50_base if p50_base is not None else "-", p50,
+            "%.2fx" % razao if razao is not None else "-", "%.2f" % de if de is not None else "-", problemas))
+    print("FALHOU" if falhou else "OK")
+    return 1 if falhou else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
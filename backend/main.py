@@ -8,57 +8,216 @@ Fluxo de calibração (para que qualquer imagem seja lida corretamente):
    São correções numéricas fixas que ajustam o "peso" das leituras do pipeline ao espaço de cor da referência.
    Uma vez calibrado, a MESMA correção é aplicada a qualquer imagem (rosto, braço, cabelo) por região.
 Assim, qualquer foto, após normalização da luz e aplicação dos offsets, é lida no mesmo padrão da referência.
+Os offsets ficam em perfis versionados em memória (processing/calibracao.py): "padrao" (calib.json) e um por
+arquivo em COLORIMETRIA_CALIB_DIR, escolhidos pelo campo "perfil". Trocam a quente (vigia de arquivos ou
+POST /calibracao/recarregar) sem afetar as análises em andamento; metadados.calibracao traz perfil e versão.
+
+Execução: o pipeline (decodificação → segmentação → extração → classificação) é CPU puro e roda
+num pool de processos (COLORIMETRIA_WORKERS), fora do event loop. A fila é limitada
+(COLORIMETRIA_MAX_FILA): quando cheia, /analisar responde 503 com Retry-After.
+/analisar/lote recebe muitas pessoas num ZIP ou NDJSON e devolve um NDJSON em streaming, uma linha
+por pessoa, ocupando no máximo COLORIMETRIA_LOTE_CONCORRENCIA vagas do pool.
+/analisar/features recebe, no lugar das fotos, um resumo compacto de cada região (histograma LAB 32³ com as
+células ocupadas, alguns KB) montado no aparelho, e devolve a mesma resposta do /analisar.
+/analisar/jobs recebe as mesmas fotos do /analisar e responde na hora (202) com o id de um job; o cliente
+consulta GET /analisar/jobs/{id} (ou recebe o resultado em callback_url) em vez de segurar a conexão.
+/combinar procura no catálogo de produtos (COLORIMETRIA_CATALOGO, índice em memória) os SKUs mais próximos
+das cores de uma paleta ou perfil.
 """
-import io
+import asyncio
+import hmac
 import json
+import math
+import multiprocessing
 import os
+import shutil
+import sys
+import tempfile
+import time
 import traceback
-from fastapi import FastAPI, File, UploadFile, HTTPException
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+from fastapi import Body, FastAPI, File, Form, Header, UploadFile, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
 from typing import List, Optional
 
-# Calibração = offsets LAB por região (skin_face, skin_arm, hair). Aplicados a TODAS as imagens.
-_CALIB = None
-def _load_calib():
-    global _CALIB
-    if _CALIB is not None:
-        return _CALIB
-    path = os.path.join(os.path.dirname(__file__), "processing", "calib.json")
-    if os.path.isfile(path):
-        with open(path, "r", encoding="utf-8") as f:
-            _CALIB = json.load(f)
-    else:
-        _CALIB = {}
-    return _CALIB
-
-def _apply_calib(lab_list, region_key=None):
-    """Aplica o offset de calibração (peso das leituras) ao mean_lab. Mesma correção para qualquer imagem."""
-    if not lab_list or len(lab_list) < 3:
-        return lab_list
-    calib = _load_calib()
-    if not calib:
-        return lab_list
-    by_region = calib.get("by_region") or {}
-    if region_key and region_key in by_region:
-        off = by_region[region_key]
-        L = float(lab_list[0]) + off[0]
-        a = float(lab_list[1]) + off[1]
-        b = float(lab_list[2]) + off[2]
-    else:
-        L = float(lab_list[0]) + calib.get("offset_L", 0)
-        a = float(lab_list[1]) + calib.get("offset_a", 0)
-        b = float(lab_list[2]) + calib.get("offset_b", 0)
-    return [L, a, b]
-
-from processing.preprocess import preprocess_pipeline, get_white_balance_correction, load_image
-from processing.segment import segment_face_mediapipe, segment_skin_region, segment_hair_region, get_region_pixels
-from processing.extract import extract_region_features
-from processing.classify import infer_subtom, infer_valor, infer_croma, infer_contrast, classify_season
-from processing.recommend import generate_palettes, generate_recommendations_text, lab_to_hex
+from processing import calibracao, catalog_index, colorspace, config, jobs, metrics, resumo, skin_lut
+from processing.recommend import generate_palettes
+from processing.cache import ResultCache, hash_bytes, hash_json
+from processing.lote import LoteInvalido, ler_lote
+from processing.upload import LimiteCorpo, UploadRecusado, ler_foto
+from processing.pipeline import (
+    VERSAO_PIPELINE, analisar, aquecer, init_worker, white_balance_from_paper, ImagemInvalida,
+)
 
 app = FastAPI(title="Colorimetria Pessoal", version="1.0.0")
 app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"])
+# Teto do corpo da requisição (413 antes de receber/parsear o multipart); o do lote vem antes por ser mais específico
+app.add_middleware(LimiteCorpo, limites=[
+    ("/analisar/lote", int(config.MAX_LOTE_MB * 1048576)),
+    ("/analisar/features", int(config.MAX_FEATURES_MB * 1048576)),
+    ("/analisar", int(config.MAX_REQUISICAO_MB * 1048576)),
+])
+_MAX_FOTO_BYTES = int(config.MAX_FOTO_MB * 1048576)
+
+# Perfis de calibração (offsets LAB por região), todos em memória; carregados no arranque
+_PERFIS = calibracao.Perfis(config.CALIB_DIR, config.CALIB_PERFIL)
+_VIGIA_CALIB = None
+
+# Métricas do processo do servidor (GET /metricas): etapas devolvidas pelos workers + requisições por rota
+_METRICAS = metrics.Registro()
+if config.METRICAS:
+    app.add_middleware(metrics.MedirRequisicoes, registro=_METRICAS)
+
+# Pool de processos (criado sob demanda) e contagem de análises em andamento + aguardando.
+# O contador só é tocado no event loop, então não precisa de lock.
+_POOL = None
+_EM_ANDAMENTO = 0
+
+# Cache de respostas: reenvio das mesmas fotos (erro de rede, reabrir resultado) não recalcula nada.
+_CACHE = ResultCache(
+    int(config.CACHE_MAX_MB * 1024 * 1024),
+    sqlite_path=config.CACHE_SQLITE,
+    sqlite_max_items=config.CACHE_SQLITE_MAX_ITENS,
+)
+
+
+def _chave_analise(fotos, perfil):
+    """Chave do cache: bytes de cada foto (na ordem dos campos) + conteúdo do perfil + versão/opções do pipeline."""
+    opcoes = [VERSAO_PIPELINE, config.MAX_LADO, config.CLUSTER_ENGINE, skin_lut.assinatura_padrao(), perfil.hash]
+    return hash_bytes(*[str(o) for o in opcoes], *fotos)
+
+
+def _get_pool():
+    """Pool de processos do pipeline; None quando COLORIMETRIA_WORKERS=0 (usa threads do loop)."""
+    global _POOL
+    if _POOL is None and config.WORKERS > 0:
+        # spawn: não herda threads do servidor (fork + MediaPipe/BLAS pode travar) e funciona igual no Windows
+        _POOL = ProcessPoolExecutor(
+            max_workers=config.WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=init_worker,
+        )
+    return _POOL
+
+
+async def _executar(fn, *args, **kwargs):
+    """
+    Roda fn no pool sem bloquear o event loop. Se a fila estiver cheia, responde 503 com Retry-After.
+    Retorna (resultado, tempo_total_ms).
+    """
+    global _EM_ANDAMENTO
+    if _EM_ANDAMENTO >= config.MAX_FILA:
+        raise HTTPException(
+            status_code=503,
+            detail="Servidor ocupado. Tente novamente em alguns segundos.",
+            headers={"Retry-After": str(config.RETRY_AFTER_S)},
+        )
+    return await _rodar(fn, *args, **kwargs)
+
+
+async def _rodar(fn, *args, **kwargs):
+    """Como _executar, mas sem checar a fila (o lote limita a própria concorrência e espera)."""
+    global _EM_ANDAMENTO, _POOL
+    _EM_ANDAMENTO += 1
+    t0 = time.perf_counter()
+    try:
+        loop = asyncio.get_running_loop()
+        resultado = await loop.run_in_executor(_get_pool(), partial(fn, *args, **kwargs))
+    except BrokenProcessPool:
+        # Um worker morreu (ex.: sem memória): descarta o pool para a próxima tarefa criar outro
+        if _POOL is not None:
+            _POOL.shutdown(wait=False, cancel_futures=True)
+            _POOL = None
+        raise
+    finally:
+        _EM_ANDAMENTO -= 1
+    return resultado, round((time.perf_counter() - t0) * 1000, 2)
+
+
+# Estado do aquecimento, para GET /prontidao. O processo do servidor não importa OpenCV/sklearn/MediaPipe
+# (ficam nos workers); COLORIMETRIA_AQUECER=1 sobe os workers e aquece cada um na inicialização.
+_PRONTIDAO = {"inicio": time.time(), "calibracao": False, "aquecimentos_pendentes": 0, "aquecidos": {}, "pronto_em": None}
+
+
+def _aquecimento_concluido(estado):
+    _PRONTIDAO["aquecidos"][estado["pid"]] = estado
+    _PRONTIDAO["aquecimentos_pendentes"] -= 1
+    if _PRONTIDAO["aquecimentos_pendentes"] == 0:
+        _PRONTIDAO["pronto_em"] = time.time()
+
+
+def _ao_aquecer(loop, futuro):
+    """Callback do aquecimento de um worker (roda numa thread do pool): repassa o estado ao event loop."""
+    try:
+        estado = futuro.result()
+    except Exception as e:
+        estado = {"pid": None, "erro": str(e)}
+    loop.call_soon_threadsafe(_aquecimento_concluido, estado)
+
+
+def _perfil(nome):
+    """Perfil de calibração pedido pela requisição (None/vazio = padrão); 400 se não existir."""
+    try:
+        return _PERFIS.obter(nome)
+    except calibracao.PerfilDesconhecido:
+        raise HTTPException(status_code=400, detail="Perfil de calibração desconhecido: %s." % nome)
+
+
+async def _vigiar_calibracao():
+    """Relê os arquivos de calibração alterados a cada CALIB_RECARREGAR_S segundos (stat de cada arquivo)."""
+    while True:
+        await asyncio.sleep(config.CALIB_RECARREGAR_S)
+        try:
+            await asyncio.to_thread(_PERFIS.recarregar)
+        except Exception:
+            traceback.print_exc()
+
+
+@app.on_event("startup")
+def _iniciar():
+    global _VIGIA_CALIB, _JOBS_VAGAS
+    _JOBS_VAGAS = asyncio.Semaphore(config.JOBS_CONCORRENCIA)
+    _carregar_catalogo()
+    _PERFIS.recarregar()
+    _PRONTIDAO["calibracao"] = True
+    if config.CALIB_RECARREGAR_S > 0:
+        _VIGIA_CALIB = asyncio.get_event_loop().create_task(_vigiar_calibracao())
+    pool = _get_pool()
+    if not config.AQUECER:
+        _PRONTIDAO["pronto_em"] = time.time()
+        return
+    if pool is not None:
+        # Uma tarefa por worker força o spawn agora; cada worker aquece no init_worker.
+        _PRONTIDAO["aquecimentos_pendentes"] = config.WORKERS
+        loop = asyncio.get_event_loop()
+        for _ in range(config.WORKERS):
+            pool.submit(aquecer).add_done_callback(partial(_ao_aquecer, loop))
+    else:
+        _PRONTIDAO["aquecimentos_pendentes"] = 1
+        _aquecimento_concluido(aquecer())
+
+
+@app.on_event("shutdown")
+def _encerrar():
+    global _POOL, _VIGIA_CALIB
+    if _VIGIA_CALIB is not None:
+        _VIGIA_CALIB.cancel()
+        _VIGIA_CALIB = None
+    for tarefa in list(_JOBS_TAREFAS):
+        tarefa.cancel()
+    if _POOL is not None:
+        _POOL.shutdown(wait=True, cancel_futures=True)
+        _POOL = None
+    # Só há FaceMesh neste processo se o pipeline rodou aqui (COLORIMETRIA_WORKERS=0)
+    segment = sys.modules.get("processing.segment")
+    if segment is not None:
+        segment.close_face_meshes()
 
 
 @app.get("/")
@@ -66,6 +225,94 @@ def root():
     return {"service": "colorimetria-pessoal", "status": "ok"}
 
 
+@app.get("/prontidao")
+def prontidao():
+    """
+    Prontidão para tráfego (startup/readiness probe): 200 quando a calibração está carregada e, com
+    COLORIMETRIA_AQUECER=1, todos os workers já aqueceram; 503 enquanto isso. Traz o estado de cada worker.
+    """
+    pronto = _PRONTIDAO["calibracao"] and _PRONTIDAO["aquecimentos_pendentes"] <= 0
+    corpo = {
+        "pronto": pronto,
+        "aquecimento": config.AQUECER,
+        "calibracao": _PRONTIDAO["calibracao"],
+        "workers": config.WORKERS,
+        "workers_aquecidos": len([pid for pid in _PRONTIDAO["aquecidos"] if pid is not None]),
+        "aquecimento_por_worker": list(_PRONTIDAO["aquecidos"].values()),
+        "segundos_ate_pronto": (
+            round(_PRONTIDAO["pronto_em"] - _PRONTIDAO["inicio"], 2) if _PRONTIDAO["pronto_em"] else None
+        ),
+    }
+    if not pronto:
+        return JSONResponse(status_code=503, content=corpo, headers={"Retry-After": "1"})
+    return corpo
+
+
+@app.get("/metricas", response_class=PlainTextResponse)
+def metricas():
+    """Métricas no formato de texto do Prometheus: histogramas por etapa/papel, megapixels, pixels por região,
+    requisições por rota, fila e cache."""
+    cache = _CACHE.stats()
+    medidores = {
+        "colorimetria_fila_em_andamento": ("Análises em andamento + aguardando no pool.", _EM_ANDAMENTO),
+        "colorimetria_fila_maxima": ("Teto da fila (acima disso, 503).", config.MAX_FILA),
+        "colorimetria_cache_acertos": ("Acertos do cache de respostas desde o início.", cache["acertos"]),
+        "colorimetria_cache_erros": ("Erros do cache de respostas desde o início.", cache["erros"]),
+        "colorimetria_cache_bytes_memoria": ("Bytes ocupados pelo cache de respostas em memória.", cache["bytes_memoria"]),
+        "colorimetria_calibracao_perfis": ("Perfis de calibração carregados.", len(_PERFIS)),
+        "colorimetria_calibracao_trocas": ("Trocas de perfil de calibração desde o início.", _PERFIS.trocas),
+        "colorimetria_jobs_pendentes": ("Jobs assíncronos na fila ou processando.", _JOBS.pendentes()),
+        "colorimetria_jobs_guardados": ("Jobs assíncronos guardados em memória.", len(_JOBS)),
+        "colorimetria_catalogo_skus": ("SKUs no índice do catálogo (/combinar).", len(_CATALOGO)),
+    }
+    return PlainTextResponse(_METRICAS.exportar(medidores), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/cache/estatisticas")
+def cache_estatisticas():
+    """Acertos/erros e ocupação do cache de respostas do /analisar."""
+    return _CACHE.stats()
+
+
+async def _analisar_fotos(data_rosto, data_papel, data_braco, data_cabelo, data_braco_ext, perfil,
+                         lote=False, papel_do_lote=False, wb_correction=None):
+    """
+    Resposta do /analisar para um conjunto de fotos: do cache, se as mesmas fotos + calibração já foram
+    analisadas, senão pelo pipeline no pool. lote=True espera vaga no pool em vez de responder 503.
+    perfil: calibracao.Perfil lido no início da requisição (uma troca no meio não a afeta).
+    papel_do_lote=True: data_papel é a folha do lote inteiro, cuja correção (wb_correction) já foi calculada.
+    """
+    chave = None
+    if _CACHE.enabled:
+        t0 = time.perf_counter()
+        chave = _chave_analise((data_rosto, data_papel, data_braco, data_cabelo, data_braco_ext), perfil)
+        resposta = _CACHE.get(chave)
+        if resposta is not None:
+            resposta["metadados"]["cache"] = True
+            resposta["metadados"]["calibracao"] = perfil.resumo()
+            resposta["metadados"].pop("memoria_pico_mb", None)
+            resposta["metadados"]["tempos_ms"] = {"total": round((time.perf_counter() - t0) * 1000, 2)}
+            return resposta
+
+    executar = _rodar if lote else _executar
+    papel = None if papel_do_lote else data_papel
+    resposta, total_ms = await executar(
+        analisar, data_rosto, data_braco, data_cabelo, data_papel=papel, calib=perfil.dados, wb_correction=wb_correction
+    )
+    resposta["metadados"]["calibracao"] = perfil.resumo()
+    tempos = resposta["metadados"].setdefault("tempos_ms", {})
+    duracao = resposta["metadados"].pop("duracao_ms", None)
+    tempos["fila"] = round(max(0.0, total_ms - (sum(tempos.values()) if duracao is None else duracao)), 2)
+    tempos["total"] = total_ms
+    rastreio = resposta["metadados"].pop("metricas", None)
+    _METRICAS.agregar(rastreio)
+    if chave is not None:
+        _CACHE.set(chave, resposta)
+    if rastreio and config.METRICAS_NA_RESPOSTA:
+        resposta["metadados"]["metricas"] = rastreio
+    return resposta
+
+
 @app.post("/analisar")
 async def analisar_cores(
     rosto: UploadFile = File(...),
@@ -73,128 +320,523 @@ async def analisar_cores(
     braco_interno: UploadFile = File(...),
     cabelo: UploadFile = File(...),
     braco_externo: Optional[UploadFile] = File(None),
+    perfil: Optional[str] = Form(None),
 ):
     """
     Analisa as fotos e retorna perfil cromático, paletas e recomendações.
     Fotos obrigatórias: rosto, braco_interno, cabelo. rosto_com_papel (para calibrar branco) e braco_externo opcionais.
     Se rosto_com_papel for enviado, a correção de branco extraída dela é aplicada a todas as fotos.
+    perfil: nome do perfil de calibração (padrão: COLORIMETRIA_CALIB_PERFIL); metadados.calibracao traz perfil e versão.
+    metadados.tempos_ms traz o tempo de cada etapa, da fila ("fila") e o total.
+    """
+    perfil_calib = _perfil(perfil)
+    try:
+        # 1) Carregar bytes (recusa pelo cabeçalho/tamanho antes de ler cada foto inteira)
+        data_rosto = await ler_foto(rosto, "rosto", _MAX_FOTO_BYTES)
+        data_braco = await ler_foto(braco_interno, "braco_interno", _MAX_FOTO_BYTES)
+        data_cabelo = await ler_foto(cabelo, "cabelo", _MAX_FOTO_BYTES)
+        data_braco_ext = await ler_foto(braco_externo, "braco_externo", _MAX_FOTO_BYTES) if braco_externo else None
+        data_papel = await ler_foto(rosto_com_papel, "rosto_com_papel", _MAX_FOTO_BYTES) if rosto_com_papel else None
+
+        # 2) Cache de respostas ou pipeline completo no pool de processos
+        return await _analisar_fotos(data_rosto, data_papel, data_braco, data_cabelo, data_braco_ext, perfil_calib)
+    except UploadRecusado as e:
+        raise HTTPException(status_code=e.status, detail=str(e))
+    except ImagemInvalida as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except HTTPException:
+        raise
+    except Exception as e:
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=f"Erro no processamento: {str(e)}")
+
+
+class RegiaoResumo(BaseModel):
+    bins: int = resumo.BINS
+    indices: List[int]
+    contagens: List[int]
+
+
+class PedidoFeatures(BaseModel):
+    rosto: RegiaoResumo
+    braco_interno: RegiaoResumo
+    cabelo: RegiaoResumo
+    wb_correction: Optional[List[float]] = None
+    wb_aplicado: bool = True
+    perfil: Optional[str] = None
+
+
+@app.post("/analisar/features")
+async def analisar_features(pedido: PedidoFeatures):
+    """
+    Como /analisar, a partir do resumo de cada região feito no aparelho (processing/resumo.py) em vez das fotos:
+    {"rosto": {"bins": 32, "indices": [...], "contagens": [...]}, "braco_interno": {...}, "cabelo": {...},
+     "wb_correction": [delta_a, delta_b] | null, "wb_aplicado": true, "perfil": null}
+    wb_aplicado=false: os histogramas vieram sem a correção de branco e o servidor aplica wb_correction.
+    metadados.entrada = "resumo"; metadados.n_pixels traz os pixels de cada região depois do descarte.
     """
+    perfil_calib = _perfil(pedido.perfil)
+    corpo = pedido.model_dump(exclude={"perfil"})
+    wb = corpo["wb_correction"]
+    # O JSON aceita NaN/Infinity: sem esta conferência, chegariam ao _niveis (500 ou cores absurdas)
+    if wb is not None and (len(wb) != 2 or not all(math.isfinite(v) and abs(v) <= resumo.WB_MAX for v in wb)):
+        raise HTTPException(
+            status_code=400, detail="wb_correction deve ser [delta_a, delta_b] finitos, até ±%g." % resumo.WB_MAX,
+        )
     try:
-        # 1) Carregar bytes
-        data_rosto = await rosto.read()
-        data_braco = await braco_interno.read()
-        data_cabelo = await cabelo.read()
-        data_braco_ext = await braco_externo.read() if braco_externo else None
-
-        # 1a) Calibração da luz: correção de branco a partir da foto com folha (aplicada a todas as fotos)
-        wb_correction = None
-        if rosto_com_papel:
-            data_papel = await rosto_com_papel.read()
-            img_papel = load_image(io.BytesIO(data_papel))
-            if img_papel is not None:
-                da, db = get_white_balance_correction(img_papel)
-                if abs(da) > 0.5 or abs(db) > 0.5:
-                    wb_correction = (da, db)
-
-        pre_rosto = preprocess_pipeline(io.BytesIO(data_rosto), wb_correction=wb_correction)
-        pre_braco = preprocess_pipeline(io.BytesIO(data_braco), wb_correction=wb_correction)
-        pre_cabelo = preprocess_pipeline(io.BytesIO(data_cabelo), wb_correction=wb_correction)
-        if not pre_rosto or not pre_braco or not pre_cabelo:
-            raise HTTPException(status_code=400, detail="Não foi possível processar uma ou mais imagens.")
-
-        # 2) Segmentação
-        face_mask_rosto = segment_face_mediapipe(pre_rosto["bgr"])
-        skin_mask_rosto = segment_skin_region(pre_rosto["bgr"], face_mask_rosto)
-        hair_mask_cabelo = segment_hair_region(pre_cabelo["bgr"], None)
-
-        skin_pixels_rosto = get_region_pixels(pre_rosto["lab"], skin_mask_rosto)
-        skin_pixels_braco = get_region_pixels(pre_braco["lab"], segment_skin_region(pre_braco["bgr"], None))
-        hair_pixels = get_region_pixels(pre_cabelo["lab"], hair_mask_cabelo)
-
-        # 3) Extração
-        feat_skin_rosto = extract_region_features(skin_pixels_rosto)
-        feat_skin_braco = extract_region_features(skin_pixels_braco)
-        feat_hair = extract_region_features(hair_pixels)
-
-        if not feat_skin_rosto:
-            feat_skin_rosto = {"mean_lab": [50, 5, 15], "chroma_mean": 15}
-        if not feat_skin_braco:
-            feat_skin_braco = {"mean_lab": [52, 5, 14], "chroma_mean": 14}
-        if not feat_hair:
-            feat_hair = {"mean_lab": [35, 2, 5], "chroma_mean": 5}
-
-        # 3a) Aplicar pesos da calibração (offsets LAB por região) — mesma correção para qualquer imagem
-        if feat_skin_rosto and feat_skin_rosto.get("mean_lab"):
-            feat_skin_rosto["mean_lab"] = _apply_calib(feat_skin_rosto["mean_lab"], "skin_face")
-        if feat_skin_braco and feat_skin_braco.get("mean_lab"):
-            feat_skin_braco["mean_lab"] = _apply_calib(feat_skin_braco["mean_lab"], "skin_arm")
-        if feat_hair and feat_hair.get("mean_lab"):
-            feat_hair["mean_lab"] = _apply_calib(feat_hair["mean_lab"], "hair")
-
-        skin_mean = feat_skin_rosto.get("mean_lab") or feat_skin_braco.get("mean_lab")
-        braco_mean = feat_skin_braco.get("mean_lab")
-        hair_mean = feat_hair.get("mean_lab")
-
-        # 4) Variáveis fundamentais
-        subtom = infer_subtom(skin_mean, braco_mean)
-        valor = infer_valor(skin_mean[0] if skin_mean else 55)
-        croma = infer_croma(feat_skin_rosto.get("chroma_mean"))
-        contraste = infer_contrast(skin_mean, hair_mean)
-        season = classify_season(subtom, valor, croma, contraste)
-
-        # 5) Paletas e textos
-        paletas = generate_palettes(subtom, valor, croma, contraste, season)
-        recomendacoes = generate_recommendations_text(subtom, valor, croma, contraste, season)
-
-        # 6) Cores por parte do corpo (para sugestões personalizadas por região)
-        def lab_to_hex_safe(lab_list):
-            if not lab_list or len(lab_list) < 3:
-                return "#888888"
-            return lab_to_hex(float(lab_list[0]), float(lab_list[1]), float(lab_list[2]))
-
-        cores_por_parte = {
-            "rosto": {
-                "hex": lab_to_hex_safe(feat_skin_rosto.get("mean_lab")),
-                "dica": "Maquiagem, golas e acessórios perto do rosto: prefira tons que harmonizem com essa pele.",
-            },
-            "braco_interno": {
-                "hex": lab_to_hex_safe(feat_skin_braco.get("mean_lab")),
-                "dica": "Subtom da pele do braço ajuda a definir quente/frio; use essa referência em roupas de mangas e pulseiras.",
-            },
-            "cabelo": {
-                "hex": lab_to_hex_safe(feat_hair.get("mean_lab")),
-                "dica": "Tingimentos, chapéus e lenços: cores que conversem com seu cabelo natural valorizam o conjunto.",
-            },
-        }
-
-        recomendacoes_por_parte = {
-            "rosto": "Para realçar o rosto: bases e blushes no seu subtom; evite cores que criem máscara.",
-            "braco_interno": "Pulseiras e mangas: tons neutros ou da sua paleta harmonizam com a pele exposta.",
-            "cabelo": "Cabelo define seu contraste; use a paleta sugerida para roupas e acessórios que equilibrem com a cabeça.",
-        }
-
-        # 7) Resposta estruturada
-        return {
-            "perfil_cromatico": {
-                "subtom": subtom,
-                "valor": valor,
-                "croma": croma,
-                "contraste": contraste,
-                "estacao": season,
-                "skin_mean_lab": skin_mean,
-                "hair_mean_lab": hair_mean,
-            },
-            "paletas": paletas,
-            "recomendacoes_texto": recomendacoes,
-            "cores_por_parte": cores_por_parte,
-            "recomendacoes_por_parte": recomendacoes_por_parte,
-            "metadados": {
-                "versao": "1.0",
-                "modelo": "regras",
-            },
-        }
+        for campo, _ in resumo.REGIOES:
+            resumo.conferir(corpo[campo])
+    except resumo.ResumoInvalido as e:
+        raise HTTPException(status_code=400, detail="%s" % e)
+
+    chave = None
+    if _CACHE.enabled:
+        t0 = time.perf_counter()
+        chave = hash_bytes("features", VERSAO_PIPELINE, perfil_calib.hash, hash_json(corpo))
+        resposta = _CACHE.get(chave)
+        if resposta is not None:
+            resposta["metadados"]["cache"] = True
+            resposta["metadados"]["calibracao"] = perfil_calib.resumo()
+            resposta["metadados"]["tempos_ms"] = {"total": round((time.perf_counter() - t0) * 1000, 2)}
+            return resposta
+    try:
+        resposta, total_ms = await _executar(resumo.analisar_resumo, corpo, calib=perfil_calib.dados)
     except HTTPException:
         raise
     except Exception as e:
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"Erro no processamento: {str(e)}")
+    resposta["metadados"]["calibracao"] = perfil_calib.resumo()
+    tempos = resposta["metadados"].setdefault("tempos_ms", {})
+    tempos["fila"] = round(max(0.0, total_ms - sum(tempos.values())), 2)
+    tempos["total"] = total_ms
+    if chave is not None:
+        _CACHE.set(chave, resposta)
+    return resposta
+
+
+# Progresso dos lotes (GET /analisar/lote/{id}); guarda só os mais recentes.
+_LOTES = OrderedDict()
+_LOTES_GUARDADOS = 100
+
+
+def _novo_lote(total):
+    lote_id = uuid.uuid4().hex
+    _LOTES[lote_id] = {
+        "id": lote_id, "total": total, "concluidos": 0, "erros": 0, "do_cache": 0,
+        "status": "processando", "inicio": time.time(), "fim": None,
+    }
+    while len(_LOTES) > _LOTES_GUARDADOS:
+        _LOTES.popitem(last=False)
+    return _LOTES[lote_id]
+
+
+async def _analisar_pessoa(indice, pid, carregar, papel_lote, wb_lote, perfil):
+    """Uma linha do NDJSON do lote. Erros ficam na linha da pessoa; o resto do lote segue."""
+    linha = {"indice": indice, "id": pid}
+    try:
+        # Descompactação/base64 das fotos fora do event loop
+        fotos = await asyncio.to_thread(carregar)
+        proprio = fotos.get("rosto_com_papel")
+        resposta = await _analisar_fotos(
+            fotos["rosto"], proprio or papel_lote, fotos["braco_interno"], fotos["cabelo"],
+            fotos.get("braco_externo"), perfil,
+            lote=True, papel_do_lote=not proprio and papel_lote is not None, wb_correction=wb_lote,
+        )
+        linha.update(ok=True, resultado=resposta)
+    except UploadRecusado as e:
+        linha.update(ok=False, status=e.status, erro=str(e))
+    except (ValueError, ImagemInvalida) as e:
+        linha.update(ok=False, status=400, erro=str(e))
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        traceback.print_exc()
+        linha.update(ok=False, status=500, erro=f"Erro no processamento: {str(e)}")
+    return linha
+
+
+async def _gerar_lote(estado, arquivo, pessoas, papel_lote, perfil):
+    """
+    Roda as pessoas com no máximo LOTE_CONCORRENCIA no pool e emite uma linha por pessoa ao terminar.
+    arquivo: cópia temporária do upload, de onde as fotos são lidas; fechada ao fim do lote.
+    """
+    pendentes = set()
+    try:
+        wb_lote = None
+        if papel_lote is not None:
+            wb_lote, _ = await _rodar(white_balance_from_paper, papel_lote)
+        fila = iter(enumerate(pessoas))
+        esgotou = False
+        while True:
+            while not esgotou and len(pendentes) < config.LOTE_CONCORRENCIA:
+                item = next(fila, None)
+                if item is None:
+                    esgotou = True
+                    break
+                indice, (pid, carregar) = item
+                pendentes.add(asyncio.ensure_future(
+                    _analisar_pessoa(indice, pid, carregar, papel_lote, wb_lote, perfil)
+                ))
+            if not pendentes:
+                break
+            prontas, pendentes = await asyncio.wait(pendentes, return_when=asyncio.FIRST_COMPLETED)
+            for tarefa in prontas:
+                linha = tarefa.result()
+                estado["concluidos"] += 1
+                if not linha["ok"]:
+                    estado["erros"] += 1
+                elif linha["resultado"]["metadados"].get("cache"):
+                    estado["do_cache"] += 1
+                linha["progresso"] = {"concluidos": estado["concluidos"], "total": estado["total"]}
+                yield json.dumps(linha, ensure_ascii=False) + "\n"
+        estado["status"] = "concluido"
+    except Exception as e:
+        traceback.print_exc()
+        estado["status"] = "erro"
+        yield json.dumps({"lote": estado["id"], "ok": False, "erro": str(e)}, ensure_ascii=False) + "\n"
+    finally:
+        # Cliente desconectou: não deixa pessoas pendentes ocupando o pool
+        for tarefa in pendentes:
+            tarefa.cancel()
+        if estado["status"] == "processando":
+            estado["status"] = "cancelado"
+        estado["fim"] = time.time()
+        arquivo.close()
+    yield json.dumps({"lote": estado["id"], "resumo": _resumo_lote(estado)}, ensure_ascii=False) + "\n"
+
+
+def _resumo_lote(estado):
+    fim = estado["fim"] or time.time()
+    return {**estado, "duracao_s": round(fim - estado["inicio"], 2)}
+
+
+def _copiar_lote(origem, copia):
+    shutil.copyfileobj(origem, copia)
+    return ler_lote(copia, _MAX_FOTO_BYTES)
+
+
+@app.post("/analisar/lote")
+async def analisar_lote(
+    arquivo: UploadFile = File(...),
+    rosto_com_papel: Optional[UploadFile] = File(None),
+    perfil: Optional[str] = Form(None),
+):
+    """
+    Analisa várias pessoas de uma vez. arquivo: ZIP com uma pasta por pessoa (rosto, braco_interno, cabelo
+    e opcionais rosto_com_papel, braco_externo, com qualquer extensão) ou NDJSON com uma pessoa por linha
+    ({"id", "rosto", "braco_interno", "cabelo", ...} em base64); ver processing/lote.py.
+    A folha branca do lote (rosto_com_papel aqui ou papel.jpg na raiz do ZIP) vale para quem não mandou a sua;
+    o perfil de calibração (campo perfil) é lido uma vez e vale para o lote inteiro, mesmo se trocado no meio.
+    Resposta: NDJSON em streaming, uma linha por pessoa na ordem em que terminam
+    ({"indice", "id", "ok", "resultado" | "status" + "erro", "progresso"}) e uma linha final com o resumo.
+    O cabeçalho X-Lote-Id permite acompanhar o progresso em GET /analisar/lote/{id}.
+    """
+    perfil_calib = _perfil(perfil)
+    # O upload é fechado quando o handler retorna; o streaming lê as fotos de uma cópia própria em disco
+    # Cópia (até o teto do corpo) e leitura do índice do lote numa thread: não seguram o event loop
+    copia = tempfile.TemporaryFile()
+    try:
+        papel_zip, pessoas = await asyncio.to_thread(_copiar_lote, arquivo.file, copia)
+    except LoteInvalido as e:
+        copia.close()
+        raise HTTPException(status_code=400, detail=str(e))
+    try:
+        papel_lote = await ler_foto(rosto_com_papel, "rosto_com_papel", _MAX_FOTO_BYTES) if rosto_com_papel else papel_zip
+    except UploadRecusado as e:
+        copia.close()
+        raise HTTPException(status_code=e.status, detail=str(e))
+    estado = _novo_lote(len(pessoas))
+    return StreamingResponse(
+        _gerar_lote(estado, copia, pessoas, papel_lote, perfil_calib),
+        media_type="application/x-ndjson",
+        headers={"X-Lote-Id": estado["id"]},
+    )
+
+
+@app.get("/analisar/lote/{lote_id}")
+def progresso_lote(lote_id: str):
+    """Progresso de um lote (total, concluídos, erros, status)."""
+    estado = _LOTES.get(lote_id)
+    if estado is None:
+        raise HTTPException(status_code=404, detail="Lote não encontrado.")
+    return _resumo_lote(estado)
+
+
+# Jobs assíncronos (POST /analisar/jobs): estado em processing/jobs.py; as tarefas rodam no event loop e
+# ocupam no máximo JOBS_CONCORRENCIA vagas do pool (semáforo criado no arranque, já dentro do loop).
+_JOBS = jobs.Jobs(config.JOBS_TTL_S, config.JOBS_MAX, config.JOBS_SQLITE)
+_JOBS_TAREFAS = set()
+_JOBS_VAGAS = None
+
+
+async def _avisar_job(job, urls):
+    """Envia o job terminado a cada callback_url (numa thread) e guarda o resultado de cada envio no job."""
+    corpo = jobs.publico(job)
+    corpo.pop("callbacks", None)
+    for url in urls:
+        envio = await asyncio.to_thread(jobs.enviar_callback, url, corpo)
+        job = _JOBS.obter(job["id"]) or job
+        enviados = dict(job.get("callbacks_enviados") or {})
+        enviados[url] = envio
+        _JOBS.atualizar(job["id"], callbacks_enviados=enviados)
+
+
+async def _rodar_job(job_id, fotos, perfil):
+    """Roda a análise de um job (esperando vaga, sem 503) e grava resultado ou erro; depois, os callbacks."""
+    try:
+        async with _JOBS_VAGAS:
+            _JOBS.atualizar(job_id, status="processando")
+            resposta = await _analisar_fotos(*fotos, perfil, lote=True)
+        job = _JOBS.atualizar(job_id, status="concluido", resultado=resposta)
+    except asyncio.CancelledError:
+        _JOBS.atualizar(job_id, status="erro", erro={"status": 503, "detail": "Servidor encerrado antes do fim da análise."})
+        raise
+    except (ValueError, ImagemInvalida) as e:
+        job = _JOBS.atualizar(job_id, status="erro", erro={"status": 400, "detail": str(e)})
+    except Exception as e:
+        traceback.print_exc()
+        job = _JOBS.atualizar(job_id, status="erro", erro={"status": 500, "detail": f"Erro no processamento: {str(e)}"})
+    if job is not None and job.get("callbacks"):
+        await _avisar_job(job, job["callbacks"])
+
+
+def _tarefa_job(coro):
+    tarefa = asyncio.ensure_future(coro)
+    _JOBS_TAREFAS.add(tarefa)
+    tarefa.add_done_callback(_JOBS_TAREFAS.discard)
+    return tarefa
+
+
+def _resposta_job(job, status_code=200):
+    """Job como JSON; enquanto pendente, Retry-After sugere quando consultar de novo."""
+    headers = {"Location": "/analisar/jobs/%s" % job["id"]}
+    if job["status"] in jobs.PENDENTES:
+        headers["Retry-After"] = "2"
+    return JSONResponse(status_code=status_code, content=jobs.publico(job), headers=headers)
+
+
+@app.post("/analisar/jobs")
+async def criar_job(
+    rosto: UploadFile = File(...),
+    rosto_com_papel: Optional[UploadFile] = File(None),
+    braco_interno: UploadFile = File(...),
+    cabelo: UploadFile = File(...),
+    braco_externo: Optional[UploadFile] = File(None),
+    perfil: Optional[str] = Form(None),
+    callback_url: Optional[str] = Form(None),
+):
+    """
+    Versão assíncrona do /analisar: mesmos campos, responde 202 com {"id", "status", ...} assim que as fotos
+    chegam. O resultado fica em GET /analisar/jobs/{id} por COLORIMETRIA_JOBS_TTL_S e, com callback_url, é
+    enviado por POST (JSON do job) quando termina. As mesmas fotos + perfil de um job ainda válido devolvem
+    esse job (200, "duplicado": true) em vez de analisar de novo; um callback_url novo é acrescentado a ele.
+    """
+    perfil_calib = _perfil(perfil)
+    if callback_url:
+        try:
+            await asyncio.to_thread(jobs.conferir_callback, callback_url, config.JOBS_CALLBACK_HOSTS)
+        except jobs.CallbackInvalido as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    try:
+        data_rosto = await ler_foto(rosto, "rosto", _MAX_FOTO_BYTES)
+        data_braco = await ler_foto(braco_interno, "braco_interno", _MAX_FOTO_BYTES)
+        data_cabelo = await ler_foto(cabelo, "cabelo", _MAX_FOTO_BYTES)
+        data_braco_ext = await ler_foto(braco_externo, "braco_externo", _MAX_FOTO_BYTES) if braco_externo else None
+        data_papel = await ler_foto(rosto_com_papel, "rosto_com_papel", _MAX_FOTO_BYTES) if rosto_com_papel else None
+    except UploadRecusado as e:
+        raise HTTPException(status_code=e.status, detail=str(e))
+    fotos = (data_rosto, data_papel, data_braco, data_cabelo, data_braco_ext)
+    chave = _chave_analise(fotos, perfil_calib)
+
+    existente = _JOBS.obter_por_chave(chave)
+    if existente is None and (_JOBS.pendentes() >= config.JOBS_MAX_PENDENTES or _JOBS.lotado()):
+        raise HTTPException(
+            status_code=503,
+            detail="Servidor ocupado. Tente novamente em alguns segundos.",
+            headers={"Retry-After": str(config.RETRY_AFTER_S)},
+        )
+    callbacks = [callback_url] if callback_url else []
+    job, novo = _JOBS.criar(chave, callbacks)
+    if novo:
+        _tarefa_job(_rodar_job(job["id"], fotos, perfil_calib))
+    elif callback_url and callback_url not in (job.get("callbacks") or []):
+        job = _JOBS.atualizar(job["id"], callbacks=(job.get("callbacks") or []) + [callback_url])
+        if job["status"] not in jobs.PENDENTES:
+            # Já terminou: avisa só o callback novo
+            _tarefa_job(_avisar_job(job, [callback_url]))
+    job["duplicado"] = not novo
+    return _resposta_job(job, 202 if novo else 200)
+
+
+@app.get("/analisar/jobs/{job_id}")
+def consultar_job(job_id: str):
+    """Estado do job: na_fila, processando, concluido (com "resultado") ou erro (com "erro": {status, detail})."""
+    job = _JOBS.obter(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job não encontrado (ou expirado).")
+    return _resposta_job(job)
+
+
+# Catálogo de produtos do /combinar: índice LAB em memória, carregado no arranque e alterável por admin
+_CATALOGO = catalog_index.IndiceCatalogo(config.CATALOGO_CELULA)
+
+
+def _carregar_catalogo():
+    """Carrega COLORIMETRIA_CATALOGO no índice. Arquivo ausente ou inválido: avisa e segue sem catálogo."""
+    if not config.CATALOGO:
+        return
+    try:
+        skus, cores = catalog_index.ler_arquivo(config.CATALOGO)
+        _CATALOGO.adicionar(skus, *cores)
+    except (OSError, ValueError) as e:
+        print("Catálogo %s ignorado: %s" % (config.CATALOGO, e), file=sys.stderr)
+
+
+class CorConsulta(BaseModel):
+    hex: Optional[str] = None
+    lab: Optional[List[float]] = None
+
+
+class PedidoCombinar(BaseModel):
+    cores: Optional[List[CorConsulta]] = None
+    paletas: Optional[dict] = None
+    perfil: Optional[dict] = None
+    grupos: List[str] = ["principal", "neutra", "destaque"]
+    delta_e: Optional[float] = None
+    k: int = 20
+    pagina: int = 1
+    por_pagina: int = 20
+
+
+def _cores_do_pedido(pedido):
+    """[(origem, item com hex/lab)]: cores avulsas, ou as dos grupos das paletas (dadas ou geradas do perfil)."""
+    if pedido.cores:
+        return [({"indice": i}, cor.model_dump()) for i, cor in enumerate(pedido.cores)]
+    paletas = pedido.paletas
+    if paletas is None and pedido.perfil is not None:
+        p = pedido.perfil
+        paletas = generate_palettes(p.get("subtom"), p.get("valor"), p.get("croma"), p.get("contraste"), p.get("estacao"))
+    if not isinstance(paletas, dict):
+        raise HTTPException(status_code=400, detail="Informe cores, paletas ou perfil.")
+    cores = []
+    for grupo in pedido.grupos:
+        for i, cor in enumerate(paletas.get(grupo) or []):
+            if not isinstance(cor, dict):
+                raise HTTPException(status_code=400, detail="Cada cor de paletas.%s deve ter hex ou lab." % grupo)
+            cores.append(({"grupo": grupo, "indice": i}, cor))
+    return cores
+
+
+@app.post("/combinar")
+def combinar(pedido: PedidoCombinar):
+    """
+    SKUs do catálogo que combinam com uma paleta: para cada cor (cores avulsas com hex/lab, "paletas" como na
+    resposta do /analisar, ou "perfil" — perfil_cromatico, do qual a paleta é gerada), os k SKUs mais próximos
+    com ΔE76 <= delta_e (padrão COLORIMETRIA_CATALOGO_DELTA_E). Cada SKU aparece uma vez, com a cor da paleta
+    mais próxima; ordenados por ΔE e paginados (pagina, por_pagina).
+    """
+    if len(_CATALOGO) == 0:
+        raise HTTPException(status_code=503, detail="Nenhum catálogo carregado.")
+    delta_e = config.CATALOGO_DELTA_E if pedido.delta_e is None else pedido.delta_e
+    # "not 0 <= x <= max" também recusa NaN e infinito
+    if (not 0 <= delta_e <= catalog_index.DELTA_E_MAX or not 1 <= pedido.k <= config.CATALOGO_K_MAX
+            or pedido.pagina < 1 or not 1 <= pedido.por_pagina <= 500):
+        raise HTTPException(
+            status_code=400,
+            detail="delta_e entre 0 e %g, k entre 1 e %d, pagina >= 1 e por_pagina entre 1 e 500." % (
+                catalog_index.DELTA_E_MAX, config.CATALOGO_K_MAX,
+            ),
+        )
+    cores = _cores_do_pedido(pedido)
+    try:
+        labs, _, _ = catalog_index.cores_de([cor for _, cor in cores])
+    except catalog_index.CatalogoInvalido as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    melhores = {}
+    for (origem, _), achados in zip(cores, _CATALOGO.vizinhos(labs, pedido.k, delta_e)):
+        for sku, distancia, lab, hex_sku in achados:
+            if sku not in melhores or distancia < melhores[sku][0]:
+                melhores[sku] = (distancia, lab, hex_sku, origem)
+    ordenados = sorted(melhores.items(), key=lambda item: (item[1][0], item[0]))
+    inicio = (pedido.pagina - 1) * pedido.por_pagina
+    pagina = ordenados[inicio:inicio + pedido.por_pagina]
+    # SKU cadastrado em LAB: HEX calculado (uma chamada para a página toda)
+    calculados = iter(colorspace.lab_to_hex([lab for _, (_, lab, h, _) in pagina if h is None]))
+    hexes = [h if h is not None else next(calculados) for _, (_, _, h, _) in pagina]
+    return {
+        "total": len(ordenados),
+        "pagina": pedido.pagina,
+        "por_pagina": pedido.por_pagina,
+        "delta_e": delta_e,
+        "itens": [
+            {"sku": sku, "lab": [round(v, 3) for v in lab], "hex": h, "delta_e": round(distancia, 3), "cor": origem}
+            for (sku, (distancia, lab, _, origem)), h in zip(pagina, hexes)
+        ],
+    }
+
+
+@app.get("/catalogo")
+def estatisticas_catalogo():
+    """Tamanho do índice do catálogo (SKUs, células da grade, alterações)."""
+    return _CATALOGO.estatisticas()
+
+
+@app.post("/catalogo/itens")
+def incluir_no_catalogo(dados: dict = Body(...), x_admin_token: Optional[str] = Header(None)):
+    """(Admin) Inclui ou troca SKUs sem reconstruir o índice: {"itens": [{"sku", "hex" | "lab"}, ...]}."""
+    _conferir_admin(x_admin_token)
+    itens = dados.get("itens")
+    if not isinstance(itens, list) or not all(isinstance(i, dict) and i.get("sku") for i in itens):
+        raise HTTPException(status_code=400, detail="itens deve ser uma lista de {sku, hex | lab}.")
+    try:
+        trocados = _CATALOGO.adicionar([str(i["sku"]) for i in itens], *catalog_index.cores_de(itens))
+    except catalog_index.CatalogoInvalido as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"incluidos": len(itens) - trocados, "trocados": trocados, **_CATALOGO.estatisticas()}
+
+
+@app.delete("/catalogo/itens/{sku}")
+def remover_do_catalogo(sku: str, x_admin_token: Optional[str] = Header(None)):
+    """(Admin) Tira um SKU do índice."""
+    _conferir_admin(x_admin_token)
+    if not _CATALOGO.remover([sku]):
+        raise HTTPException(status_code=404, detail="SKU não encontrado.")
+    return _CATALOGO.estatisticas()
+
+
+def _conferir_admin(token):
+    """Endpoints de admin: 404 se COLORIMETRIA_ADMIN_TOKEN não está definido, 401 se o token não confere."""
+    if not config.ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not token or not hmac.compare_digest(token.encode("utf-8"), config.ADMIN_TOKEN.encode("utf-8")):
+        raise HTTPException(status_code=401, detail="Token de admin inválido.")
+
+
+@app.get("/calibracao")
+def listar_calibracoes(x_admin_token: Optional[str] = Header(None)):
+    """(Admin) Perfis de calibração carregados, com versão, hash e origem; e o perfil padrão."""
+    _conferir_admin(x_admin_token)
+    return {**_PERFIS.listar(), "trocas": _PERFIS.trocas}
+
+
+@app.post("/calibracao/recarregar")
+async def recarregar_calibracoes(x_admin_token: Optional[str] = Header(None)):
+    """(Admin) Relê calib.json e COLORIMETRIA_CALIB_DIR agora; troca só os perfis alterados."""
+    _conferir_admin(x_admin_token)
+    resultado = await asyncio.to_thread(_PERFIS.recarregar)
+    return {**resultado, **_PERFIS.listar()}
+
+
+@app.put("/calibracao/{nome}")
+def instalar_calibracao(nome: str, dados: dict = Body(...), x_admin_token: Optional[str] = Header(None)):
+    """
+    (Admin) Instala ou troca o perfil nome com o JSON do corpo (formato de calib.json), só em memória:
+    vale até o processo reiniciar e prevalece sobre um arquivo de mesmo nome.
+    """
+    _conferir_admin(x_admin_token)
+    try:
+        return _PERFIS.instalar(nome, dados).descricao()
+    except calibracao.CalibracaoInvalida as e:
+        raise HTTPException(status_code=400, detail=str(e))
@@ -0,0 +1,180 @@
+"""
+Cache de resultados por conteúdo: chave = hash dos bytes enviados (+ versão do pipeline, calibração...).
+Duas camadas: LRU em memória limitado por bytes e, opcionalmente, SQLite em disco, compartilhado
+entre workers/processos da mesma máquina. Valores são objetos JSON (guardados serializados).
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+def hash_bytes(*parts):
+    """Hash rápido (BLAKE2b-128) de uma sequência de bytes/str/None; o tamanho de cada parte entra na chave."""
+    h = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        if part is None:
+            h.update(b"\x00none")
+            continue
+        if isinstance(part, str):
+            part = part.encode("utf-8")
+        h.update(len(part).to_bytes(8, "little"))
+        h.update(part)
+    return h.hexdigest()
+
+
+def hash_json(obj):
+    """Hash estável de um objeto JSON (chaves ordenadas)."""
+    return hash_bytes(json.dumps(obj, sort_keys=True, separators=(",", ":")))
+
+
+class LRUBytesCache:
+    """LRU em memória com teto em bytes (soma dos valores serializados). Thread-safe."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max(0, int(max_bytes))
+        self._items = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._items.get(key)
+            if value is not None:
+                self._items.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        if len(value) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old)
+            self._items[key] = value
+            self._bytes += len(value)
+            while self._bytes > self.max_bytes and self._items:
+                _, evicted = self._items.popitem(last=False)
+                self._bytes -= len(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self._bytes = 0
+
+    def __len__(self):
+        return len(self._items)
+
+    @property
+    def nbytes(self):
+        return self._bytes
+
+
+class SQLiteCache:
+    """Camada em disco (SQLite, modo WAL). Mantém no máximo max_items entradas (remove as mais antigas)."""
+
+    def __init__(self, path, max_items=10000):
+        self.path = path
+        self.max_items = max_items
+        self._local = threading.local()
+        self._sets = 0
+        d = os.path.dirname(os.path.abspath(path))
+        if d:
+            os.makedirs(d, exist_ok=True)
+        conn = self._conn()
+        conn.execute("CREATE TABLE IF NOT EXISTS cache (chave TEXT PRIMARY KEY, valor BLOB NOT NULL, criado REAL NOT NULL)")
+        conn.execute("CREATE INDEX IF NOT EXISTS cache_criado ON cache (criado)")
+        conn.commit()
+
+    def _conn(self):
+        # Uma conexão por thread (e por processo: os workers abrem a sua depois do spawn)
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        row = self._conn().execute("SELECT valor FROM cache WHERE chave = ?", (key,)).fetchone()
+        return bytes(row[0]) if row else None
+
+    def set(self, key, value):
+        conn = self._conn()
+        conn.execute("INSERT OR REPLACE INTO cache (chave, valor, criado) VALUES (?, ?, ?)", (key, value, time.time()))
+        self._sets += 1
+        if self.max_items and self._sets % 100 == 0:
+            conn.execute(
+                "DELETE FROM cache WHERE chave IN (SELECT chave FROM cache ORDER BY criado DESC LIMIT -1 OFFSET ?)",
+                (self.max_items,),
+            )
+        conn.commit()
+
+
+class ResultCache:
+    """
+    Cache em duas camadas (memória → SQLite opcional) de objetos JSON, com contadores de acerto/erro.
+    max_bytes=0 desliga a camada em memória; sqlite_path=None desliga a de disco.
+    """
+
+    def __init__(self, max_bytes, sqlite_path=None, sqlite_max_items=10000):
+        self.memory = LRUBytesCache(max_bytes) if max_bytes > 0 else None
+        self.disk = SQLiteCache(sqlite_path, sqlite_max_items) if sqlite_path else None
+        self._lock = threading.Lock()
+        self.hits_memory = 0
+        self.hits_disk = 0
+        self.misses = 0
+
+    @property
+    def enabled(self):
+        return self.memory is not None or self.disk is not None
+
+    def get(self, key):
+        """Objeto guardado em key (uma cópia nova a cada chamada) ou None."""
+        raw = self.memory.get(key) if self.memory is not None else None
+        if raw is not None:
+            with self._lock:
+                self.hits_memory += 1
+            return json.loads(raw)
+        if self.disk is not None:
+            try:
+                raw = self.disk.get(key)
+            except sqlite3.Error:
+                raw = None
+            if raw is not None:
+                if self.memory is not None:
+                    self.memory.set(key, raw)
+                with self._lock:
+                    self.hits_disk += 1
+                return json.loads(raw)
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, key, obj):
+        raw = json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        if self.memory is not None:
+            self.memory.set(key, raw)
+        if self.disk is not None:
+            try:
+                self.disk.set(key, raw)
+            except sqlite3.Error:
+                pass
+
+    def stats(self):
+        hits = self.hits_memory + self.hits_disk
+        total = hits + self.misses
+        return {
+            "acertos": hits,
+            "acertos_memoria": self.hits_memory,
+            "acertos_disco": self.hits_disk,
+            "erros": self.misses,
+            "taxa_acerto": round(hits / total, 4) if total else 0.0,
+            "itens_memoria": len(self.memory) if self.memory is not None else 0,
+            "bytes_memoria": self.memory.nbytes if self.memory is not None else 0,
+            "disco": self.disk.path if self.disk is not None else None,
+        }
@@ -0,0 +1,200 @@
+"""
+Perfis de calibração (offsets LAB por região) residentes em memória, com versão e troca a quente.
+
+O perfil "padrao" vem de processing/calib.json; cada <nome>.json em COLORIMETRIA_CALIB_DIR é mais um perfil
+(por câmera, por cliente...), escolhido por requisição. Todos ficam carregados: escolher um perfil é uma
+consulta a um dict, sem disco. Recarregar (vigia de arquivos ou endpoint de admin) monta um dict novo e o
+troca numa única atribuição: cada análise pega o Perfil no início e segue com ele até o fim, então as
+requisições em andamento não veem meio perfil nem são interrompidas. Um arquivo inválido mantém a versão
+anterior daquele perfil.
+"""
+import json
+import os
+import sys
+import threading
+import time
+
+from processing.cache import hash_json
+
+PERFIL_PADRAO = "padrao"
+CALIB_JSON = os.path.join(os.path.dirname(__file__), "calib.json")
+_REGIOES = ("skin_face", "skin_arm", "hair")
+
+
+class CalibracaoInvalida(ValueError):
+    """Perfil com formato inválido (vira HTTP 400 no endpoint de admin)."""
+
+
+class PerfilDesconhecido(KeyError):
+    """Nome de perfil que não está carregado (vira HTTP 400)."""
+
+
+class Perfil:
+    """Perfil imutável: nome, dados (dict de calib.json), versão e hash do conteúdo (entra na chave do cache)."""
+
+    __slots__ = ("nome", "dados", "versao", "hash", "origem", "carregado_em")
+
+    def __init__(self, nome, dados, origem=None):
+        self.nome = nome
+        self.dados = dados
+        self.hash = hash_json(dados)
+        # "versao" declarada no arquivo (ex.: data da calibração) ou os 12 primeiros dígitos do hash
+        self.versao = str(dados.get("versao") or self.hash[:12])
+        self.origem = origem
+        self.carregado_em = time.time()
+
+    def resumo(self):
+        return {"perfil": self.nome, "versao": self.versao}
+
+    def descricao(self):
+        return {
+            "perfil": self.nome, "versao": self.versao, "hash": self.hash, "origem": self.origem,
+            "carregado_em": round(self.carregado_em, 3),
+        }
+
+
+def _numero(valor, onde):
+    if isinstance(valor, bool) or not isinstance(valor, (int, float)):
+        raise CalibracaoInvalida("%s deve ser número." % onde)
+    return float(valor)
+
+
+def validar(dados):
+    """Confere o formato de calib.json (offset_L/a/b e by_region com [dL, da, db]). Retorna os próprios dados."""
+    if not isinstance(dados, dict):
+        raise CalibracaoInvalida("A calibração deve ser um objeto JSON.")
+    for chave in ("offset_L", "offset_a", "offset_b"):
+        if chave in dados:
+            _numero(dados[chave], chave)
+    por_regiao = dados.get("by_region") or {}
+    if not isinstance(por_regiao, dict):
+        raise CalibracaoInvalida("by_region deve ser um objeto.")
+    for regiao, offset in por_regiao.items():
+        if regiao not in _REGIOES:
+            raise CalibracaoInvalida("Região desconhecida em by_region: %s." % regiao)
+        if not isinstance(offset, (list, tuple)) or len(offset) != 3:
+            raise CalibracaoInvalida("by_region.%s deve ser [dL, da, db]." % regiao)
+        for i, v in enumerate(offset):
+            _numero(v, "by_region.%s[%d]" % (regiao, i))
+    return dados
+
+
+def ler_arquivo(path):
+    with open(path, "r", encoding="utf-8") as f:
+        try:
+            return validar(json.load(f))
+        except json.JSONDecodeError as e:
+            raise CalibracaoInvalida("JSON inválido: %s" % e)
+
+
+def _arquivos(pasta):
+    """{nome do perfil: caminho}: calib.json como "padrao" + os .json de pasta (que podem sobrepor o padrao)."""
+    arquivos = {PERFIL_PADRAO: CALIB_JSON} if os.path.isfile(CALIB_JSON) else {}
+    if pasta and os.path.isdir(pasta):
+        for nome in sorted(os.listdir(pasta)):
+            if nome.endswith(".json") and not nome.startswith("."):
+                arquivos[nome[:-5]] = os.path.join(pasta, nome)
+    return arquivos
+
+
+def _assinatura(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+
+class Perfis:
+    """
+    Conjunto de perfis carregados. Leitura sem lock (obter troca por referência); recarregar/instalar
+    serializam entre si num lock e publicam o dict novo de uma vez.
+    """
+
+    def __init__(self, pasta=None, padrao=PERFIL_PADRAO):
+        self.pasta = pasta
+        self.padrao = padrao
+        self._perfis = {}
+        self._assinaturas = {}
+        # Arquivos inválidos: nome → (assinatura, erro); só são relidos quando mudarem
+        self._falhas = {}
+        self._lock = threading.Lock()
+        self._vazio = Perfil(padrao, {})
+        self.trocas = 0
+
+    def __len__(self):
+        return len(self._perfis)
+
+    def obter(self, nome=None):
+        """Perfil pelo nome (None = padrão). Sem perfil padrão carregado, um perfil vazio (sem offsets)."""
+        perfis = self._perfis
+        if nome:
+            perfil = perfis.get(nome)
+            if perfil is None:
+                raise PerfilDesconhecido(nome)
+            return perfil
+        return perfis.get(self.padrao) or self._vazio
+
+    def listar(self):
+        return {"padrao": self.padrao, "perfis": [p.descricao() for _, p in sorted(self._perfis.items())]}
+
+    def recarregar(self):
+        """
+        Relê do disco os arquivos novos ou alterados (mtime/tamanho/inode) e descarta os removidos.
+        Retorna {"trocados": [...], "removidos": [...], "erros": {nome: mensagem}}.
+        """
+        with self._lock:
+            arquivos = _arquivos(self.pasta)
+            novos = {}
+            assinaturas = {}
+            trocados, erros = [], {}
+            for nome, path in arquivos.items():
+                assinatura = _assinatura(path)
+                atual = self._perfis.get(nome)
+                if atual is not None and atual.origem is None:
+                    # Instalado pelo endpoint: prevalece sobre o arquivo de mesmo nome
+                    novos[nome] = atual
+                    continue
+                if atual is not None and atual.origem == path and self._assinaturas.get(nome) == assinatura:
+                    novos[nome], assinaturas[nome] = atual, assinatura
+                    continue
+                falha = self._falhas.get(nome)
+                try:
+                    if falha is not None and falha[0] == assinatura:
+                        raise CalibracaoInvalida(falha[1])
+                    perfil = Perfil(nome, ler_arquivo(path), origem=path)
+                except (OSError, CalibracaoInvalida) as e:
+                    erros[nome] = str(e)
+                    if falha is None or falha[0] != assinatura:
+                        print("Calibração %s ignorada (%s): %s" % (nome, path, e), file=sys.stderr)
+                    self._falhas[nome] = (assinatura, str(e))
+                    if atual is not None:
+                        novos[nome], assinaturas[nome] = atual, self._assinaturas.get(nome)
+                    continue
+                self._falhas.pop(nome, None)
+                if atual is not None and atual.origem == path and atual.hash == perfil.hash:
+                    perfil = atual  # só o mtime mudou
+                else:
+                    trocados.append(nome)
+                novos[nome], assinaturas[nome] = perfil, assinatura
+            # Instalados pelo endpoint (sem arquivo) continuam
+            for nome, perfil in self._perfis.items():
+                if perfil.origem is None and nome not in novos:
+                    novos[nome] = perfil
+            removidos = [n for n in self._perfis if n not in novos]
+            self._assinaturas = assinaturas
+            if any(self._perfis.get(n) is not p for n, p in novos.items()) or removidos:
+                self._perfis = novos
+                self.trocas += 1
+            return {"trocados": trocados, "removidos": removidos, "erros": erros}
+
+    def instalar(self, nome, dados):
+        """Instala (ou troca) o perfil nome só em memória, sem arquivo. Levanta CalibracaoInvalida."""
+        perfil = Perfil(nome, validar(dados))
+        with self._lock:
+            novos = dict(self._perfis)
+            novos[nome] = perfil
+            self._perfis = novos
+            self._assinaturas.pop(nome, None)
+            self.trocas += 1
+        return perfil
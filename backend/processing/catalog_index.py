@@ -0,0 +1,248 @@
+"""
+Índice espacial das cores de um catálogo de produtos (SKU → LAB), para o /combinar.
+
+Grade regular no espaço LAB: cada cor cai numa célula de lado CATALOGO_CELULA (ΔE76). Uma consulta com raio
+ΔE só olha as células que a esfera toca e mede a distância exata dos candidatos com NumPy, então o custo
+depende de quantas cores há perto da consulta, não do tamanho do catálogo. Incluir e remover um SKU mexem
+numa célula só (sem reconstruir nada); as cores ficam num array contíguo com vagas reaproveitadas.
+Arquivo do catálogo: CSV (colunas sku + hex, ou sku + L, a, b) ou JSONL ({"sku", "hex"} ou {"sku", "lab"}).
+"""
+import csv
+import itertools
+import json
+import math
+import threading
+
+import numpy as np
+
+from processing import colorspace
+
+# Índices de célula cabem em 21 bits por canal (com deslocamento): um int64 identifica a célula
+_BITS = 21
+_DESLOCAMENTO = 1 << (_BITS - 1)
+# Maior ΔE76 que faz sentido numa consulta: o diâmetro do espaço LAB (L 0-100, a e b em torno de ±128)
+DELTA_E_MAX = 400.0
+
+
+class CatalogoInvalido(ValueError):
+    """Item ou arquivo de catálogo com formato inválido (vira HTTP 400)."""
+
+
+def cores_de(itens):
+    """
+    (labs N×3, rgb N×3 uint8, com_hex N) de itens {"hex": "#rrggbb"} ou {"lab": [L, a, b]} (lab prevalece).
+    Os HEX são convertidos numa única chamada e guardados, para a resposta devolver o HEX original do SKU.
+    """
+    n = len(itens)
+    labs = np.zeros((n, 3), dtype=np.float64)
+    rgb = np.zeros((n, 3), dtype=np.uint8)
+    com_hex = np.zeros(n, dtype=bool)
+    hexes = []
+    for i, item in enumerate(itens):
+        lab = item.get("lab")
+        if lab is not None:
+            if not isinstance(lab, (list, tuple)) or len(lab) != 3:
+                raise CatalogoInvalido("lab deve ser [L, a, b].")
+            try:
+                labs[i] = [float(v) for v in lab]
+            except (TypeError, ValueError):
+                raise CatalogoInvalido("lab deve ser [L, a, b] numérico.")
+            if not np.isfinite(labs[i]).all():
+                raise CatalogoInvalido("lab deve ser [L, a, b] finito.")
+        elif item.get("hex"):
+            hexes.append(str(item["hex"]).strip())
+            com_hex[i] = True
+        else:
+            raise CatalogoInvalido("Cada cor precisa de hex ou lab.")
+    if hexes:
+        try:
+            if any(len(h.lstrip("#")) not in (6, 8) for h in hexes):
+                raise ValueError
+            rgb[com_hex] = colorspace.hex_decode(hexes)
+        except ValueError:
+            raise CatalogoInvalido("HEX inválido (use #rrggbb).")
+        labs[com_hex] = colorspace.rgb_to_lab(rgb[com_hex] / 255.0)
+    return labs, rgb, com_hex
+
+
+def ler_arquivo(path):
+    """(skus, (labs, rgb, com_hex)) de um CSV ou JSONL de catálogo."""
+    if path.lower().endswith(".csv"):
+        with open(path, "r", encoding="utf-8", newline="") as f:
+            itens = []
+            for linha in csv.DictReader(f):
+                item = {"sku": linha.get("sku"), "hex": linha.get("hex")}
+                if linha.get("L") not in (None, ""):
+                    item["lab"] = [linha["L"], linha["a"], linha["b"]]
+                itens.append(item)
+    else:
+        with open(path, "r", encoding="utf-8") as f:
+            itens = [json.loads(linha) for linha in f if linha.strip()]
+    skus = []
+    for i, item in enumerate(itens):
+        if not item.get("sku"):
+            raise CatalogoInvalido("Linha %d do catálogo sem sku." % (i + 1))
+        skus.append(str(item["sku"]))
+    return skus, cores_de(itens)
+
+
+class IndiceCatalogo:
+    """
+    SKUs e cores LAB numa grade de células de lado celula (ΔE76). Thread-safe: consultas e alterações
+    passam por um lock (cada consulta leva milissegundos).
+    """
+
+    def __init__(self, celula=5.0):
+        self.celula = float(celula)
+        self._lab = np.zeros((0, 3), dtype=np.float32)
+        self._ativo = np.zeros(0, dtype=bool)
+        self._rgb = np.zeros((0, 3), dtype=np.uint8)     # HEX original (quando o SKU veio em HEX)
+        self._com_hex = np.zeros(0, dtype=bool)
+        self._skus = []
+        self._vagas = []
+        self._posicao = {}       # sku → posição em _lab
+        self._celulas = {}       # código da célula → [posições]
+        self._lock = threading.Lock()
+        self.alteracoes = 0
+
+    def __len__(self):
+        return len(self._posicao)
+
+    def _codigos(self, labs):
+        """Código int64 da célula de cada cor (N×3)."""
+        idx = np.floor(np.asarray(labs, dtype=np.float64) / self.celula).astype(np.int64) + _DESLOCAMENTO
+        return (idx[:, 0] << (2 * _BITS)) | (idx[:, 1] << _BITS) | idx[:, 2]
+
+    def _reservar(self, n):
+        """Posições livres para n cores (reaproveita vagas; cresce os arrays dobrando a capacidade). Com o lock."""
+        reaproveitadas = [self._vagas.pop() for _ in range(min(n, len(self._vagas)))]
+        faltam = n - len(reaproveitadas)
+        inicio = len(self._skus)
+        if inicio + faltam > len(self._lab):
+            capacidade = max(inicio + faltam, 2 * len(self._lab), 1024)
+            lab = np.zeros((capacidade, 3), dtype=np.float32)
+            lab[:len(self._lab)] = self._lab
+            ativo = np.zeros(capacidade, dtype=bool)
+            ativo[:len(self._ativo)] = self._ativo
+            rgb = np.zeros((capacidade, 3), dtype=np.uint8)
+            rgb[:len(self._rgb)] = self._rgb
+            com_hex = np.zeros(capacidade, dtype=bool)
+            com_hex[:len(self._com_hex)] = self._com_hex
+            self._lab, self._ativo, self._rgb, self._com_hex = lab, ativo, rgb, com_hex
+        self._skus.extend([None] * faltam)
+        return reaproveitadas + list(range(inicio, inicio + faltam))
+
+    def _tirar(self, sku):
+        """Remove sku da célula e libera a posição. Com o lock."""
+        pos = self._posicao.pop(sku, None)
+        if pos is None:
+            return False
+        codigo = int(self._codigos(self._lab[pos:pos + 1])[0])
+        membros = self._celulas[codigo]
+        membros.remove(pos)
+        if not membros:
+            del self._celulas[codigo]
+        self._ativo[pos] = False
+        self._skus[pos] = None
+        self._vagas.append(pos)
+        return True
+
+    def adicionar(self, skus, labs, rgb=None, com_hex=None):
+        """
+        Inclui (ou troca a cor de) vários SKUs de uma vez; labs: N×3 (+ rgb/com_hex de cores_de, para guardar
+        o HEX original). Retorna quantos já existiam.
+        """
+        labs = np.asarray(labs, dtype=np.float64).reshape(-1, 3)
+        rgb = np.zeros((len(labs), 3), dtype=np.uint8) if rgb is None else np.asarray(rgb, dtype=np.uint8)
+        com_hex = np.zeros(len(labs), dtype=bool) if com_hex is None else np.asarray(com_hex, dtype=bool)
+        if len(skus) != len(labs):
+            raise CatalogoInvalido("skus e labs com tamanhos diferentes.")
+        if not np.isfinite(labs).all():
+            raise CatalogoInvalido("LAB com valor não finito.")
+        # A célula sai do valor guardado (float32), para _tirar achar a mesma célula depois
+        labs = labs.astype(np.float32)
+        # Um SKU repetido no mesmo lote fica com a última cor
+        ultimo = {sku: i for i, sku in enumerate(skus)}
+        if len(ultimo) < len(skus):
+            ordem = sorted(ultimo.values())
+            skus, labs, rgb, com_hex = [skus[i] for i in ordem], labs[ordem], rgb[ordem], com_hex[ordem]
+        with self._lock:
+            trocados = sum(self._tirar(sku) for sku in skus)
+            posicoes = self._reservar(len(skus))
+            pos = np.asarray(posicoes, dtype=np.intp)
+            self._lab[pos] = labs
+            self._ativo[pos] = True
+            self._rgb[pos] = rgb
+            self._com_hex[pos] = com_hex
+            for sku, p in zip(skus, posicoes):
+                self._skus[p] = sku
+                self._posicao[sku] = p
+            # Agrupa por célula: um extend por célula em vez de um append por cor
+            codigos = self._codigos(labs)
+            ordem = np.argsort(codigos, kind="stable")
+            unicos, inicios = np.unique(codigos[ordem], return_index=True)
+            grupos = np.split(pos[ordem], inicios[1:])
+            for codigo, grupo in zip(unicos.tolist(), grupos):
+                self._celulas.setdefault(codigo, []).extend(grupo.tolist())
+            self.alteracoes += 1
+        return trocados
+
+    def remover(self, skus):
+        """Tira SKUs do índice. Retorna quantos existiam."""
+        with self._lock:
+            removidos = sum(self._tirar(sku) for sku in skus)
+            if removidos:
+                self.alteracoes += 1
+            return removidos
+
+    def _candidatos(self, lab, raio):
+        """Posições nas células que o cubo em volta da esfera (lab, raio) toca; o catálogo todo se isso der
+        mais células do que existem. Com o lock."""
+        lab = np.asarray(lab, dtype=np.float64)
+        baixo = np.floor((lab - raio) / self.celula)
+        alto = np.floor((lab + raio) / self.celula)
+        # Conta em float (não estoura como int64 com raios enormes)
+        if not np.isfinite(alto - baixo).all() or math.prod(float(n) for n in alto - baixo + 1) >= len(self._celulas):
+            return np.flatnonzero(self._ativo)
+        baixo = baixo.astype(np.int64) + _DESLOCAMENTO
+        alto = alto.astype(np.int64) + _DESLOCAMENTO
+        membros = []
+        for il, ia, ib in itertools.product(*(range(int(b), int(a) + 1) for b, a in zip(baixo, alto))):
+            lista = self._celulas.get((il << (2 * _BITS)) | (ia << _BITS) | ib)
+            if lista:
+                membros.append(lista)
+        return np.fromiter(itertools.chain.from_iterable(membros), dtype=np.intp)
+
+    def vizinhos(self, labs, k=10, delta_e_max=10.0):
+        """
+        Para cada cor de labs (M×3), os até k SKUs mais próximos com ΔE76 <= delta_e_max, do mais perto ao
+        mais longe. Retorna uma lista de M listas de (sku, ΔE, lab do SKU, HEX original ou None).
+        """
+        labs = np.asarray(labs, dtype=np.float64).reshape(-1, 3)
+        saida = []
+        with self._lock:
+            for lab in labs:
+                pos = self._candidatos(lab, delta_e_max)
+                if len(pos) == 0:
+                    saida.append([])
+                    continue
+                dist = np.sqrt(((self._lab[pos].astype(np.float64) - lab) ** 2).sum(axis=1))
+                dentro = dist <= delta_e_max
+                pos, dist = pos[dentro], dist[dentro]
+                if len(pos) > k:
+                    melhores = np.argpartition(dist, k - 1)[:k]
+                    pos, dist = pos[melhores], dist[melhores]
+                ordem = np.lexsort((pos, dist))
+                pos, dist = pos[ordem], dist[ordem]
+                hexes = colorspace.hex_encode(self._rgb[pos])
+                saida.append([
+                    (self._skus[p], d, [float(v) for v in self._lab[p]], h if self._com_hex[p] else None)
+                    for p, d, h in zip(pos.tolist(), dist.tolist(), hexes)
+                ])
+        return saida
+
+    def estatisticas(self):
+        return {
+            "skus": len(self._posicao), "celulas": len(self._celulas), "celula_delta_e": self.celula,
+            "capacidade": len(self._lab), "alteracoes": self.alteracoes,
+        }
@@ -1,89 +1,188 @@
 """
 Classificação cromática: subtom (quente/frio/neutro/oliva), valor, croma, contraste.
 Sistema baseado em regras com thresholds interpretáveis.
+
+Os limiares ficam numa tabela declarativa (REGRAS), lida tanto pelas funções escalares (uma análise) quanto
+por classificar_lote, que classifica arrays de features (N análises) com NumPy, com o mesmo resultado.
+Mudar um limiar é editar a tabela (ou passar outra, ex. lida de JSON) e reclassificar o arquivo de análises
+antigas com scripts/reclassificar.py, sem rodar o pipeline de imagem de novo.
 """
+import operator
+from functools import reduce
+
 import numpy as np
 
+# Tabela de regras (só listas, números e strings: pode vir de um JSON).
+# subtom: regras em ordem, a primeira que casa decide: [rótulo, "e" | "ou", [[variável, operador, limiar], ...]];
+#   nenhuma casou = "senao". Variáveis: a, b (média da pele do rosto e do braço interno, quando houver).
+# valor, croma, contraste: faixas [limite, rótulo] em ordem crescente (rótulo de quem fica abaixo do limite),
+#   "acima" para o resto e "ausente" quando não há o dado.
+# estacao: base pelo subtom (quentes) e pelo valor (claros) + sufixo pelo croma.
+REGRAS = {
+    "subtom": {
+        "regras": [
+            ["oliva", "e", [["b", "<", -3], ["a", ">", 2]]],
+            ["quente", "e", [["a", ">", 2], ["b", ">", 2]]],
+            ["frio", "ou", [["a", "<", -1], ["b", "<", -2]]],
+            ["neutro", "e", [["a", ">=", -1], ["a", "<=", 2], ["b", ">=", -2], ["b", "<=", 2]]],
+            ["quente", "e", [["b", ">", 0]]],
+        ],
+        "senao": "frio",
+        "ausente": "neutro",
+    },
+    "valor": {"faixas": [[40, "escuro"], [55, "médio_escuro"], [70, "médio"]], "acima": "claro", "ausente": "médio"},
+    "croma": {"faixas": [[12, "suave"], [25, "moderado"]], "acima": "intenso", "ausente": "moderado"},
+    "contraste": {"faixas": [[15, "baixo"], [35, "médio"]], "acima": "alto", "ausente": "médio"},
+    "estacao": {
+        "quentes": ["quente", "oliva", "neutro"],
+        "claros": ["claro", "médio"],
+        "bases": {"quente_claro": "Primavera", "frio_claro": "Verão", "quente_escuro": "Outono", "frio_escuro": "Inverno"},
+        "sufixos": {"suave": " suave", "intenso": " intenso"},
+    },
+}
+
+# Valem para floats e para arrays NumPy (e "e"/"ou" combinam bools ou arrays de bools)
+_OPERADORES = {"<": operator.lt, "<=": operator.le, ">": operator.gt, ">=": operator.ge}
+_COMBINAR = {"e": operator.and_, "ou": operator.or_}
+
+
+def _casa(regra, valores):
+    """Se a regra [rótulo, combinação, condições] casa com valores {"a": ..., "b": ...} (escalares ou arrays)."""
+    _, combinacao, condicoes = regra
+    return reduce(_COMBINAR[combinacao], (_OPERADORES[op](valores[var], limiar) for var, op, limiar in condicoes))
+
+
+def _faixa(x, tabela):
+    for limite, rotulo in tabela["faixas"]:
+        if x < limite:
+            return rotulo
+    return tabela["acima"]
 
-def infer_subtom(skin_mean_lab, braco_interno_lab=None):
+
+def infer_subtom(skin_mean_lab, braco_interno_lab=None, regras=REGRAS):
     """
     Subtom: quente (a>0, amarelo), frio (a<0, azul/vermelho azulado), neutro, oliva (b negativo + a).
     LAB: a+ = vermelho/magenta, a- = verde; b+ = amarelo, b- = azul.
     Pele quente: b positivo, a levemente positivo. Fria: a negativo ou b negativo. Oliva: a positivo, b negativo.
     """
+    tabela = regras["subtom"]
     if skin_mean_lab is None or len(skin_mean_lab) < 3:
-        return "neutro"
+        return tabela["ausente"]
     a, b = float(skin_mean_lab[1]), float(skin_mean_lab[2])
     if braco_interno_lab is not None and len(braco_interno_lab) >= 3:
         a2, b2 = float(braco_interno_lab[1]), float(braco_interno_lab[2])
         a, b = (a + a2) / 2, (b + b2) / 2
-    # Regras simples
-    if b < -3 and a > 2:
-        return "oliva"
-    if a > 2 and b > 2:
-        return "quente"
-    if a < -1 or b < -2:
-        return "frio"
-    if -1 <= a <= 2 and -2 <= b <= 2:
-        return "neutro"
-    return "quente" if b > 0 else "frio"
-
-
-def infer_valor(l_mean):
-    """Valor (claridade): claro < 50 < médio < 65 < escuro."""
+    for regra in tabela["regras"]:
+        if _casa(regra, {"a": a, "b": b}):
+            return regra[0]
+    return tabela["senao"]
+
+
+def infer_valor(l_mean, regras=REGRAS):
+    """Valor (claridade): escuro < 40 < médio_escuro < 55 < médio < 70 < claro."""
     if l_mean is None:
-        return "médio"
-    if l_mean < 40:
-        return "escuro"
-    if l_mean < 55:
-        return "médio_escuro"
-    if l_mean < 70:
-        return "médio"
-    return "claro"
-
-
-def infer_croma(c_mean):
-    """Croma (saturação): suave < 15 < moderado < 35 < intenso."""
+        return regras["valor"]["ausente"]
+    return _faixa(l_mean, regras["valor"])
+
+
+def infer_croma(c_mean, regras=REGRAS):
+    """Croma (saturação): suave < 12 < moderado < 25 < intenso."""
     if c_mean is None or c_mean < 0:
-        return "moderado"
-    if c_mean < 12:
-        return "suave"
-    if c_mean < 25:
-        return "moderado"
-    return "intenso"
+        return regras["croma"]["ausente"]
+    return _faixa(c_mean, regras["croma"])
 
 
-def infer_contrast(skin_lab, hair_lab):
+def infer_contrast(skin_lab, hair_lab, regras=REGRAS):
     """Contraste geral: diferença L entre pele e cabelo."""
     if skin_lab is None or hair_lab is None:
-        return "médio"
+        return regras["contraste"]["ausente"]
     l_skin = skin_lab[0] if len(skin_lab) >= 1 else 50
     l_hair = hair_lab[0] if len(hair_lab) >= 1 else 40
-    diff = abs(l_skin - l_hair)
-    if diff < 15:
-        return "baixo"
-    if diff < 35:
-        return "médio"
-    return "alto"
+    return _faixa(abs(l_skin - l_hair), regras["contraste"])
 
 
-def classify_season(subtom, valor, croma, contraste):
+def classify_season(subtom, valor, croma, contraste, regras=REGRAS):
     """
     Mapeia para sistema de 12 estações (simplificado em 4 + nuances).
     Primavera = quente claro; Verão = frio claro; Outono = quente escuro; Inverno = frio escuro.
     """
-    quente = subtom in ("quente", "oliva", "neutro")
-    claro = valor in ("claro", "médio")
-    if quente and claro:
-        base = "Primavera"
-    elif not quente and claro:
-        base = "Verão"
-    elif quente and not claro:
-        base = "Outono"
-    else:
-        base = "Inverno"
-    if croma == "suave":
-        return f"{base} suave"
-    if croma == "intenso":
-        return f"{base} intenso"
-    return base
+    tabela = regras["estacao"]
+    quente = "quente" if subtom in tabela["quentes"] else "frio"
+    claro = "claro" if valor in tabela["claros"] else "escuro"
+    return tabela["bases"][quente + "_" + claro] + tabela["sufixos"].get(croma, "")
+
+
+# --- Classificação vetorizada (N análises de uma vez) ---
+# Trabalha com índices inteiros nas listas de rótulos; as strings só são montadas no fim.
+
+def _faixa_lote(x, tabela, ausente):
+    """(índice, nomes): faixa de cada x (float64, N); ausente (bool, N) recebe o rótulo de ausente."""
+    limites = np.asarray([limite for limite, _ in tabela["faixas"]], dtype=np.float64)
+    nomes = [rotulo for _, rotulo in tabela["faixas"]] + [tabela["acima"], tabela["ausente"]]
+    # Quantos limites são <= x = índice da primeira faixa com x < limite (como o laço de _faixa)
+    indices = np.searchsorted(limites, np.where(ausente, 0.0, x), side="right")
+    indices[ausente] = len(nomes) - 1
+    return indices, nomes
+
+
+def _coluna(lab, n, coluna):
+    """Coluna de um array (N, 3) de LAB como float64, com NaN nas linhas ausentes; None vira tudo NaN."""
+    if lab is None:
+        return np.full(n, np.nan)
+    return np.asarray(lab, dtype=np.float64).reshape(n, -1)[:, coluna]
+
+
+def _pertence(nomes, conjunto):
+    """Máscara (por índice de nomes) de quem está em conjunto, para indexar com os índices do lote."""
+    return np.array([nome in conjunto for nome in nomes], dtype=bool)
+
+
+def classificar_lote(skin_lab, braco_lab=None, hair_lab=None, chroma=None, regras=REGRAS):
+    """
+    Classifica N análises de uma vez, com o mesmo resultado das funções escalares aplicadas linha a linha
+    como em pipeline.montar_resposta.
+    skin_lab, braco_lab, hair_lab: arrays (N, 3) de mean_lab já calibrados (linhas NaN = região ausente);
+    chroma: chroma_mean da pele do rosto (N,), NaN = ausente. braco_lab/hair_lab/chroma None = ausentes em todas.
+    Retorna {"subtom", "valor", "croma", "contraste", "estacao"}: arrays de strings (N,).
+    """
+    skin = np.asarray(skin_lab, dtype=np.float64).reshape(-1, 3)
+    n = len(skin)
+    sem_pele = np.isnan(skin).any(axis=1)
+
+    # Subtom: média com o braço onde houver braço; a primeira regra que casa decide
+    a_braco, b_braco = _coluna(braco_lab, n, 1), _coluna(braco_lab, n, 2)
+    com_braco = ~(np.isnan(a_braco) | np.isnan(b_braco))
+    a = np.where(com_braco, (skin[:, 1] + a_braco) / 2, skin[:, 1])
+    b = np.where(com_braco, (skin[:, 2] + b_braco) / 2, skin[:, 2])
+    tabela = regras["subtom"]
+    nomes_subtom = [regra[0] for regra in tabela["regras"]] + [tabela["senao"], tabela["ausente"]]
+    i_subtom = np.full(n, len(tabela["regras"]), dtype=np.intp)
+    for i in range(len(tabela["regras"]) - 1, -1, -1):
+        i_subtom[_casa(tabela["regras"][i], {"a": a, "b": b})] = i
+    i_subtom[sem_pele] = len(nomes_subtom) - 1
+
+    i_valor, nomes_valor = _faixa_lote(skin[:, 0], regras["valor"], np.isnan(skin[:, 0]))
+    c = np.full(n, np.nan) if chroma is None else np.asarray(chroma, dtype=np.float64).reshape(n)
+    i_croma, nomes_croma = _faixa_lote(c, regras["croma"], np.isnan(c) | (c < 0))
+    l_hair = _coluna(hair_lab, n, 0)
+    i_contraste, nomes_contraste = _faixa_lote(
+        np.abs(skin[:, 0] - l_hair), regras["contraste"], sem_pele | np.isnan(l_hair)
+    )
+
+    # Estação: (quente, claro, croma) → índice numa lista com todas as combinações
+    tabela = regras["estacao"]
+    quente = _pertence(nomes_subtom, tabela["quentes"])[i_subtom]
+    claro = _pertence(nomes_valor, tabela["claros"])[i_valor]
+    nomes_estacao = [
+        tabela["bases"][q + "_" + cl] + tabela["sufixos"].get(croma, "")
+        for q in ("frio", "quente") for cl in ("escuro", "claro") for croma in nomes_croma
+    ]
+    i_estacao = (quente.astype(np.intp) * 2 + claro) * len(nomes_croma) + i_croma
+
+    return {
+        "subtom": np.asarray(nomes_subtom)[i_subtom],
+        "valor": np.asarray(nomes_valor)[i_valor],
+        "croma": np.asarray(nomes_croma)[i_croma],
+        "contraste": np.asarray(nomes_contraste)[i_contraste],
+        "estacao": np.asarray(nomes_estacao)[i_estacao],
+    }
@@ -0,0 +1,184 @@
+"""
+Conversões de cor vetorizadas (NumPy): sRGB ↔ XYZ ↔ LAB, HEX ↔ arrays e delta E (CIE76 e CIEDE2000)
+entre conjuntos de cores N×M. Todas recebem e devolvem arrays (…×3), para pontuar milhares de cores
+de uma vez (ex.: catálogo de roupas contra a paleta do usuário).
+
+Constantes: LAB→sRGB segue exatamente o colormath (LabColor em D50 + Bradford para D65, como
+recommend.lab_to_hex); sRGB→LAB segue recommend.hex_to_lab (D65, sem adaptação). Conferido com
+scripts/valida_colorspace.py.
+"""
+import numpy as np
+
+D50 = np.array((0.96422, 1.00000, 0.82521))
+D65 = np.array((0.95047, 1.00000, 1.08883))
+
+_CIE_E = 216.0 / 24389.0
+
+_BRADFORD = np.array((
+    (0.8951, 0.2664, -0.1614),
+    (-0.7502, 1.7135, 0.0367),
+    (0.0389, -0.0685, 1.0296),
+))
+_SRGB_TO_XYZ = np.array((
+    (0.4124, 0.3576, 0.1805),
+    (0.2126, 0.7152, 0.0722),
+    (0.0193, 0.1192, 0.9505),
+))
+_XYZ_TO_SRGB = np.array((
+    (3.24071, -1.53726, -0.498571),
+    (-0.969258, 1.87599, 0.0415557),
+    (0.0556352, -0.203996, 1.05707),
+))
+
+
+def _as_colors(x):
+    """Array float64 com a última dimensão = 3."""
+    arr = np.asarray(x, dtype=np.float64)
+    if arr.shape[-1:] != (3,):
+        raise ValueError("esperado array (..., 3), recebido %r" % (arr.shape,))
+    return arr
+
+
+def bradford_matrix(src_white, dst_white):
+    """Matriz 3×3 de adaptação cromática de Bradford entre dois brancos de referência (XYZ)."""
+    ratio = np.diag(np.dot(_BRADFORD, dst_white) / np.dot(_BRADFORD, src_white))
+    return np.dot(np.dot(np.linalg.pinv(_BRADFORD), ratio), _BRADFORD)
+
+
+_D50_TO_D65 = bradford_matrix(D50, D65)
+
+
+def srgb_to_linear(rgb):
+    """sRGB com gamma (0..1) → linear."""
+    rgb = _as_colors(rgb)
+    return np.where(rgb <= 0.04045, rgb / 12.92, ((rgb + 0.055) / 1.055) ** 2.4)
+
+
+def linear_to_srgb(rgb):
+    """sRGB linear → com gamma (sem clamp)."""
+    rgb = _as_colors(rgb)
+    return np.where(rgb <= 0.0031308, rgb * 12.92, 1.055 * np.power(np.maximum(rgb, 0.0031308), 1 / 2.4) - 0.055)
+
+
+def srgb_to_xyz(rgb):
+    """sRGB (0..1, com gamma) → XYZ (D65)."""
+    return np.dot(srgb_to_linear(rgb), _SRGB_TO_XYZ.T)
+
+
+def xyz_to_srgb(xyz, clip=True):
+    """XYZ (D65) → sRGB (0..1, com gamma). Componentes lineares negativas viram 0; clip limita a 0..1."""
+    rgb = linear_to_srgb(np.maximum(np.dot(_as_colors(xyz), _XYZ_TO_SRGB.T), 0.0))
+    return np.clip(rgb, 0.0, 1.0) if clip else rgb
+
+
+def xyz_to_lab(xyz, white=D65):
+    """XYZ → LAB (L 0-100), relativo ao branco white."""
+    xyz = _as_colors(xyz) / white
+    f = np.where(xyz > 0.008856, np.cbrt(xyz), (7.787 * xyz) + (16 / 116))
+    return np.stack([116 * f[..., 1] - 16, 500 * (f[..., 0] - f[..., 1]), 200 * (f[..., 1] - f[..., 2])], axis=-1)
+
+
+def lab_to_xyz(lab, white=D50):
+    """LAB → XYZ relativo ao branco white (padrão D50, como LabColor do colormath)."""
+    lab = _as_colors(lab)
+    fy = (lab[..., 0] + 16.0) / 116.0
+    f = np.stack([lab[..., 1] / 500.0 + fy, fy, fy - lab[..., 2] / 200.0], axis=-1)
+    cube = f ** 3
+    return np.where(cube > _CIE_E, cube, (f - 16.0 / 116.0) / 7.787) * white
+
+
+def rgb_to_lab(rgb):
+    """sRGB (0..1) → LAB (D65), mesma conta de recommend.hex_to_lab."""
+    return xyz_to_lab(srgb_to_xyz(rgb), D65)
+
+
+def lab_to_rgb(lab, clip=True):
+    """LAB (D50) → sRGB (0..1) via Bradford para D65, mesma conta de recommend.lab_to_hex com colormath."""
+    return xyz_to_srgb(np.dot(lab_to_xyz(lab, D50), _D50_TO_D65.T), clip=clip)
+
+
+def hex_decode(hex_list):
+    """Lista de HEX ('#rrggbb', '#rrggbbff', 'rrggbb') → array N×3 uint8 (R, G, B)."""
+    if len(hex_list) == 0:
+        return np.zeros((0, 3), dtype=np.uint8)
+    raw = bytes.fromhex("".join(h.strip().lstrip("#")[:6] for h in hex_list))
+    return np.frombuffer(raw, dtype=np.uint8).reshape(-1, 3)
+
+
+def hex_encode(rgb_uint8):
+    """Array N×3 uint8 (R, G, B) → lista de HEX '#rrggbb'."""
+    rgb = np.ascontiguousarray(np.asarray(rgb_uint8, dtype=np.uint8).reshape(-1, 3))
+    hexes = rgb.tobytes().hex()
+    return ["#" + hexes[i:i + 6] for i in range(0, len(hexes), 6)]
+
+
+def hex_to_lab(hex_list):
+    """Lista de HEX → array N×3 LAB."""
+    return rgb_to_lab(hex_decode(hex_list) / 255.0)
+
+
+def lab_to_hex(lab):
+    """Array N×3 LAB → lista de HEX (trunca para 0..255, como lab_to_hex escalar)."""
+    rgb = lab_to_rgb(np.asarray(lab, dtype=np.float64).reshape(-1, 3))
+    return hex_encode((rgb * 255).astype(np.uint8))
+
+
+def delta_e_cie76(lab1, lab2):
+    """Delta E CIE76 (distância euclidiana) entre todas as cores: (N×3, M×3) → N×M."""
+    a = _as_colors(lab1).reshape(-1, 3)
+    b = _as_colors(lab2).reshape(-1, 3)
+    return np.sqrt(np.maximum(
+        (a * a).sum(axis=1)[:, None] + (b * b).sum(axis=1)[None, :] - 2.0 * np.dot(a, b.T), 0.0))
+
+
+def delta_e_ciede2000(lab1, lab2, kL=1.0, kC=1.0, kH=1.0):
+    """
+    Delta E CIEDE2000 (Sharma, Wu & Dalal 2005) entre todas as cores: (N×3, M×3) → N×M.
+    Conferido com os 34 pares de teste publicados pelos autores.
+    """
+    a = _as_colors(lab1).reshape(-1, 1, 3)
+    b = _as_colors(lab2).reshape(1, -1, 3)
+    L1, a1, b1 = a[..., 0], a[..., 1], a[..., 2]
+    L2, a2, b2 = b[..., 0], b[..., 1], b[..., 2]
+
+    C1 = np.hypot(a1, b1)
+    C2 = np.hypot(a2, b2)
+    C_bar7 = ((C1 + C2) / 2.0) ** 7
+    G = 0.5 * (1 - np.sqrt(C_bar7 / (C_bar7 + 25.0 ** 7)))
+    a1p = (1 + G) * a1
+    a2p = (1 + G) * a2
+    C1p = np.hypot(a1p, b1)
+    C2p = np.hypot(a2p, b2)
+    h1p = np.where((a1p == 0) & (b1 == 0), 0.0, np.degrees(np.arctan2(b1, a1p)) % 360)
+    h2p = np.where((a2p == 0) & (b2 == 0), 0.0, np.degrees(np.arctan2(b2, a2p)) % 360)
+
+    dLp = L2 - L1
+    dCp = C2p - C1p
+    zero_chroma = (C1p * C2p) == 0
+    dhp = h2p - h1p
+    dhp = np.where(dhp > 180, dhp - 360, np.where(dhp < -180, dhp + 360, dhp))
+    dhp = np.where(zero_chroma, 0.0, dhp)
+    dHp = 2 * np.sqrt(C1p * C2p) * np.sin(np.radians(dhp) / 2)
+
+    Lp_bar = (L1 + L2) / 2
+    Cp_bar = (C1p + C2p) / 2
+    h_sum = h1p + h2p
+    hp_bar = np.where(
+        zero_chroma, h_sum,
+        np.where(np.abs(h1p - h2p) <= 180, h_sum / 2,
+                 np.where(h_sum < 360, (h_sum + 360) / 2, (h_sum - 360) / 2)))
+
+    T = (1 - 0.17 * np.cos(np.radians(hp_bar - 30)) + 0.24 * np.cos(np.radians(2 * hp_bar))
+         + 0.32 * np.cos(np.radians(3 * hp_bar + 6)) - 0.20 * np.cos(np.radians(4 * hp_bar - 63)))
+    d_theta = 30 * np.exp(-(((hp_bar - 275) / 25) ** 2))
+    Cp_bar7 = Cp_bar ** 7
+    R_C = 2 * np.sqrt(Cp_bar7 / (Cp_bar7 + 25.0 ** 7))
+    S_L = 1 + (0.015 * (Lp_bar - 50) ** 2) / np.sqrt(20 + (Lp_bar - 50) ** 2)
+    S_C = 1 + 0.045 * Cp_bar
+    S_H = 1 + 0.015 * Cp_bar * T
+    R_T = -np.sin(np.radians(2 * d_theta)) * R_C
+
+    tL = dLp / (kL * S_L)
+    tC = dCp / (kC * S_C)
+    tH = dHp / (kH * S_H)
+    return np.sqrt(tL ** 2 + tC ** 2 + tH ** 2 + R_T * tC * tH)
@@ -0,0 +1,118 @@
+"""
+Configuração do serviço via variáveis de ambiente (Cloud Run / Render injetam pelo painel).
+Todas têm prefixo COLORIMETRIA_ e um padrão seguro para rodar localmente.
+"""
+import os
+
+
+def env_int(nome, padrao):
+    """Lê inteiro do ambiente; valor ausente ou inválido usa o padrão."""
+    valor = os.environ.get(nome)
+    if valor is None or valor.strip() == "":
+        return padrao
+    try:
+        return int(valor)
+    except ValueError:
+        return padrao
+
+
+def env_float(nome, padrao):
+    """Lê float do ambiente; valor ausente ou inválido usa o padrão."""
+    valor = os.environ.get(nome)
+    if valor is None or valor.strip() == "":
+        return padrao
+    try:
+        return float(valor)
+    except ValueError:
+        return padrao
+
+
+def env_bool(nome, padrao=False):
+    """Lê booleano do ambiente (1/true/sim/on)."""
+    valor = os.environ.get(nome)
+    if valor is None or valor.strip() == "":
+        return padrao
+    return valor.strip().lower() in ("1", "true", "sim", "yes", "on")
+
+
+def env_str(nome, padrao=None):
+    """Lê string do ambiente; vazio conta como ausente."""
+    valor = os.environ.get(nome)
+    if valor is None or valor.strip() == "":
+        return padrao
+    return valor.strip()
+
+
+# Pool de processos do /analisar. 0 = roda em thread no próprio processo (útil em dev).
+WORKERS = max(0, env_int("COLORIMETRIA_WORKERS", os.cpu_count() or 1))
+# Máximo de análises em andamento + aguardando; acima disso responde 503 com Retry-After.
+MAX_FILA = max(1, env_int("COLORIMETRIA_MAX_FILA", max(1, WORKERS) * 4))
+RETRY_AFTER_S = max(1, env_int("COLORIMETRIA_RETRY_AFTER", 5))
+# Threads do OpenCV em cada worker (com vários processos, 1 evita disputa por núcleo).
+THREADS_POR_WORKER = max(1, env_int("COLORIMETRIA_THREADS_POR_WORKER", 1))
+# Aquecimento na inicialização (cria o FaceMesh de cada worker antes da primeira requisição).
+AQUECER = env_bool("COLORIMETRIA_AQUECER", False)
+# Resolução de análise: lado maior (px) a que cada foto é reduzida antes do pipeline. 0 = resolução cheia.
+# Medido com scripts/bench_resolucao.py (referencia_cor ampliadas a 12–24 MP, max_side=1280): delta E76 do
+# mean_lab vs resolução cheia <= 0.5 no braço, <= 0.1 no cabelo e <= 0.95 no rosto (a máscara do rosto é a
+# envoltória convexa dos landmarks, estável entre resoluções). Ganho de 8x a 65x.
+MAX_LADO = max(0, env_int("COLORIMETRIA_MAX_LADO", 1280))
+# Motor de agrupamento das cores dominantes (extract.CLUSTER_ENGINES). "histograma" ficou a <= 0.6 dE76
+# do KMeans exato nas referências (scripts/bench_clusters.py) e ~20x mais rápido em fotos de 12 MP.
+CLUSTER_ENGINE = env_str("COLORIMETRIA_CLUSTER", "histograma")
+# Cache de respostas do /analisar (chave = hash das fotos + calibração + versão). 0 = desligado.
+CACHE_MAX_MB = max(0.0, env_float("COLORIMETRIA_CACHE_MB", 64.0))
+# Camada em disco (SQLite) compartilhada entre workers/instâncias da mesma máquina; vazio = só memória.
+CACHE_SQLITE = env_str("COLORIMETRIA_CACHE_SQLITE")
+CACHE_SQLITE_MAX_ITENS = max(0, env_int("COLORIMETRIA_CACHE_SQLITE_MAX_ITENS", 10000))
+# Cache de features por foto (em cada worker), para reenvios em que só uma foto mudou. 0 = desligado.
+FEATURES_CACHE_MB = max(0.0, env_float("COLORIMETRIA_FEATURES_CACHE_MB", 16.0))
+# /analisar/lote: quantas pessoas do lote ficam no pool ao mesmo tempo (o resto espera, sem 503).
+LOTE_CONCORRENCIA = max(1, env_int("COLORIMETRIA_LOTE_CONCORRENCIA", max(1, WORKERS)))
+# Tetos de upload (MiB): por foto, por requisição do /analisar e por lote. Acima disso, 413.
+MAX_FOTO_MB = max(0.0, env_float("COLORIMETRIA_MAX_FOTO_MB", 20.0))
+MAX_REQUISICAO_MB = max(0.0, env_float("COLORIMETRIA_MAX_REQUISICAO_MB", 50.0))
+# Teto do corpo de /analisar/features (resumos das regiões; um resumo 32³ típico tem poucos KB).
+MAX_FEATURES_MB = max(0.0, env_float("COLORIMETRIA_MAX_FEATURES_MB", 4.0))
+MAX_LOTE_MB = max(0.0, env_float("COLORIMETRIA_MAX_LOTE_MB", 512.0))
+# Métricas por etapa (GET /metricas, formato Prometheus). 0 = desligadas (medição vira no-op).
+METRICAS = env_bool("COLORIMETRIA_METRICAS", True)
+# Devolve também em metadados.metricas as etapas e medidas de cada análise (depuração).
+METRICAS_NA_RESPOSTA = env_bool("COLORIMETRIA_METRICAS_NA_RESPOSTA", False)
+# Perfis de calibração extras (<nome>.json, por câmera/cliente) além de processing/calib.json ("padrao").
+CALIB_DIR = env_str("COLORIMETRIA_CALIB_DIR")
+# Perfil usado quando a requisição não escolhe um.
+CALIB_PERFIL = env_str("COLORIMETRIA_CALIB_PERFIL", "padrao")
+# Intervalo (s) do vigia que relê os arquivos de calibração alterados. 0 = só no arranque/endpoint de admin.
+CALIB_RECARREGAR_S = max(0.0, env_float("COLORIMETRIA_CALIB_RECARREGAR_S", 0.0))
+# Token dos endpoints de admin (cabeçalho X-Admin-Token). Vazio = endpoints de admin desligados.
+ADMIN_TOKEN = env_str("COLORIMETRIA_ADMIN_TOKEN")
+# POST /analisar/jobs: quanto tempo (s) um job fica consultável depois da última atualização.
+JOBS_TTL_S = max(1.0, env_float("COLORIMETRIA_JOBS_TTL_S", 3600.0))
+# Jobs guardados em memória (os terminados mais antigos saem primeiro) e teto de jobs na fila/processando (acima, 503).
+JOBS_MAX = max(1, env_int("COLORIMETRIA_JOBS_MAX", 1000))
+JOBS_MAX_PENDENTES = max(1, env_int("COLORIMETRIA_JOBS_MAX_PENDENTES", MAX_FILA * 8))
+# Jobs rodando ao mesmo tempo no pool (os demais esperam na fila do job, sem 503).
+JOBS_CONCORRENCIA = max(1, env_int("COLORIMETRIA_JOBS_CONCORRENCIA", max(1, WORKERS)))
+# Jobs também em SQLite (sobrevivem a reinício; vistos por outros processos da máquina); vazio = só memória.
+JOBS_SQLITE = env_str("COLORIMETRIA_JOBS_SQLITE")
+# Hosts aceitos em callback_url (separados por vírgula; subdomínios incluídos). Vazio = callbacks desligados.
+JOBS_CALLBACK_HOSTS = tuple(
+    h.strip().lower() for h in env_str("COLORIMETRIA_JOBS_CALLBACK_HOSTS", "").split(",") if h.strip()
+)
+# Catálogo de produtos do /combinar (CSV sku,hex ou sku,L,a,b; ou JSONL), carregado no arranque. Vazio = sem catálogo.
+CATALOGO = env_str("COLORIMETRIA_CATALOGO")
+# Lado (ΔE76) das células da grade do índice; perto do ΔE típico das consultas.
+CATALOGO_CELULA = max(0.5, env_float("COLORIMETRIA_CATALOGO_CELULA", 5.0))
+# ΔE76 máximo padrão entre uma cor da paleta e um SKU no /combinar, e teto de k (SKUs por cor consultada).
+CATALOGO_DELTA_E = max(0.0, env_float("COLORIMETRIA_CATALOGO_DELTA_E", 10.0))
+CATALOGO_K_MAX = max(1, env_int("COLORIMETRIA_CATALOGO_K_MAX", 500))
+# Threads por processo que analisam braço e cabelo enquanto o rosto roda na thread da análise (pool
+# compartilhado por todas as análises do processo). 0 = fotos uma depois da outra.
+THREADS_FOTOS = max(0, env_int("COLORIMETRIA_THREADS_FOTOS", 2))
+# Modelo de pele em tabela de cores (.npz de scripts/treinar_pele_lut.py) no lugar das regras HSV de
+# segment_skin_region. Vazio = regras HSV.
+PELE_LUT = env_str("COLORIMETRIA_PELE_LUT")
+# Folga da caixa do rosto (proporção do lado da caixa dos landmarks; mínimo de 12 px): a pele do rosto e os
+# pixels da região saem só desse recorte da foto.
+ROSTO_MARGEM = max(0.0, env_float("COLORIMETRIA_ROSTO_MARGEM", 0.1))
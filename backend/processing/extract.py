@@ -2,9 +2,11 @@
 Extração de características cromáticas: média, mediana, k-means, descarte de outliers.
 """
 import numpy as np
-from sklearn.cluster import KMeans
 
+from processing import histograma, metrics
 
+
+@metrics.medir()
 def discard_outliers(pixels_lab, l_min=15, l_max=95, c_max=80):
     """
     Descarta highlights, sombras e reflexos (L muito alto/baixo, croma extremo).
@@ -20,23 +22,168 @@ def discard_outliers(pixels_lab, l_min=15, l_max=95, c_max=80):
     return out if len(out) > 10 else pixels_lab
 
 
-def dominant_clusters(pixels_lab, n_clusters=3):
-    """K-means nas cores, retorna centros e proporções."""
+# Caminho compacto: LAB uint8 do OpenCV (L8, a8, b8) → L = L8 * 100/255, a = a8 - 128, b = b8 - 128,
+# com a mesma aritmética float32 de preprocess.lab_to_float. Cada canal tem só 256 níveis, então descarte
+# e estatísticas saem de tabelas e histogramas (processing.histograma); float só nos agregados e no agrupamento.
+
+
+def lab_uint8_to_float(pixels_u8):
+    """Pixels LAB uint8 (Nx3) para LAB float32 (L 0-100, a,b -128..127), como preprocess.lab_to_float."""
+    pixels = pixels_u8.astype(np.float32)
+    pixels[:, 0] *= np.float32(100 / 255)
+    pixels[:, 1:] -= 128
+    return pixels
+
+
+@metrics.medir("discard_outliers")
+def discard_outliers_uint8(pixels_u8, l_min=15, l_max=95, c_max=80):
+    """
+    discard_outliers para pixels LAB uint8 do OpenCV (Nx3): mesmo critério, sem converter a região para float.
+    L vem de uma tabela de 256 níveis; o croma é comparado ao quadrado, em inteiros.
+    """
+    if pixels_u8 is None or len(pixels_u8) == 0:
+        return pixels_u8
+    l_ok = (histograma.NIVEIS_L >= l_min) & (histograma.NIVEIS_L <= l_max)
+    a = pixels_u8[:, 1].astype(np.int32) - 128
+    b = pixels_u8[:, 2].astype(np.int32) - 128
+    mask = l_ok[pixels_u8[:, 0]] & (a * a + b * b <= c_max * c_max)
+    out = pixels_u8[mask]
+    return out if len(out) > 10 else pixels_u8
+
+
+def _cores_distintas(pixels_u8):
+    """Cores LAB uint8 distintas da região (Kx3) e quantos pixels tem cada uma: código de 24 bits + np.unique."""
+    codigos = pixels_u8[:, 0].astype(np.int32) << 16
+    codigos |= pixels_u8[:, 1].astype(np.int32) << 8
+    codigos |= pixels_u8[:, 2]
+    uniq, contagens = np.unique(codigos, return_counts=True)
+    cores = np.stack([uniq >> 16, (uniq >> 8) & 255, uniq & 255], axis=1).astype(np.uint8)
+    return cores, contagens
+
+
+# Motores de agrupamento de dominant_clusters:
+#  "kmeans"     KMeans exato sobre todos os pixels (comportamento original; o mais lento)
+#  "minibatch"  MiniBatchKMeans sobre subamostra estratificada (max_samples)
+#  "histograma" KMeans ponderado sobre os pixels agrupados em caixas LAB de bin_size (um ponto por caixa ocupada)
+CLUSTER_ENGINES = ("kmeans", "minibatch", "histograma")
+CLUSTER_SEED = 42
+DEFAULT_MAX_SAMPLES = 20000
+
+
+def subsample_stratified(pixels_lab, max_samples=DEFAULT_MAX_SAMPLES, n_strata=16, seed=CLUSTER_SEED):
+    """
+    Subamostra até max_samples pixels, estratificada por faixas de L: cada faixa entra na proporção
+    em que aparece, então sombras e realces pouco frequentes não somem. Determinística (seed fixa).
+    """
+    n = len(pixels_lab)
+    if max_samples is None or n <= max_samples:
+        return pixels_lab
+    rng = np.random.default_rng(seed)
+    L = pixels_lab[:, 0].astype(np.float64)
+    lo, hi = float(L.min()), float(L.max())
+    if hi <= lo:
+        return pixels_lab[np.sort(rng.choice(n, max_samples, replace=False))]
+    strata = np.minimum(((L - lo) / (hi - lo) * n_strata).astype(np.int64), n_strata - 1)
+    counts = np.bincount(strata, minlength=n_strata)
+    quotas = np.floor(counts * (max_samples / float(n))).astype(np.int64)
+    # Distribui o que sobrou do arredondamento para os estratos com maior parte fracionária
+    rest = max_samples - int(quotas.sum())
+    if rest > 0:
+        frac = counts * (max_samples / float(n)) - quotas
+        quotas[np.argsort(-frac, kind="stable")[:rest]] += 1
+    # Ordena por (estrato, chave aleatória) e fica com os primeiros quota[estrato] de cada estrato
+    order = np.lexsort((rng.random(n), strata))
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    pos = np.arange(n) - starts[strata[order]]
+    keep = order[pos < quotas[strata[order]]]
+    return pixels_lab[np.sort(keep)]
+
+
+def _histogram_bins(pixels_lab, bin_size, weights=None):
+    """
+    Agrupa pixels em caixas LAB de bin_size: retorna (média LAB de cada caixa ocupada, contagem).
+    weights: peso de cada ponto (ex.: cores distintas com o nº de pixels de cada uma); a contagem vira a soma dos pesos.
+    """
+    px = np.asarray(pixels_lab, dtype=np.float64)
+    q = np.floor((px - px.min(axis=0)) / bin_size).astype(np.int64)
+    dims = q.max(axis=0) + 1
+    keys = (q[:, 0] * dims[1] + q[:, 1]) * dims[2] + q[:, 2]
+    if weights is None:
+        uniq, inverse, counts = np.unique(keys, return_inverse=True, return_counts=True)
+        sums = np.stack([np.bincount(inverse, weights=px[:, c], minlength=len(uniq)) for c in range(3)], axis=1)
+    else:
+        uniq, inverse = np.unique(keys, return_inverse=True)
+        counts = np.bincount(inverse, weights=weights, minlength=len(uniq))
+        sums = np.stack([np.bincount(inverse, weights=px[:, c] * weights, minlength=len(uniq)) for c in range(3)], axis=1)
+    return sums / counts[:, None], counts
+
+
+@metrics.medir()
+def dominant_clusters(pixels_lab, n_clusters=3, engine="kmeans", max_samples=None, bin_size=2.0, sample_weight=None):
+    """
+    K-means nas cores, retorna centros e proporções.
+    engine: um de CLUSTER_ENGINES. max_samples: teto de pixels (subamostra estratificada) para
+    "kmeans"/"minibatch" (padrão DEFAULT_MAX_SAMPLES no minibatch). bin_size: caixa LAB do "histograma".
+    sample_weight: peso de cada ponto (só no "histograma"): cores distintas + nº de pixels de cada uma
+    agrupam igual aos pixels repetidos.
+    """
     if pixels_lab is None or len(pixels_lab) < n_clusters:
         return [], []
+    # sklearn (+ scipy) custa ~1.5 s para importar: só entra quando há o que agrupar, fora do arranque do app
+    from sklearn.cluster import KMeans, MiniBatchKMeans
+    if engine not in CLUSTER_ENGINES:
+        raise ValueError("engine de cluster desconhecido: %r (use %s)" % (engine, ", ".join(CLUSTER_ENGINES)))
+    if sample_weight is not None and engine != "histograma":
+        raise ValueError("sample_weight só vale para o engine 'histograma'")
     n = min(n_clusters, len(pixels_lab))
-    kmeans = KMeans(n_clusters=n, random_state=42, n_init=10)
-    labels = kmeans.fit_predict(pixels_lab)
+    if engine == "histograma":
+        points, weights = _histogram_bins(pixels_lab, bin_size, sample_weight)
+        if len(points) < n:
+            points = np.asarray(pixels_lab, dtype=np.float64)
+            weights = np.ones(len(pixels_lab)) if sample_weight is None else np.asarray(sample_weight, dtype=np.float64)
+        kmeans = KMeans(n_clusters=n, random_state=CLUSTER_SEED, n_init=10)
+        labels = kmeans.fit_predict(points, sample_weight=weights)
+        counts = np.bincount(labels, weights=weights, minlength=n)
+    else:
+        if engine == "minibatch" and max_samples is None:
+            max_samples = DEFAULT_MAX_SAMPLES
+        sample = subsample_stratified(pixels_lab, max_samples)
+        if engine == "minibatch":
+            kmeans = MiniBatchKMeans(n_clusters=n, random_state=CLUSTER_SEED, n_init=3, batch_size=2048)
+        else:
+            kmeans = KMeans(n_clusters=n, random_state=CLUSTER_SEED, n_init=10)
+        labels = kmeans.fit_predict(sample)
+        counts = np.bincount(labels, minlength=n)
     centers = kmeans.cluster_centers_
-    counts = np.bincount(labels, minlength=n)
     props = counts / counts.sum()
     return centers.tolist(), props.tolist()
 
 
-def extract_region_features(pixels_lab):
+def compare_clusters(centers_a, props_a, centers_b, props_b):
+    """
+    Compara dois resultados de dominant_clusters casando os centros (melhor permutação).
+    Retorna (maior delta E76 entre centros casados, maior diferença de proporção).
+    """
+    from itertools import permutations
+    a, b = np.asarray(centers_a, dtype=np.float64), np.asarray(centers_b, dtype=np.float64)
+    if len(a) == 0 or len(a) != len(b):
+        return float("inf"), float("inf")
+    best = None
+    for perm in permutations(range(len(b))):
+        de = np.linalg.norm(a - b[list(perm)], axis=1)
+        if best is None or de.sum() < best[0].sum():
+            best = (de, perm)
+    de, perm = best
+    dp = np.abs(np.asarray(props_a) - np.asarray(props_b)[list(perm)])
+    return float(de.max()), float(dp.max())
+
+
+def extract_region_features(pixels_lab, cluster_engine="kmeans", max_samples=None):
     """
-    Para uma região (pele, cabelo etc.): média, mediana, clusters.
-    Retorna dict com mean_lab, median_lab, clusters, chroma_mean.
+    Para uma região (pele, cabelo etc.): média, mediana, média aparada, percentis, clusters.
+    cluster_engine / max_samples: repassados a dominant_clusters (as estatísticas usam sempre todos os pixels).
+    Retorna dict com mean_lab, median_lab, trimmed_mean_lab, percentiles_lab, clusters, chroma_mean.
+    Caminho de referência para LAB float qualquer; o servidor usa extract_region_features_uint8.
     """
     if pixels_lab is None or len(pixels_lab) == 0:
         return None
@@ -45,14 +192,57 @@ def extract_region_features(pixels_lab):
         return None
     mean_lab = np.mean(pixels, axis=0).tolist()
     median_lab = np.median(pixels, axis=0).tolist()
-    centers, props = dominant_clusters(pixels, n_clusters=3)
+    ordenados = np.sort(pixels, axis=0).astype(np.float64)
+    corte = int(histograma.APARAR * len(pixels))
+    trimmed_mean_lab = ordenados[corte:len(pixels) - corte].mean(axis=0).tolist()
+    percentiles_lab = {
+        "p%g" % q: v.tolist() for q, v in zip(histograma.PERCENTIS, np.percentile(ordenados, histograma.PERCENTIS, axis=0))
+    }
+    centers, props = dominant_clusters(pixels, n_clusters=3, engine=cluster_engine, max_samples=max_samples)
     l, a, b = mean_lab[0], mean_lab[1], mean_lab[2]
     chroma = np.sqrt(a * a + b * b)
     return {
         "mean_lab": mean_lab,
         "median_lab": median_lab,
+        "trimmed_mean_lab": trimmed_mean_lab,
+        "percentiles_lab": percentiles_lab,
         "clusters": centers,
         "cluster_proportions": props,
         "chroma_mean": float(chroma),
         "n_pixels": int(len(pixels)),
     }
+
+
+def extract_region_features_uint8(pixels_u8, cluster_engine="kmeans", max_samples=None):
+    """
+    extract_region_features para pixels LAB uint8 do OpenCV (Nx3, de segment.get_region_pixels_uint8).
+    Descarte e estatísticas (média, mediana, média aparada, percentis) dos histogramas de 256 níveis,
+    numa passada, sem ordenar. No agrupamento "histograma" entram só as cores
+    distintas, com o nº de pixels de cada uma como peso; nos outros motores, os pixels em float32.
+    Mesmo dict de saída (média exata em float64; a do caminho float32 difere na 4ª-5ª casa).
+    """
+    if pixels_u8 is None or len(pixels_u8) == 0:
+        return None
+    pixels = discard_outliers_uint8(pixels_u8)
+    estat = histograma.resumo(pixels)
+    mean_lab = estat["media"]
+    if cluster_engine == "histograma" and len(pixels) >= 3:
+        cores, contagens = _cores_distintas(pixels)
+        centers, props = dominant_clusters(
+            lab_uint8_to_float(cores), n_clusters=3, engine=cluster_engine, sample_weight=contagens.astype(np.float64)
+        )
+    else:
+        centers, props = dominant_clusters(
+            lab_uint8_to_float(pixels), n_clusters=3, engine=cluster_engine, max_samples=max_samples
+        )
+    a, b = mean_lab[1], mean_lab[2]
+    return {
+        "mean_lab": mean_lab,
+        "median_lab": estat["mediana"],
+        "trimmed_mean_lab": estat["media_aparada"],
+        "percentiles_lab": estat["percentis"],
+        "clusters": centers,
+        "cluster_proportions": props,
+        "chroma_mean": float(np.sqrt(a * a + b * b)),
+        "n_pixels": int(len(pixels)),
+    }
@@ -0,0 +1,100 @@
+"""
+Estatísticas por canal a partir de histogramas de 256 níveis (LAB uint8 do OpenCV).
+
+Uma passada sobre os pixels da região monta os três histogramas (um np.bincount só); média, mediana,
+média aparada e qualquer percentil saem da soma acumulada, em O(256) cada, sem ordenar nem copiar pixels.
+Os valores são devolvidos nas unidades LAB do pipeline (L 0-100, a,b -128..127).
+"""
+import numpy as np
+
+# Percentis que extract devolve em "percentiles_lab" e proporção cortada em cada ponta da média aparada
+PERCENTIS = (5, 10, 25, 50, 75, 90, 95)
+APARAR = 0.1
+
+# Valor float32 de cada nível, como preprocess.lab_to_float: L = L8 * 100/255, a,b = a8/b8 - 128
+NIVEIS_L = np.arange(256, dtype=np.float32) * np.float32(100 / 255)
+NIVEIS_AB = np.arange(256, dtype=np.float32) - np.float32(128)
+NIVEIS = np.stack([NIVEIS_L, NIVEIS_AB, NIVEIS_AB])
+_DESLOCAMENTO = np.array([0, 256, 512], dtype=np.int32)
+
+
+def histogramas(pixels_u8):
+    """Histogramas (3, 256) dos canais de pixels LAB uint8 (Nx3), numa única passada."""
+    if len(pixels_u8) == 0:
+        return np.zeros((3, 256), dtype=np.int64)
+    indices = pixels_u8.astype(np.int32)
+    indices += _DESLOCAMENTO
+    return np.bincount(indices.ravel(), minlength=768).reshape(3, 256)
+
+
+def _ordem(acumulado, k):
+    """Nível do k-ésimo menor valor (0-based), dado o histograma acumulado."""
+    return int(np.searchsorted(acumulado, k, side="right"))
+
+
+def media(hist, niveis=NIVEIS):
+    """Média por canal (float64 exata sobre os níveis)."""
+    n = hist[0].sum()
+    return [float(np.dot(hist[c], niveis[c].astype(np.float64)) / n) for c in range(len(hist))]
+
+
+def mediana(hist, niveis=NIVEIS):
+    """Mediana por canal; igual a np.median sobre os valores float32 (média dos dois centrais se N é par)."""
+    n = int(hist[0].sum())
+    saida = []
+    for c in range(len(hist)):
+        acumulado = np.cumsum(hist[c])
+        baixo = niveis[c][_ordem(acumulado, (n - 1) // 2)]
+        alto = niveis[c][_ordem(acumulado, n // 2)]
+        saida.append(float((baixo + alto) / np.float32(2)))
+    return saida
+
+
+def percentis(hist, qs=PERCENTIS, niveis=NIVEIS):
+    """
+    {"p<q>": [canal0, canal1, canal2]} com interpolação linear entre estatísticas de ordem, como o
+    np.percentile padrão: posição q/100 * (N-1).
+    """
+    n = int(hist[0].sum())
+    acumulados = [np.cumsum(h) for h in hist]
+    saida = {}
+    for q in qs:
+        pos = q / 100.0 * (n - 1)
+        k = int(np.floor(pos))
+        frac = pos - k
+        valores = []
+        for c, acumulado in enumerate(acumulados):
+            v0 = float(niveis[c][_ordem(acumulado, k)])
+            v1 = float(niveis[c][_ordem(acumulado, min(k + 1, n - 1))]) if frac > 0 else v0
+            valores.append(v0 + (v1 - v0) * frac)
+        saida["p%g" % q] = valores
+    return saida
+
+
+def media_aparada(hist, proporcao=APARAR, niveis=NIVEIS):
+    """
+    Média por canal sem os int(proporcao * N) menores e maiores valores de cada canal (como
+    scipy.stats.trim_mean). Sem nada a cortar, igual à média.
+    """
+    n = int(hist[0].sum())
+    k = int(proporcao * n)
+    if k <= 0 or n - 2 * k <= 0:
+        return media(hist, niveis)
+    saida = []
+    for c in range(len(hist)):
+        # Quantos pixels de cada nível sobram depois de tirar k de baixo e k de cima
+        acumulado = np.clip(np.cumsum(hist[c]) - k, 0, n - 2 * k)
+        mantidos = np.diff(acumulado, prepend=0)
+        saida.append(float(np.dot(mantidos, niveis[c].astype(np.float64)) / (n - 2 * k)))
+    return saida
+
+
+def resumo(pixels_u8, qs=PERCENTIS, aparar=APARAR):
+    """Média, mediana, média aparada e percentis dos pixels LAB uint8 (Nx3), a partir de uma só passada."""
+    hist = histogramas(pixels_u8)
+    return {
+        "media": media(hist),
+        "mediana": mediana(hist),
+        "media_aparada": media_aparada(hist, aparar),
+        "percentis": percentis(hist, qs),
+    }
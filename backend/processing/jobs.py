@@ -0,0 +1,282 @@
+"""
+Análises assíncronas (POST /analisar/jobs): estado de cada job, com expiração, e deduplicação por conteúdo.
+
+Cada job é um dict JSON {"id", "status", "criado", "atualizado", "resultado" | "erro", ...}; status vai de
+"na_fila" a "processando" e termina em "concluido" ou "erro". Fica em memória (LRU por última atualização,
+expira JOBS_TTL_S depois dela) e, com JOBS_SQLITE, também em disco: outro processo da mesma máquina, ou
+o mesmo depois de reiniciar, continua respondendo GET /analisar/jobs/{id}. Submissões com as mesmas fotos
+(+ perfil/opções: a chave do cache de respostas) caem no job já existente enquanto ele não expira nem falha.
+
+Callbacks: só para hosts de JOBS_CALLBACK_HOSTS (lista vazia = callbacks desligados) que resolvem para
+endereços públicos; o endereço é conferido de novo na conexão (DNS que muda entre a validação e o envio) e
+redirecionamentos não são seguidos. Assim o endpoint público não vira proxy para a rede interna (metadados
+da nuvem, loopback, RFC 1918).
+"""
+import http.client
+import ipaddress
+import json
+import socket
+import sqlite3
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+from collections import OrderedDict
+
+from processing.cache import SQLiteCache
+
+PENDENTES = ("na_fila", "processando")
+
+
+class CallbackInvalido(ValueError):
+    """callback_url sem http(s), fora dos hosts permitidos ou com endereço não público (vira HTTP 400)."""
+
+
+class Jobs:
+    """Jobs em memória (+ SQLite opcional). Thread-safe; as operações são O(1) fora a limpeza dos expirados."""
+
+    def __init__(self, ttl_s=3600.0, max_itens=1000, sqlite_path=None):
+        self.ttl_s = ttl_s
+        self.max_itens = max(1, int(max_itens))
+        self._jobs = OrderedDict()   # id → job, do mais antigo para o mais recentemente atualizado
+        self._por_chave = {}         # chave de conteúdo → id
+        self._lock = threading.Lock()
+        # Em disco cabem 10x mais (os mais antigos saem); os expirados são ignorados na leitura
+        self.disco = SQLiteCache(sqlite_path, max_items=max(10000, self.max_itens * 10)) if sqlite_path else None
+
+    def __len__(self):
+        return len(self._jobs)
+
+    def pendentes(self):
+        with self._lock:
+            return sum(1 for job in self._jobs.values() if job["status"] in PENDENTES)
+
+    def _expirar(self, agora):
+        """
+        Remove da memória os expirados (estão no início) e, acima de max_itens, os terminados mais antigos.
+        Um job na fila ou processando nunca sai: a análise dele ainda vai gravar o resultado. Com o lock.
+        """
+        while self._jobs:
+            job_id, job = next(iter(self._jobs.items()))
+            if job["expira"] > agora:
+                break
+            if job["status"] in PENDENTES:
+                # Fila mais longa que o TTL: o job segue valendo (vai para o fim, com a expiração renovada)
+                job["expira"] = agora + self.ttl_s
+                self._jobs.move_to_end(job_id)
+                continue
+            self._remover(job_id, job)
+        if len(self._jobs) > self.max_itens:
+            terminados = [(i, j) for i, j in self._jobs.items() if j["status"] not in PENDENTES]
+            for job_id, job in terminados[:len(self._jobs) - self.max_itens]:
+                self._remover(job_id, job)
+
+    def _remover(self, job_id, job):
+        del self._jobs[job_id]
+        if self._por_chave.get(job.get("chave")) == job_id:
+            del self._por_chave[job["chave"]]
+
+    def lotado(self):
+        """True se a memória está cheia só de jobs pendentes (um job novo não teria onde ficar)."""
+        agora = time.time()
+        with self._lock:
+            self._expirar(agora)
+            return len(self._jobs) >= self.max_itens and all(j["status"] in PENDENTES for j in self._jobs.values())
+
+    def _gravar(self, job):
+        if self.disco is None:
+            return
+        try:
+            self.disco.set("job:" + job["id"], json.dumps(job, ensure_ascii=False).encode("utf-8"))
+            if job.get("chave"):
+                self.disco.set("chave:" + job["chave"], job["id"].encode("utf-8"))
+        except sqlite3.Error:
+            pass
+
+    def _ler_disco(self, job_id, agora):
+        if self.disco is None:
+            return None
+        try:
+            raw = self.disco.get("job:" + job_id)
+        except sqlite3.Error:
+            return None
+        job = json.loads(raw) if raw else None
+        return job if job is not None and job["expira"] > agora else None
+
+    def _da_chave(self, chave, agora):
+        """Job vigente (não expirado, sem erro) para a chave de conteúdo, da memória ou do disco. Com o lock."""
+        job_id = self._por_chave.get(chave)
+        job = self._jobs.get(job_id) if job_id else None
+        if job is None and self.disco is not None:
+            try:
+                raw = self.disco.get("chave:" + chave)
+            except sqlite3.Error:
+                raw = None
+            job = self._ler_disco(raw.decode("utf-8"), agora) if raw else None
+        return job if job is not None and job["status"] != "erro" else None
+
+    def obter_por_chave(self, chave):
+        agora = time.time()
+        with self._lock:
+            self._expirar(agora)
+            job = self._da_chave(chave, agora)
+            return dict(job) if job is not None else None
+
+    def criar(self, chave=None, callbacks=()):
+        """
+        Novo job na fila, ou o que já existe para a mesma chave (pendente ou concluído, não expirado).
+        Retorna (cópia do job, novo: bool).
+        """
+        agora = time.time()
+        with self._lock:
+            self._expirar(agora)
+            job = self._da_chave(chave, agora) if chave else None
+            if job is not None:
+                return dict(job), False
+            job = {
+                "id": uuid.uuid4().hex, "status": "na_fila", "criado": agora, "atualizado": agora,
+                "expira": agora + self.ttl_s, "chave": chave, "callbacks": list(callbacks),
+            }
+            self._jobs[job["id"]] = job
+            if chave:
+                self._por_chave[chave] = job["id"]
+            self._expirar(agora)
+            self._gravar(job)
+            return dict(job), True
+
+    def obter(self, job_id):
+        """Cópia do job (da memória ou do disco) ou None se não existe/expirou."""
+        agora = time.time()
+        with self._lock:
+            self._expirar(agora)
+            job = self._jobs.get(job_id)
+            if job is None:
+                job = self._ler_disco(job_id, agora)
+            return dict(job) if job is not None else None
+
+    def atualizar(self, job_id, **campos):
+        """Atualiza campos (status, resultado, erro, callback...) e renova a expiração."""
+        agora = time.time()
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                job = self._ler_disco(job_id, agora)
+                if job is None:
+                    return None
+                self._jobs[job_id] = job
+            job.update(campos, atualizado=agora, expira=agora + self.ttl_s)
+            self._jobs.move_to_end(job_id)
+            if job["status"] == "erro" and self._por_chave.get(job.get("chave")) == job_id:
+                # Um job que falhou não segura a chave: a próxima submissão tenta de novo
+                del self._por_chave[job["chave"]]
+            self._gravar(job)
+            return dict(job)
+
+
+def publico(job):
+    """O job como vai na resposta (sem a chave de conteúdo nem a expiração interna)."""
+    saida = {k: v for k, v in job.items() if k not in ("chave", "expira")}
+    saida["expira_em"] = round(job["expira"], 3)
+    return saida
+
+
+def _endereco_publico(endereco):
+    """True se o IP é roteável na internet (não loopback, privado, link-local, reservado, multicast...)."""
+    try:
+        ip = ipaddress.ip_address(endereco.split("%", 1)[0])
+    except ValueError:
+        return False
+    if getattr(ip, "ipv4_mapped", None) is not None:
+        ip = ip.ipv4_mapped
+    return ip.is_global and not ip.is_multicast
+
+
+def conferir_callback(url, hosts_permitidos=()):
+    """
+    Valida callback_url: http(s), host igual a um permitido ou subdomínio dele (sem lista: recusado) e todos
+    os endereços do host públicos. Bloqueante (resolve o DNS): rode numa thread.
+    """
+    if not hosts_permitidos:
+        raise CallbackInvalido("callback_url desativado neste servidor (COLORIMETRIA_JOBS_CALLBACK_HOSTS vazio).")
+    partes = urllib.parse.urlsplit(url)
+    if partes.scheme not in ("http", "https") or not partes.hostname:
+        raise CallbackInvalido("callback_url deve ser uma URL http(s).")
+    host = partes.hostname.lower()
+    if not any(host == h or host.endswith("." + h) for h in hosts_permitidos):
+        raise CallbackInvalido("Host de callback_url não permitido: %s." % host)
+    try:
+        porta = partes.port
+        enderecos = {info[4][0] for info in socket.getaddrinfo(host, porta, type=socket.SOCK_STREAM)}
+    except (OSError, ValueError):
+        raise CallbackInvalido("Host de callback_url não resolvido: %s." % host)
+    if not enderecos or not all(_endereco_publico(e) for e in enderecos):
+        raise CallbackInvalido("callback_url aponta para um endereço não público: %s." % host)
+    return url
+
+
+def _conferir_par(conexao):
+    """Depois de conectar: o endereço de fato usado também tem de ser público (DNS pode ter mudado)."""
+    if not _endereco_publico(conexao.sock.getpeername()[0]):
+        conexao.close()
+        raise OSError("callback_url resolveu para um endereço não público.")
+
+
+class _ConexaoHTTP(http.client.HTTPConnection):
+    def connect(self):
+        super().connect()
+        _conferir_par(self)
+
+
+class _ConexaoHTTPS(http.client.HTTPSConnection):
+    def connect(self):
+        super().connect()
+        _conferir_par(self)
+
+
+class _SoPublicoHTTP(urllib.request.HTTPHandler):
+    def http_open(self, req):
+        return self.do_open(_ConexaoHTTP, req)
+
+
+class _SoPublicoHTTPS(urllib.request.HTTPSHandler):
+    def https_open(self, req):
+        return self.do_open(_ConexaoHTTPS, req, context=self._context)
+
+
+class _SemRedirecionar(urllib.request.HTTPRedirectHandler):
+    """3xx volta como HTTPError (o destino do redirecionamento não passou pela validação)."""
+
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+
+# Sem proxy do ambiente: o endereço conferido na conexão tem de ser o do destino
+_ABRIR = urllib.request.build_opener(
+    urllib.request.ProxyHandler({}), _SoPublicoHTTP, _SoPublicoHTTPS, _SemRedirecionar,
+).open
+
+
+def enviar_callback(url, corpo, tentativas=3, timeout_s=10.0, espera_s=1.0):
+    """
+    POST do JSON corpo em url (bloqueante: rode numa thread). Repete em erro de rede ou 5xx, com espera
+    dobrando a cada tentativa; 3xx e 4xx não se repetem (redirecionamentos não são seguidos). Retorna {"status": código HTTP ou None, "tentativas", "erro"?}.
+    """
+    dados = json.dumps(corpo, ensure_ascii=False).encode("utf-8")
+    ultimo = {"status": None}
+    for tentativa in range(1, tentativas + 1):
+        pedido = urllib.request.Request(url, data=dados, method="POST", headers={"Content-Type": "application/json"})
+        try:
+            with _ABRIR(pedido, timeout=timeout_s) as resposta:
+                return {"status": resposta.status, "tentativas": tentativa}
+        except urllib.error.HTTPError as e:
+            ultimo = {"status": e.code, "erro": str(e)}
+            if e.code < 500:
+                break
+        except (urllib.error.URLError, OSError) as e:
+            ultimo = {"status": None, "erro": str(e)}
+        if tentativa < tentativas:
+            time.sleep(espera_s * 2 ** (tentativa - 1))
+    ultimo["tentativas"] = tentativa
+    return ultimo
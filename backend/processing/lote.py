@@ -0,0 +1,158 @@
+"""
+Leitura de lotes para /analisar/lote: um ZIP (uma pasta por pessoa) ou um manifesto NDJSON
+(uma pessoa por linha, fotos em base64). Cada pessoa vira (id, carregar): as fotos só são lidas
+quando carregar() é chamado, para o lote não ficar inteiro em memória.
+
+ZIP:
+    papel.jpg                      (opcional) folha branca compartilhada por todo o lote
+    ana/rosto.jpg                  nomes dos arquivos = campos do /analisar (extensão livre)
+    ana/braco_interno.jpg
+    ana/cabelo.jpg
+    ana/rosto_com_papel.jpg        (opcional) sobrepõe a folha do lote para essa pessoa
+    bruno/...
+
+NDJSON:
+    {"id": "ana", "rosto": "<base64>", "braco_interno": "<base64>", "cabelo": "<base64>"}
+
+ler_lote e carregar() fazem E/S e descompactação/base64 bloqueantes: o servidor os chama fora do event loop
+(asyncio.to_thread), possivelmente em threads diferentes ao mesmo tempo.
+"""
+import base64
+import binascii
+import json
+import os
+import re
+import threading
+import zipfile
+
+from processing.upload import TAMANHO_CABECALHO, conferir_foto
+
+CAMPOS_OBRIGATORIOS = ("rosto", "braco_interno", "cabelo")
+CAMPOS_OPCIONAIS = ("rosto_com_papel", "braco_externo")
+# Nomes aceitos, na raiz do ZIP, para a folha branca do lote inteiro
+PAPEL_LOTE = ("papel", "rosto_com_papel")
+# "id" de uma linha do NDJSON sem decodificar a linha inteira (base64 não tem aspas, então a chave não
+# aparece dentro das fotos)
+_ID_NDJSON = re.compile(rb'"id"\s*:\s*("(?:[^"\\]|\\.)*"|-?\d+(?:\.\d+)?)')
+
+
+class LoteInvalido(ValueError):
+    """O arquivo do lote não é um ZIP nem um NDJSON legível (vira HTTP 400)."""
+
+
+def eh_zip(cabecalho):
+    return cabecalho[:4] == b"PK\x03\x04"
+
+
+def _campo(nome_arquivo):
+    return os.path.splitext(os.path.basename(nome_arquivo))[0].strip().lower()
+
+
+def _conferir(fotos):
+    faltando = [c for c in CAMPOS_OBRIGATORIOS if not fotos.get(c)]
+    if faltando:
+        raise ValueError("Faltando: %s." % ", ".join(faltando))
+    return fotos
+
+
+def pessoas_zip(arquivo, max_foto_bytes=0):
+    """
+    arquivo: objeto binário com seek (o upload). Retorna (papel_do_lote ou None, [(id, carregar), ...]).
+    max_foto_bytes: teto por foto (tamanho descompactado, conferido antes de descompactar); 0 = sem teto.
+    """
+    try:
+        zf = zipfile.ZipFile(arquivo)
+    except zipfile.BadZipFile as e:
+        raise LoteInvalido("ZIP inválido: %s" % e)
+
+    def ler_foto(pessoa, campo, info):
+        # Tamanho declarado e assinatura antes de descompactar a foto inteira (ZIP bomba, arquivo que não é imagem)
+        with zf.open(info) as f:
+            conferir_foto("%s/%s" % (pessoa, campo), f.read(TAMANHO_CABECALHO), info.file_size, max_foto_bytes)
+        return zf.read(info)
+
+    papel = None
+    por_pessoa = {}
+    for info in zf.infolist():
+        if info.is_dir() or info.filename.startswith("__MACOSX/") or os.path.basename(info.filename).startswith("."):
+            continue
+        partes = info.filename.strip("/").split("/")
+        campo = _campo(partes[-1])
+        if len(partes) == 1:
+            if campo in PAPEL_LOTE:
+                try:
+                    papel = ler_foto("lote", campo, info)
+                except ValueError as e:
+                    raise LoteInvalido(str(e))
+            continue
+        pessoa = "/".join(partes[:-1])
+        if campo in CAMPOS_OBRIGATORIOS or campo in CAMPOS_OPCIONAIS:
+            por_pessoa.setdefault(pessoa, {})[campo] = info
+
+    def carregador(pessoa, infos):
+        return lambda: _conferir({campo: ler_foto(pessoa, campo, info) for campo, info in infos.items()})
+
+    return papel, [(pessoa, carregador(pessoa, infos)) for pessoa, infos in sorted(por_pessoa.items())]
+
+
+def pessoas_ndjson(arquivo, max_foto_bytes=0):
+    """
+    arquivo: objeto binário com seek. Retorna [(id, carregar), ...]; uma linha com JSON ou base64 inválido
+    só falha ao carregar (a pessoa sai com erro, o resto do lote segue). max_foto_bytes como em pessoas_zip.
+    """
+    arquivo.seek(0)
+    # Uma passada: offset de cada linha e o id (só o trecho "id": ..., as fotos não são decodificadas aqui)
+    offsets, ids = [], []
+    pos = 0
+    for linha in arquivo:
+        if linha.strip():
+            achado = _ID_NDJSON.search(linha)
+            try:
+                ids.append(json.loads(achado.group(1)) if achado else None)
+            except json.JSONDecodeError:
+                ids.append(None)
+            offsets.append(pos)
+        pos += len(linha)
+    trava = threading.Lock()
+
+    def ler(offset):
+        # seek + readline no mesmo arquivo: as pessoas são carregadas em threads diferentes
+        with trava:
+            arquivo.seek(offset)
+            return arquivo.readline()
+
+    def decodificar(pid, campo, texto):
+        # Tamanho (3/4 do base64) e assinatura (primeiros 24 caracteres) antes de decodificar tudo
+        cabecalho = base64.b64decode(texto[:24], validate=True)
+        conferir_foto("%s/%s" % (pid, campo), cabecalho, len(texto) * 3 // 4, max_foto_bytes)
+        return base64.b64decode(texto, validate=True)
+
+    def carregador(pid, offset):
+        def carregar():
+            try:
+                item = json.loads(ler(offset))
+                return _conferir({
+                    campo: decodificar(pid, campo, item[campo])
+                    for campo in CAMPOS_OBRIGATORIOS + CAMPOS_OPCIONAIS if item.get(campo)
+                })
+            except (json.JSONDecodeError, binascii.Error, TypeError, AttributeError) as e:
+                raise ValueError("Linha inválida: %s" % e)
+        return carregar
+
+    pessoas = []
+    for indice, (offset, pid) in enumerate(zip(offsets, ids)):
+        pid = str(pid) if pid is not None else str(indice)
+        pessoas.append((pid, carregador(pid, offset)))
+    return pessoas
+
+
+def ler_lote(arquivo, max_foto_bytes=0):
+    """Detecta o formato pelo conteúdo (assinatura do ZIP) e retorna (papel_do_lote, pessoas)."""
+    arquivo.seek(0)
+    cabecalho = arquivo.read(4)
+    arquivo.seek(0)
+    if eh_zip(cabecalho):
+        return pessoas_zip(arquivo, max_foto_bytes)
+    if cabecalho.lstrip()[:1] not in (b"{", b""):
+        raise LoteInvalido("Envie um ZIP (uma pasta por pessoa) ou um NDJSON (uma pessoa por linha).")
+    return None, pessoas_ndjson(arquivo, max_foto_bytes)
@@ -0,0 +1,37 @@
+"""
+Pico de memória residente (RSS) do processo durante uma análise. No Linux, zera o pico
+(/proc/self/clear_refs) antes e lê VmHWM de /proc/self/status depois; onde isso não existe, usa
+ru_maxrss (pico desde o início do processo, não por requisição).
+"""
+import sys
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def zerar_pico():
+    """Zera o pico de RSS do processo atual. Retorna False se o sistema não permite."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def pico_mb():
+    """Pico de RSS (MiB) desde o último zerar_pico() (ou desde o início do processo); None se indisponível."""
+    try:
+        with open("/proc/self/status") as f:
+            for linha in f:
+                if linha.startswith("VmHWM:"):
+                    return round(int(linha.split()[1]) / 1024.0, 1)
+    except OSError:
+        pass
+    if resource is None:
+        return None
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss: KiB no Linux, bytes no macOS
+    return round(maxrss / (1048576.0 if sys.platform == "darwin" else 1024.0), 1)
@@ -0,0 +1,239 @@
+"""
+Medição por etapa do pipeline: tempo de cada etapa (decodificação, balanço de branco, FaceMesh,
+máscaras de pele/cabelo, agrupamento, paletas...) por papel da foto (rosto, braço, cabelo, papel),
+megapixels de cada imagem e pixels de cada região.
+
+No worker, analisar() abre um rastreio (rastrear); as funções marcadas com @medir e os blocos span()
+anotam nele, e o rastreio volta ao servidor dentro de metadados["metricas"]. No servidor, Registro
+agrega tudo em histogramas e exporta no formato de texto do Prometheus (GET /metricas).
+Fora de um rastreio (ou com COLORIMETRIA_METRICAS=0) tudo vira no-op: uma leitura de ContextVar por chamada.
+"""
+import contextvars
+import functools
+import threading
+import time
+from contextlib import contextmanager
+
+from processing import config
+
+_TRACE = contextvars.ContextVar("colorimetria_trace", default=None)
+_PAPEL = contextvars.ContextVar("colorimetria_papel", default="geral")
+
+
+class Trace:
+    """Etapas ([nome, papel, ms]) e medidas ([nome, papel, valor]) de uma análise."""
+
+    __slots__ = ("spans", "medidas")
+
+    def __init__(self):
+        self.spans = []
+        self.medidas = []
+
+    def como_dict(self):
+        return {"spans": self.spans, "medidas": self.medidas}
+
+
+@contextmanager
+def rastrear():
+    """Coleta as etapas medidas dentro do bloco. Entrega o Trace, ou None se as métricas estão desligadas."""
+    if not config.METRICAS:
+        yield None
+        return
+    trace = Trace()
+    token = _TRACE.set(trace)
+    try:
+        yield trace
+    finally:
+        _TRACE.reset(token)
+
+
+@contextmanager
+def papel(nome):
+    """Papel da foto (skin_face, skin_arm, hair, papel) atribuído às etapas medidas dentro do bloco."""
+    token = _PAPEL.set(nome)
+    try:
+        yield
+    finally:
+        _PAPEL.reset(token)
+
+
+@contextmanager
+def span(nome):
+    """Mede o bloco como a etapa nome (no-op fora de um rastreio)."""
+    trace = _TRACE.get()
+    if trace is None:
+        yield
+        return
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.spans.append([nome, _PAPEL.get(), round((time.perf_counter() - t0) * 1000, 3)])
+
+
+def medir(nome=None):
+    """Decorador: mede cada chamada da função como a etapa nome (padrão: nome da função)."""
+    def decorador(fn):
+        etapa = nome or fn.__name__
+
+        @functools.wraps(fn)
+        def medida(*args, **kwargs):
+            trace = _TRACE.get()
+            if trace is None:
+                return fn(*args, **kwargs)
+            t0 = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                trace.spans.append([etapa, _PAPEL.get(), round((time.perf_counter() - t0) * 1000, 3)])
+        return medida
+    return decorador
+
+
+def observar(nome, valor):
+    """Anota uma medida (ex.: megapixels, pixels_regiao) no rastreio atual."""
+    trace = _TRACE.get()
+    if trace is not None:
+        trace.medidas.append([nome, _PAPEL.get(), valor])
+
+
+# Histogramas exportados: nome → (ajuda, limites dos buckets)
+_SEGUNDOS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+HISTOGRAMAS = {
+    "colorimetria_etapa_segundos": ("Duração de cada etapa do pipeline, por papel da foto.", _SEGUNDOS),
+    "colorimetria_requisicao_segundos": ("Duração das requisições (até o início da resposta), por rota.", _SEGUNDOS),
+    "colorimetria_imagem_megapixels": (
+        "Megapixels de cada foto recebida (original) e analisada (após a redução).",
+        (0.25, 0.5, 1, 2, 4, 8, 12, 16, 24, 48, 100),
+    ),
+    "colorimetria_regiao_pixels": (
+        "Pixels na região segmentada de cada foto (pele ou cabelo).",
+        (1e3, 5e3, 1e4, 5e4, 1e5, 2.5e5, 5e5, 1e6, 2.5e6, 5e6),
+    ),
+}
+CONTADORES = {
+    "colorimetria_requisicoes_total": "Requisições por rota e status HTTP.",
+}
+# Medida do rastreio → (histograma, rótulo extra)
+_MEDIDAS = {
+    "megapixels": ("colorimetria_imagem_megapixels", {"resolucao": "original"}),
+    "megapixels_analisados": ("colorimetria_imagem_megapixels", {"resolucao": "analisada"}),
+    "pixels_regiao": ("colorimetria_regiao_pixels", {}),
+}
+
+
+class _Histograma:
+    __slots__ = ("limites", "contagens", "soma", "total")
+
+    def __init__(self, limites):
+        self.limites = limites
+        self.contagens = [0] * len(limites)
+        self.soma = 0.0
+        self.total = 0
+
+    def observar(self, valor):
+        for i, limite in enumerate(self.limites):
+            if valor <= limite:
+                self.contagens[i] += 1
+                break
+        self.soma += valor
+        self.total += 1
+
+
+def _rotulos(labels):
+    return ",".join('%s="%s"' % (k, str(v).replace("\\", "\\\\").replace('"', '\\"')) for k, v in labels)
+
+
+class Registro:
+    """Histogramas e contadores do processo do servidor, exportados em texto do Prometheus. Thread-safe."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histogramas = {}
+        self._contadores = {}
+
+    def observar(self, metrica, labels, valor):
+        chave = (metrica, tuple(sorted(labels.items())))
+        with self._lock:
+            hist = self._histogramas.get(chave)
+            if hist is None:
+                hist = self._histogramas[chave] = _Histograma(HISTOGRAMAS[metrica][1])
+            hist.observar(valor)
+
+    def incrementar(self, metrica, labels, n=1):
+        chave = (metrica, tuple(sorted(labels.items())))
+        with self._lock:
+            self._contadores[chave] = self._contadores.get(chave, 0) + n
+
+    def agregar(self, trace):
+        """Soma um rastreio devolvido pelo worker (Trace.como_dict())."""
+        if not trace:
+            return
+        for nome, papel_foto, ms in trace.get("spans", ()):
+            self.observar("colorimetria_etapa_segundos", {"etapa": nome, "papel": papel_foto}, ms / 1000.0)
+        for nome, papel_foto, valor in trace.get("medidas", ()):
+            if nome in _MEDIDAS:
+                metrica, extra = _MEDIDAS[nome]
+                self.observar(metrica, dict(extra, papel=papel_foto), valor)
+
+    def exportar(self, medidores=None):
+        """Texto no formato de exposição do Prometheus. medidores: {nome: (ajuda, valor)} lidos na hora."""
+        with self._lock:
+            histogramas = sorted(self._histogramas.items())
+            contadores = sorted(self._contadores.items())
+            copias = [(chave, list(h.contagens), h.soma, h.total, h.limites) for chave, h in histogramas]
+        linhas = []
+        ultimo = None
+        for (metrica, labels), contagens, soma, total, limites in copias:
+            if metrica != ultimo:
+                linhas += ["# HELP %s %s" % (metrica, HISTOGRAMAS[metrica][0]), "# TYPE %s histogram" % metrica]
+                ultimo = metrica
+            base = _rotulos(labels)
+            acumulado = 0
+            for limite, n in zip(limites, contagens):
+                acumulado += n
+                linhas.append('%s_bucket{%s%sle="%g"} %d' % (metrica, base, "," if base else "", limite, acumulado))
+            linhas.append('%s_bucket{%s%sle="+Inf"} %d' % (metrica, base, "," if base else "", total))
+            linhas.append("%s_sum{%s} %.6f" % (metrica, base, soma))
+            linhas.append("%s_count{%s} %d" % (metrica, base, total))
+        ultimo = None
+        for (metrica, labels), valor in contadores:
+            if metrica != ultimo:
+                linhas += ["# HELP %s %s" % (metrica, CONTADORES[metrica]), "# TYPE %s counter" % metrica]
+                ultimo = metrica
+            linhas.append("%s{%s} %d" % (metrica, _rotulos(labels), valor))
+        for nome, (ajuda, valor) in sorted((medidores or {}).items()):
+            linhas += ["# HELP %s %s" % (nome, ajuda), "# TYPE %s gauge" % nome, "%s %s" % (nome, valor)]
+        return "\n".join(linhas) + "\n"
+
+
+class MedirRequisicoes:
+    """
+    Middleware ASGI: conta requisições por rota e status e mede a duração até o início da resposta.
+    A rota é o nome da função do endpoint (cardinalidade fixa, mesmo com /analisar/lote/{id}).
+    """
+
+    def __init__(self, app, registro):
+        self.app = app
+        self.registro = registro
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        t0 = time.perf_counter()
+        medida = {"status": 500, "segundos": None}
+
+        async def enviar(mensagem):
+            if mensagem["type"] == "http.response.start":
+                medida["status"] = mensagem["status"]
+                medida["segundos"] = time.perf_counter() - t0
+            await send(mensagem)
+
+        try:
+            await self.app(scope, receive, enviar)
+        finally:
+            endpoint = scope.get("endpoint")
+            rota = getattr(endpoint, "__name__", None) or "desconhecida"
+            segundos = medida["segundos"] if medida["segundos"] is not None else time.perf_counter() - t0
+            self.registro.incrementar("colorimetria_requisicoes_total", {"rota": rota, "status": medida["status"]})
+            self.registro.observar("colorimetria_requisicao_segundos", {"rota": rota}, segundos)
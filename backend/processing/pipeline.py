@@ -0,0 +1,368 @@
+"""
+Pipeline completo de uma análise: decodificação → segmentação → extração → classificação → paletas.
+Roda fora do event loop (num processo do pool de main.py): recebe só bytes e a calibração já
+carregada, e devolve o dict de resposta pronto, com o tempo de cada etapa em metadados.
+"""
+import contextvars
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from contextlib import contextmanager
+
+import numpy as np
+
+# preprocess/segment (OpenCV, MediaPipe) e o sklearn do extract são importados dentro das funções:
+# main.py importa este módulo, e o processo do servidor não deve pagar por eles (arranque a frio).
+from processing.extract import extract_region_features_uint8
+from processing.classify import infer_subtom, infer_valor, infer_croma, infer_contrast, classify_season
+from processing.recommend import generate_palettes, generate_recommendations_text, lab_to_hex_batch
+from processing import config, memoria, metrics, skin_lut
+from processing.cache import ResultCache, hash_bytes
+
+# Entra em todas as chaves de cache (respostas, features por foto, calibrate.py, inclusive o SQLite
+# persistente): suba a cada mudança que altera resultados ou o formato das features, senão entradas antigas
+# são servidas como atuais depois do deploy.
+#   1.1: máscara do rosto = envoltória convexa dos landmarks
+#   1.2: pré-processamento fundido (WB + CLAHE num passe LAB)
+#   1.3: estatísticas das regiões por histograma do LAB uint8
+#   1.4: trimmed_mean_lab e percentiles_lab nas features
+#   1.5: pele do rosto segmentada no recorte dos landmarks
+VERSAO_PIPELINE = "1.5"
+
+
+class ImagemInvalida(ValueError):
+    """Uma ou mais imagens não puderam ser decodificadas/processadas (vira HTTP 400)."""
+
+
+@contextmanager
+def _etapa(tempos, nome):
+    """Acumula em tempos[nome] a duração do bloco, em milissegundos (e a registra no rastreio de métricas)."""
+    t0 = time.perf_counter()
+    try:
+        with metrics.span(nome):
+            yield
+    finally:
+        tempos[nome] = round(tempos.get(nome, 0.0) + (time.perf_counter() - t0) * 1000, 2)
+
+
+def init_worker():
+    """Inicializador de cada processo do pool: carrega as dependências pesadas uma única vez."""
+    import cv2
+    from multiprocessing.util import Finalize
+    from processing.segment import close_face_meshes
+    cv2.setNumThreads(config.THREADS_POR_WORKER)
+    # Processos filhos não rodam atexit; Finalize fecha os FaceMesh quando o worker encerra.
+    Finalize(None, close_face_meshes, exitpriority=10)
+    if config.AQUECER:
+        aquecer()
+
+
+def aquecer():
+    """
+    Aquece o processo/thread atual: importa OpenCV/sklearn, cria o FaceMesh e roda um KMeans pequeno
+    (inicializa BLAS/OpenMP). Retorna o estado de cada parte, com o pid e o tempo gasto.
+    """
+    from processing.extract import dominant_clusters
+    from processing.segment import warmup_face_mesh
+    t0 = time.perf_counter()
+    estado = {"pid": os.getpid(), "face_mesh": warmup_face_mesh()}
+    try:
+        rng = np.random.default_rng(0)
+        dominant_clusters(rng.uniform(0, 100, (512, 3)), engine=config.CLUSTER_ENGINE)
+        estado["kmeans"] = True
+    except Exception:
+        estado["kmeans"] = False
+    estado["ms"] = round((time.perf_counter() - t0) * 1000, 2)
+    return estado
+
+
+def apply_calib(lab_list, region_key=None, calib=None):
+    """Aplica o offset de calibração (peso das leituras) ao mean_lab. Mesma correção para qualquer imagem."""
+    if not lab_list or len(lab_list) < 3:
+        return lab_list
+    if not calib:
+        return lab_list
+    by_region = calib.get("by_region") or {}
+    if region_key and region_key in by_region:
+        off = by_region[region_key]
+        L = float(lab_list[0]) + off[0]
+        a = float(lab_list[1]) + off[1]
+        b = float(lab_list[2]) + off[2]
+    else:
+        L = float(lab_list[0]) + calib.get("offset_L", 0)
+        a = float(lab_list[1]) + calib.get("offset_a", 0)
+        b = float(lab_list[2]) + calib.get("offset_b", 0)
+    return [L, a, b]
+
+
+# Cache de features por foto, no processo do worker: quem reenvia só uma foto (em geral o cabelo)
+# paga uma imagem em vez de três. Chave = hash da foto + região + correção de branco + opções.
+_FEATURES_CACHE = None
+
+
+def _features_cache():
+    global _FEATURES_CACHE
+    if _FEATURES_CACHE is None:
+        _FEATURES_CACHE = ResultCache(
+            int(config.FEATURES_CACHE_MB * 1024 * 1024),
+            sqlite_path=config.CACHE_SQLITE,
+            sqlite_max_items=config.CACHE_SQLITE_MAX_ITENS,
+        )
+    return _FEATURES_CACHE
+
+
+def _chave_foto(data, role, wb_correction=None):
+    wb = "%.4f,%.4f" % tuple(wb_correction) if wb_correction else "-"
+    return hash_bytes(
+        VERSAO_PIPELINE, str(config.MAX_LADO), config.CLUSTER_ENGINE, skin_lut.assinatura_padrao(), role, wb, data
+    )
+
+
+def white_balance_from_paper(data_papel, tempos=None):
+    """Correção de branco (delta_a, delta_b) da foto com folha, ou None se desprezível. Memoizada por foto."""
+    from processing.preprocess import get_white_balance_correction, load_image
+    tempos = {} if tempos is None else tempos
+    cache = _features_cache()
+    chave = _chave_foto(data_papel, "wb") if cache.enabled else None
+    if chave is not None:
+        hit = cache.get(chave)
+        if hit is not None:
+            return tuple(hit["wb"]) if hit["wb"] else None
+    wb_correction = None
+    with _etapa(tempos, "balanco_branco"):
+        img_papel = load_image(data_papel, max_side=config.MAX_LADO)
+        if img_papel is not None:
+            da, db = get_white_balance_correction(img_papel)
+            if abs(da) > 0.5 or abs(db) > 0.5:
+                wb_correction = (da, db)
+    if chave is not None and img_papel is not None:
+        cache.set(chave, {"wb": list(wb_correction) if wb_correction else None})
+    return wb_correction
+
+
+def region_pixels(data, role, wb_correction=None, tempos=None):
+    """
+    Foto (bytes) → preprocess → segmentação: pixels LAB uint8 (Nx3) da região role ("skin_face", "skin_arm"
+    ou "hair"). Etapa comum ao /analisar (region_features) e ao resumo de /analisar/features (resumo.py).
+    Levanta ImagemInvalida se a foto não decodificar.
+    """
+    from processing.preprocess import preprocess_pipeline
+    from processing.segment import (
+        segment_face_roi, segment_skin_region, segment_hair_region, get_region_pixels_uint8,
+    )
+    tempos = {} if tempos is None else tempos
+    with _etapa(tempos, "preprocessamento"):
+        # Só o LAB uint8: a região sai com 3 bytes/pixel e as estatísticas, de histogramas (sem LAB float32).
+        # HSV da imagem inteira só para as regras de pele do braço (o rosto converte só o recorte; cabelo e o
+        # modelo em tabela não usam)
+        usa_hsv = role == "skin_arm" and skin_lut.padrao() is None
+        pre = preprocess_pipeline(
+            data, wb_correction=wb_correction, max_side=config.MAX_LADO, lab_float=False, hsv=usa_hsv
+        )
+    if not pre:
+        raise ImagemInvalida("Não foi possível processar uma ou mais imagens.")
+
+    with _etapa(tempos, "segmentacao"):
+        caixa = None
+        if role == "skin_face":
+            # Pele e pixels só na caixa dos landmarks (com folga), não na foto inteira
+            face_mask, caixa = segment_face_roi(pre["bgr"], margem=config.ROSTO_MARGEM)
+            mask = segment_skin_region(pre["bgr"], face_mask, scale=pre["scale"], caixa=caixa)
+        elif role == "skin_arm":
+            mask = segment_skin_region(pre["bgr"], None, scale=pre["scale"], hsv=pre["hsv"])
+        else:
+            mask = segment_hair_region(pre["bgr"], None, scale=pre["scale"])
+        pixels = get_region_pixels_uint8(pre["lab_uint8"], mask, caixa)
+    metrics.observar("pixels_regiao", 0 if pixels is None else len(pixels))
+    return pixels
+
+
+def region_features(data, role, wb_correction=None, tempos=None):
+    """
+    Foto (bytes) → region_pixels → extract_region_features_uint8 para a região role
+    ("skin_face", "skin_arm" ou "hair"). Retorna (features ou None, veio_do_cache).
+    Memoizada por (hash da foto, role, wb_correction); guarda só o dict compacto, não os arrays.
+    Levanta ImagemInvalida se a foto não decodificar.
+    """
+    tempos = {} if tempos is None else tempos
+    cache = _features_cache()
+    chave = _chave_foto(data, role, wb_correction) if cache.enabled else None
+    if chave is not None:
+        hit = cache.get(chave)
+        if hit is not None:
+            return hit["features"], True
+
+    pixels = region_pixels(data, role, wb_correction, tempos)
+    with _etapa(tempos, "extracao"):
+        features = extract_region_features_uint8(pixels, cluster_engine=config.CLUSTER_ENGINE)
+    if chave is not None:
+        cache.set(chave, {"features": features})
+    return features, False
+
+
+# Threads que processam braço e cabelo enquanto a thread da análise processa o rosto (o FaceMesh dela já
+# está aquecido). Um pool por processo, compartilhado por todas as análises: no máximo THREADS_FOTOS threads
+# extras, por mais análises simultâneas que haja. OpenCV e NumPy soltam o GIL na maior parte do trabalho.
+_FOTOS_POOL = None
+_FOTOS_POOL_LOCK = threading.Lock()
+
+
+def _fotos_pool():
+    """Pool de threads das fotos; None com COLORIMETRIA_THREADS_FOTOS=0 (fotos uma depois da outra)."""
+    global _FOTOS_POOL
+    if _FOTOS_POOL is None and config.THREADS_FOTOS > 0:
+        with _FOTOS_POOL_LOCK:
+            if _FOTOS_POOL is None:
+                _FOTOS_POOL = ThreadPoolExecutor(max_workers=config.THREADS_FOTOS, thread_name_prefix="foto")
+    return _FOTOS_POOL
+
+
+def _foto(papel, data, role, wb_correction, tempos):
+    """Cadeia de uma foto (preprocess → segmentação → extração) com as etapas atribuídas ao papel."""
+    with metrics.papel(papel):
+        return region_features(data, role, wb_correction, tempos)
+
+
+def _somar_tempos(tempos, *parciais):
+    for parcial in parciais:
+        for nome, ms in parcial.items():
+            tempos[nome] = round(tempos.get(nome, 0.0) + ms, 2)
+
+
+def analisar(data_rosto, data_braco, data_cabelo, data_papel=None, calib=None, wb_correction=None):
+    """
+    Analisa as fotos (bytes) e retorna perfil cromático, paletas e recomendações.
+    Se data_papel (rosto com folha branca) vier, a correção de branco dela é aplicada a todas as fotos;
+    senão usa wb_correction, se já calculada (ex.: uma folha para o lote inteiro em /analisar/lote).
+    calib: dict de calib.json (offsets LAB por região). Levanta ImagemInvalida se alguma foto não decodificar.
+    """
+    t0 = time.perf_counter()
+    tempos = {}
+    memoria.zerar_pico()
+    with metrics.rastrear() as trace:
+        # 1) Calibração da luz: correção de branco a partir da foto com folha (aplicada a todas as fotos)
+        if data_papel:
+            with metrics.papel("papel"):
+                wb_correction = white_balance_from_paper(data_papel, tempos)
+
+        # 2) Por foto: preprocess → segmentação → extração (cada uma pode vir do cache de features).
+        # Com o pool, braço e cabelo rodam em threads (cada uma com uma cópia do contexto: rastreio de
+        # métricas + papel) enquanto o rosto roda aqui; cada foto anota os próprios tempos e eles são
+        # somados depois, como no caminho sequencial.
+        pool = _fotos_pool()
+        if pool is None:
+            feat_skin_rosto, hit_rosto = _foto("skin_face", data_rosto, "skin_face", wb_correction, tempos)
+            feat_skin_braco, hit_braco = _foto("skin_arm", data_braco, "skin_arm", wb_correction, tempos)
+            feat_hair, hit_cabelo = _foto("hair", data_cabelo, "hair", wb_correction, tempos)
+        else:
+            tempos_fotos = ({}, {}, {})
+            futuros = [
+                pool.submit(contextvars.copy_context().run, _foto, role, data, role, wb_correction, tempos_foto)
+                for role, data, tempos_foto in (
+                    ("skin_arm", data_braco, tempos_fotos[1]), ("hair", data_cabelo, tempos_fotos[2]),
+                )
+            ]
+            try:
+                feat_skin_rosto, hit_rosto = _foto("skin_face", data_rosto, "skin_face", wb_correction, tempos_fotos[0])
+            finally:
+                # Mesmo com erro no rosto, não devolve antes das outras fotos terminarem
+                wait(futuros)
+            (feat_skin_braco, hit_braco), (feat_hair, hit_cabelo) = [f.result() for f in futuros]
+            _somar_tempos(tempos, *tempos_fotos)
+
+        with _etapa(tempos, "classificacao"):
+            resposta = montar_resposta(feat_skin_rosto, feat_skin_braco, feat_hair, calib)
+    resposta["metadados"]["tempos_ms"] = tempos
+    # Duração de parede no worker: com as fotos em paralelo, menor que a soma das etapas (main.py calcula a fila)
+    resposta["metadados"]["duracao_ms"] = round((time.perf_counter() - t0) * 1000, 2)
+    # Pico de RSS do worker durante esta análise (com COLORIMETRIA_WORKERS=0, inclui as análises simultâneas)
+    resposta["metadados"]["memoria_pico_mb"] = memoria.pico_mb()
+    resposta["metadados"]["fotos_do_cache"] = [
+        nome for nome, hit in (("rosto", hit_rosto), ("braco_interno", hit_braco), ("cabelo", hit_cabelo)) if hit
+    ]
+    if trace is not None:
+        # Etapas e medidas desta análise; main.py agrega em /metricas e tira da resposta (ou não, se pedido)
+        resposta["metadados"]["metricas"] = trace.como_dict()
+    return resposta
+
+
+def montar_resposta(feat_skin_rosto, feat_skin_braco, feat_hair, calib=None):
+    """A partir das features por região (sem calibração), classifica e monta o dict de resposta."""
+    if not feat_skin_rosto:
+        feat_skin_rosto = {"mean_lab": [50, 5, 15], "chroma_mean": 15}
+    if not feat_skin_braco:
+        feat_skin_braco = {"mean_lab": [52, 5, 14], "chroma_mean": 14}
+    if not feat_hair:
+        feat_hair = {"mean_lab": [35, 2, 5], "chroma_mean": 5}
+
+    # 3a) Aplicar pesos da calibração (offsets LAB por região) — mesma correção para qualquer imagem
+    if feat_skin_rosto and feat_skin_rosto.get("mean_lab"):
+        feat_skin_rosto["mean_lab"] = apply_calib(feat_skin_rosto["mean_lab"], "skin_face", calib)
+    if feat_skin_braco and feat_skin_braco.get("mean_lab"):
+        feat_skin_braco["mean_lab"] = apply_calib(feat_skin_braco["mean_lab"], "skin_arm", calib)
+    if feat_hair and feat_hair.get("mean_lab"):
+        feat_hair["mean_lab"] = apply_calib(feat_hair["mean_lab"], "hair", calib)
+
+    skin_mean = feat_skin_rosto.get("mean_lab") or feat_skin_braco.get("mean_lab")
+    braco_mean = feat_skin_braco.get("mean_lab")
+    hair_mean = feat_hair.get("mean_lab")
+
+    # 4) Variáveis fundamentais
+    subtom = infer_subtom(skin_mean, braco_mean)
+    valor = infer_valor(skin_mean[0] if skin_mean else 55)
+    croma = infer_croma(feat_skin_rosto.get("chroma_mean"))
+    contraste = infer_contrast(skin_mean, hair_mean)
+    season = classify_season(subtom, valor, croma, contraste)
+
+    # 5) Paletas e textos
+    paletas = generate_palettes(subtom, valor, croma, contraste, season)
+    recomendacoes = generate_recommendations_text(subtom, valor, croma, contraste, season)
+
+    # 6) Cores por parte do corpo (para sugestões personalizadas por região), convertidas numa chamada
+    labs = [feat.get("mean_lab") for feat in (feat_skin_rosto, feat_skin_braco, feat_hair)]
+    validos = [lab for lab in labs if lab and len(lab) >= 3]
+    hexes = iter(lab_to_hex_batch([[float(v) for v in lab[:3]] for lab in validos]))
+    hex_rosto, hex_braco, hex_cabelo = [next(hexes) if lab and len(lab) >= 3 else "#888888" for lab in labs]
+
+    cores_por_parte = {
+        "rosto": {
+            "hex": hex_rosto,
+            "dica": "Maquiagem, golas e acessórios perto do rosto: prefira tons que harmonizem com essa pele.",
+        },
+        "braco_interno": {
+            "hex": hex_braco,
+            "dica": "Subtom da pele do braço ajuda a definir quente/frio; use essa referência em roupas de mangas e pulseiras.",
+        },
+        "cabelo": {
+            "hex": hex_cabelo,
+            "dica": "Tingimentos, chapéus e lenços: cores que conversem com seu cabelo natural valorizam o conjunto.",
+        },
+    }
+
+    recomendacoes_por_parte = {
+        "rosto": "Para realçar o rosto: bases e blushes no seu subtom; evite cores que criem máscara.",
+        "braco_interno": "Pulseiras e mangas: tons neutros ou da sua paleta harmonizam com a pele exposta.",
+        "cabelo": "Cabelo define seu contraste; use a paleta sugerida para roupas e acessórios que equilibrem com a cabeça.",
+    }
+
+    # 7) Resposta estruturada
+    return {
+        "perfil_cromatico": {
+            "subtom": subtom,
+            "valor": valor,
+            "croma": croma,
+            "contraste": contraste,
+            "estacao": season,
+            "skin_mean_lab": skin_mean,
+            "hair_mean_lab": hair_mean,
+        },
+        "paletas": paletas,
+        "recomendacoes_texto": recomendacoes,
+        "cores_por_parte": cores_por_parte,
+        "recomendacoes_por_parte": recomendacoes_por_parte,
+        "metadados": {
+            "versao": VERSAO_PIPELINE,
+            "modelo": "regras",
+        },
+    }
@@ -5,26 +5,109 @@ import io
 import numpy as np
 from PIL import Image
 import cv2
-from skimage import exposure
 
+from processing import metrics
 
-def load_image(bytes_io):
-    """Carrega imagem a partir de bytes (BytesIO ou bytes)."""
-    if hasattr(bytes_io, "getvalue"):
-        data = bytes_io.getvalue()
+
+# Fatores de redução do decodificador JPEG (IDCT reduzido: decodifica direto em 1/2, 1/4 ou 1/8).
+_REDUCED_FLAGS = (
+    (8, cv2.IMREAD_REDUCED_COLOR_8),
+    (4, cv2.IMREAD_REDUCED_COLOR_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2),
+)
+
+
+# Marcadores SOF (início de quadro) do JPEG, que trazem altura e largura; C4/C8/CC não são SOF
+_JPEG_SOF = frozenset(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+
+def _jpeg_long_edge(data):
+    """
+    Lado maior de um JPEG lido só do cabeçalho (percorre os segmentos até o SOF, sem decodificar nem
+    copiar os bytes); None se não for JPEG ou o cabeçalho estiver truncado.
+    """
+    if bytes(data[:3]) != b"\xff\xd8\xff":
+        return None
+    pos, n = 2, len(data)
+    while pos + 9 <= n:
+        if data[pos] != 0xFF:
+            return None
+        marker = data[pos + 1]
+        if marker == 0xFF:  # preenchimento
+            pos += 1
+            continue
+        length = (data[pos + 2] << 8) | data[pos + 3]
+        if marker in _JPEG_SOF:
+            h = (data[pos + 5] << 8) | data[pos + 6]
+            w = (data[pos + 7] << 8) | data[pos + 8]
+            return max(h, w) or None
+        pos += 2 + length
+    return None
+
+
+def downscale_to_max_side(img, max_side):
+    """Reduz a imagem (INTER_AREA) para que o lado maior seja no máximo max_side. Nunca amplia."""
+    if img is None or not max_side:
+        return img
+    h, w = img.shape[:2]
+    long_edge = max(h, w)
+    if long_edge <= max_side:
+        return img
+    scale = max_side / float(long_edge)
+    size = (max(1, int(round(w * scale))), max(1, int(round(h * scale))))
+    return cv2.resize(img, size, interpolation=cv2.INTER_AREA)
+
+
+def load_image(bytes_io, max_side=None):
+    """
+    Carrega imagem a partir de bytes (BytesIO ou bytes).
+    max_side: se dado, devolve a imagem na resolução de análise (lado maior <= max_side). JPEGs grandes
+    são decodificados já reduzidos pelo próprio decodificador (IMREAD_REDUCED_COLOR_*), sem passar
+    pela resolução cheia; o ajuste final é feito com INTER_AREA.
+    """
+    return _load_image_scaled(bytes_io, max_side)[0]
+
+
+@metrics.medir("decodificacao")
+def _load_image_scaled(bytes_io, max_side=None):
+    """
+    Como load_image, mas retorna (img, escala), escala = lado maior analisado / lado maior original.
+    Aceita bytes, bytearray, memoryview ou BytesIO e decodifica direto desse buffer, sem copiá-lo.
+    """
+    if hasattr(bytes_io, "getbuffer"):
+        data = bytes_io.getbuffer()
     elif hasattr(bytes_io, "read"):
         data = bytes_io.read()
     else:
         data = bytes_io
-    if not data or len(data) == 0:
-        return None
-    data = bytes(data)
+    if data is None or len(data) == 0:
+        return None, 1.0
     arr = np.frombuffer(data, dtype=np.uint8)
-    img = cv2.imdecode(arr, cv2.IMREAD_COLOR)
+    flag = cv2.IMREAD_COLOR
+    long_edge = None
+    if max_side:
+        long_edge = _jpeg_long_edge(data)
+        if long_edge:
+            for factor, reduced_flag in _REDUCED_FLAGS:
+                if long_edge // factor >= max_side:
+                    flag = reduced_flag
+                    break
+    img = cv2.imdecode(arr, flag)
     if img is None:
-        pil = Image.open(io.BytesIO(data))
-        img = cv2.cvtColor(np.array(pil), cv2.COLOR_RGB2BGR)
-    return img
+        # Formatos que o OpenCV não lê: tenta o PIL; se também falhar, não é imagem
+        try:
+            with Image.open(io.BytesIO(data)) as pil:
+                img = cv2.cvtColor(np.array(pil.convert("RGB")), cv2.COLOR_RGB2BGR)
+        except Exception:
+            return None, 1.0
+    if not long_edge:
+        long_edge = max(img.shape[:2])
+    img = downscale_to_max_side(img, max_side)
+    scale = max(img.shape[:2]) / float(long_edge)
+    h, w = img.shape[:2]
+    metrics.observar("megapixels", h * w / (scale * scale) / 1e6)
+    metrics.observar("megapixels_analisados", h * w / 1e6)
+    return img, scale
 
 
 def normalize_exposure(img_bgr):
@@ -57,6 +140,7 @@ def _detect_white_mask(lab_uint8, l_min=240, chroma_max=15):
     return mask
 
 
+@metrics.medir()
 def get_white_balance_correction(img_bgr, white_l_min=240, white_chroma_max=18):
     """
     Obtém a correção de branco (delta_a, delta_b) a partir de uma imagem que contém
@@ -110,12 +194,15 @@ def white_balance_by_reference(img_bgr, white_l_min=240, white_chroma_max=18):
 
 def to_lab(img_bgr):
     """Converte BGR para LAB (L em [0,100], a,b ~[-128,127])."""
-    lab = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2LAB)
-    l, a, b = cv2.split(lab)
-    l_scale = l.astype(np.float32) * (100 / 255)
-    a_scale = a.astype(np.float32) - 128
-    b_scale = b.astype(np.float32) - 128
-    return np.stack([l_scale, a_scale, b_scale], axis=-1)
+    return lab_to_float(cv2.cvtColor(img_bgr, cv2.COLOR_BGR2LAB))
+
+
+def lab_to_float(lab_uint8):
+    """LAB OpenCV (uint8) para LAB float32 (L em [0,100], a,b ~[-128,127]) numa única alocação."""
+    lab = lab_uint8.astype(np.float32)
+    lab[:, :, 0] *= np.float32(100 / 255)
+    lab[:, :, 1:] -= 128
+    return lab
 
 
 def to_hsv(img_bgr):
@@ -123,30 +210,92 @@ def to_hsv(img_bgr):
     return cv2.cvtColor(img_bgr, cv2.COLOR_BGR2HSV)
 
 
-def preprocess_pipeline(img_bytes, apply_white_balance=True, apply_exposure=True, use_white_reference=True, wb_correction=None):
+def _shift_ab_inplace(lab_uint8, delta_a, delta_b, dtype=np.float32, clip=True):
+    """
+    Subtrai (delta_a, delta_b) dos canais a,b via tabela de 256 entradas (cv2.LUT), no próprio array.
+    Reproduz a aritmética das funções de balanço de branco acima (mesmo dtype, clip e truncamento).
+    """
+    base = np.arange(256, dtype=dtype)
+    lut = np.empty((256, 1, 3), dtype=np.uint8)
+    lut[:, 0, 0] = np.arange(256)
+    for c, delta in ((1, delta_a), (2, delta_b)):
+        vals = base - delta
+        lut[:, 0, c] = (np.clip(vals, 0, 255) if clip else vals).astype(np.uint8)
+    cv2.LUT(lab_uint8, lut, dst=lab_uint8)
+
+
+@metrics.medir()
+def preprocess_lab(img_bgr, apply_white_balance=True, apply_exposure=True, use_white_reference=True, wb_correction=None):
+    """
+    Pré-processamento fundido: converte BGR→LAB uma vez, aplica balanço de branco (a,b) e CLAHE (L)
+    no próprio LAB e volta para BGR uma vez. Equivale a apply_white_balance_correction /
+    white_balance_by_reference / white_balance_simple + normalize_exposure sem as idas e voltas
+    BGR↔LAB intermediárias. Retorna (bgr, lab_uint8).
+    """
+    lab = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2LAB)
+    if apply_white_balance:
+        if wb_correction is not None and len(wb_correction) >= 2:
+            delta_a, delta_b = wb_correction[0], wb_correction[1]
+            if abs(delta_a) >= 0.5 or abs(delta_b) >= 0.5:
+                _shift_ab_inplace(lab, delta_a, delta_b)
+        else:
+            white_mask = _detect_white_mask(lab) if use_white_reference else None
+            if white_mask is not None and np.sum(white_mask) >= 100:
+                ref_a = float(np.median(lab[:, :, 1][white_mask]))
+                ref_b = float(np.median(lab[:, :, 2][white_mask]))
+                _shift_ab_inplace(lab, ref_a - 128, ref_b - 128, dtype=np.float64)
+            else:
+                avg_a = np.mean(lab[:, :, 1])
+                avg_b = np.mean(lab[:, :, 2])
+                _shift_ab_inplace(lab, avg_a - 128, avg_b - 128, dtype=np.float64, clip=False)
+    if apply_exposure:
+        clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
+        l_ch = cv2.extractChannel(lab, 0)
+        cv2.insertChannel(clahe.apply(l_ch), lab, 0)
+    return cv2.cvtColor(lab, cv2.COLOR_LAB2BGR), lab
+
+
+@metrics.medir()
+def preprocess_pipeline(img_bytes, apply_white_balance=True, apply_exposure=True, use_white_reference=True, wb_correction=None,
+                        max_side=None, fused=True, lab_float=True, hsv=True):
     """
     Pipeline de pré-processamento.
     wb_correction: opcional (delta_a, delta_b) da imagem "rosto com papel"; quando dado, aplica
     essa correção em vez de detectar branco na própria imagem.
-    Retorna dict com 'bgr', 'lab', 'hsv', 'bgr_norm' (normalizado).
+    max_side: resolução de análise (lado maior, px). Todo o resto (CLAHE, LAB/HSV, máscaras, estatísticas)
+    roda nessa resolução; as máscaras já saem no tamanho de 'lab', então não há reamostragem depois.
+    fused: usa preprocess_lab (uma conversão BGR→LAB e uma LAB→BGR; 'lab' sai do LAB corrigido, sem
+    reconverter). False = caminho clássico, com uma ida e volta BGR↔LAB por etapa.
+    lab_float: False = não monta o LAB float32 (12 bytes/pixel); 'lab' vem None e as estatísticas saem de
+    'lab_uint8' (segment.get_region_pixels_uint8 + extract.extract_region_features_uint8).
+    hsv: False = não converte para HSV ('hsv' vem None): só as regras HSV de pele o usam (não o cabelo nem
+    o modelo de pele em tabela, skin_lut).
+    Retorna dict com 'bgr', 'lab', 'lab_uint8' (LAB do OpenCV, 3 bytes/pixel), 'hsv' (normalizados), 'shape'
+    e 'scale' (resolução analisada / original, para as funções de segment manterem a morfologia
+    equivalente à da resolução cheia).
     """
-    img = load_image(img_bytes)
+    img, scale = _load_image_scaled(img_bytes, max_side=max_side)
     if img is None:
         return None
-    if apply_white_balance:
-        if wb_correction is not None and len(wb_correction) >= 2:
-            img = apply_white_balance_correction(img, wb_correction[0], wb_correction[1])
-        elif use_white_reference:
-            img = white_balance_by_reference(img)
-        else:
-            img = white_balance_simple(img)
-    if apply_exposure:
-        img = normalize_exposure(img)
-    lab = to_lab(img)
-    hsv = to_hsv(img)
+    if fused:
+        img, lab_uint8 = preprocess_lab(img, apply_white_balance, apply_exposure, use_white_reference, wb_correction)
+    else:
+        if apply_white_balance:
+            if wb_correction is not None and len(wb_correction) >= 2:
+                img = apply_white_balance_correction(img, wb_correction[0], wb_correction[1])
+            elif use_white_reference:
+                img = white_balance_by_reference(img)
+            else:
+                img = white_balance_simple(img)
+        if apply_exposure:
+            img = normalize_exposure(img)
+        lab_uint8 = cv2.cvtColor(img, cv2.COLOR_BGR2LAB)
+    lab = lab_to_float(lab_uint8) if lab_float else None
     return {
         "bgr": img,
         "lab": lab,
-        "hsv": hsv,
+        "lab_uint8": lab_uint8,
+        "hsv": to_hsv(img) if hsv else None,
         "shape": img.shape,
+        "scale": scale,
     }
@@ -2,19 +2,22 @@
 Geração de paletas e recomendações a partir do perfil cromático.
 Cores em HEX e LAB; recomendações textuais explicáveis.
 """
+import importlib.util
+
 import numpy as np
 
-try:
-    from colormath.color_objects import LabColor, sRGBColor
-    from colormath.color_conversions import convert_color
-    HAS_COLORMATH = True
-except ImportError:
-    HAS_COLORMATH = False
+from processing import colorspace, metrics
+
+# colormath (~0.3 s, puxa o networkx) só é importado na primeira conversão escalar; o caminho
+# do /analisar usa lab_to_hex_batch (colorspace, só NumPy).
+HAS_COLORMATH = importlib.util.find_spec("colormath") is not None
 
 
 def lab_to_hex(L, a, b):
     """Converte LAB (L 0-100, a,b típicos -128..127) para HEX."""
     if HAS_COLORMATH:
+        from colormath.color_objects import LabColor, sRGBColor
+        from colormath.color_conversions import convert_color
         lab = LabColor(lab_l=L, lab_a=a, lab_b=b)
         rgb = convert_color(lab, sRGBColor)
         r = max(0, min(1, rgb.rgb_r))
@@ -65,62 +68,88 @@ def hex_to_lab(hex_str):
     return (float(L), float(a), float(b))
 
 
-def generate_palettes(subtom, valor, croma, contraste, season):
-    """
-    Gera paleta principal, neutra e destaque com base no perfil.
-    Regras simplificadas por subtom e estação.
-    """
-    paleta_principal = []
-    paleta_neutra = []
-    paleta_destaque = []
-    # Cores por subtom (LAB aproximado: L, a, b)
-    if subtom == "quente":
-        paleta_principal = [
+def lab_to_hex_batch(lab):
+    """Converte array Nx3 (ou lista de trios) LAB para lista de HEX; mesmo resultado de lab_to_hex com colormath."""
+    return colorspace.lab_to_hex(lab)
+
+
+def hex_to_lab_batch(hex_list):
+    """Converte lista de HEX (#rrggbb ou #rrggbbff) para array Nx3 LAB; mesmo resultado de hex_to_lab."""
+    return colorspace.hex_to_lab(hex_list)
+
+
+# Paletas por subtom (LAB aproximado: L, a, b). São fixas, então o HEX é calculado uma vez, na importação.
+_PALETAS_LAB = {
+    "quente": {
+        "principal": [
             (65, 15, 45),   # coral
             (55, 25, 35),   # terracota
             (70, 10, 40),   # pêssego
             (50, 20, 25),   # mostarda suave
             (60, 5, 30),    # bege quente
-        ]
-        paleta_neutra = [(70, 2, 15), (55, 3, 12), (40, 2, 8), (75, 0, 10)]
-        paleta_destaque = [(50, 35, 25), (45, 20, 5), (60, 30, 40)]
-    elif subtom == "frio":
-        paleta_principal = [
+        ],
+        "neutra": [(70, 2, 15), (55, 3, 12), (40, 2, 8), (75, 0, 10)],
+        "destaque": [(50, 35, 25), (45, 20, 5), (60, 30, 40)],
+    },
+    "frio": {
+        "principal": [
             (60, 15, -15),  # rosa frio
             (55, 20, -25),  # azul acinzentado
             (65, 5, -10),   # lavanda
             (50, 25, -20),  # ameixa
             (70, 8, -12),   # azul claro
-        ]
-        paleta_neutra = [(72, 0, -5), (55, 0, -8), (38, 0, -5), (78, 0, -3)]
-        paleta_destaque = [(45, 30, -35), (50, 25, -30), (55, 20, -25)]
-    elif subtom == "oliva":
-        paleta_principal = [
+        ],
+        "neutra": [(72, 0, -5), (55, 0, -8), (38, 0, -5), (78, 0, -3)],
+        "destaque": [(45, 30, -35), (50, 25, -30), (55, 20, -25)],
+    },
+    "oliva": {
+        "principal": [
             (58, 8, 20),    # verde oliva
             (62, 10, 25),   # verde sálvia
             (55, 15, 15),   # bronze
             (68, 5, 18),    # camurça
             (52, 12, 22),   # musgo
-        ]
-        paleta_neutra = [(65, 2, 10), (50, 3, 8), (40, 2, 5), (72, 1, 12)]
-        paleta_destaque = [(48, 18, 28), (55, 15, 20), (60, 12, 25)]
-    else:  # neutro
-        paleta_principal = [
+        ],
+        "neutra": [(65, 2, 10), (50, 3, 8), (40, 2, 5), (72, 1, 12)],
+        "destaque": [(48, 18, 28), (55, 15, 20), (60, 12, 25)],
+    },
+    "neutro": {
+        "principal": [
             (62, 8, 20), (60, 10, -5), (58, 12, 15), (65, 5, 10), (55, 15, 8),
-        ]
-        paleta_neutra = [(68, 1, 5), (52, 2, 4), (38, 1, 3), (75, 0, 5)]
-        paleta_destaque = [(55, 22, 15), (50, 18, -10), (60, 15, 20)]
+        ],
+        "neutra": [(68, 1, 5), (52, 2, 4), (38, 1, 3), (75, 0, 5)],
+        "destaque": [(55, 22, 15), (50, 18, -10), (60, 15, 20)],
+    },
+}
+
+
+def _build_palette_table():
+    """{subtom: {grupo: [(lab, hex), ...]}} com todos os HEX convertidos numa única chamada vetorizada."""
+    flat = [t for grupos in _PALETAS_LAB.values() for tuples in grupos.values() for t in tuples]
+    hexes = iter(lab_to_hex_batch(flat))
+    return {
+        subtom: {grupo: [(t, next(hexes)) for t in tuples] for grupo, tuples in grupos.items()}
+        for subtom, grupos in _PALETAS_LAB.items()
+    }
+
 
-    def to_hex_list(tuples):
-        return [{"lab": list(t), "hex": lab_to_hex(t[0], t[1], t[2])} for t in tuples]
+_PALETAS = _build_palette_table()
 
+
+@metrics.medir()
+def generate_palettes(subtom, valor, croma, contraste, season):
+    """
+    Gera paleta principal, neutra e destaque com base no perfil.
+    Regras simplificadas por subtom e estação (subtom desconhecido usa a paleta "neutro").
+    """
+    grupos = _PALETAS.get(subtom, _PALETAS["neutro"])
     return {
-        "principal": to_hex_list(paleta_principal),
-        "neutra": to_hex_list(paleta_neutra),
-        "destaque": to_hex_list(paleta_destaque),
+        grupo: [{"lab": list(t), "hex": h} for t, h in grupos[grupo]]
+        for grupo in ("principal", "neutra", "destaque")
     }
 
 
+@metrics.medir()
 def generate_recommendations_text(subtom, valor, croma, contraste, season):
     """Recomendações textuais explicáveis."""
     textos = []
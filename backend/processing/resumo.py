@@ -0,0 +1,165 @@
+"""
+Resumo compacto de uma foto para POST /analisar/features: em vez das fotos, o app manda, por região, o
+histograma 3-D do LAB (uint8 do OpenCV) quantizado em bins³ células (padrão 32³), só com as células ocupadas:
+    {"bins": 32, "indices": [i, ...], "contagens": [n, ...]}     índice = (qL * bins + qa) * bins + qb
+mais a correção de branco usada. Um rosto ocupa da ordem de centenas de células: alguns KB no total.
+
+Do lado do servidor, features_de_resumo faz o mesmo que extract_region_features_uint8 (descarte de
+outliers, média/mediana/média aparada/percentis por histograma, agrupamento ponderado do motor "histograma")
+sobre os centros das células, com a contagem de cada uma como peso; a classificação e as paletas são as do
+/analisar (pipeline.montar_resposta).
+
+resumir_fotos é a implementação de referência do resumo (o que o app deve reproduzir): roda o mesmo
+pré-processamento e a mesma segmentação do /analisar (pipeline.region_pixels) e quantiza os pixels da região.
+scripts/paridade_resumo.py compara o /analisar com o /analisar/features sobre as mesmas fotos.
+"""
+import time
+
+import numpy as np
+
+from processing import extract, histograma
+
+BINS = 32
+BINS_ACEITOS = (16, 32, 64)
+# Teto de pixels por região (uma foto de 48 MP inteira cabe com folga)
+MAX_PIXELS = 100_000_000
+REGIOES = (("rosto", "skin_face"), ("braco_interno", "skin_arm"), ("cabelo", "hair"))
+# |delta_a|, |delta_b| aceitos em wb_correction (a e b vão de -128 a 127)
+WB_MAX = 128.0
+
+
+class ResumoInvalido(ValueError):
+    """Resumo de região com formato inválido (vira HTTP 400)."""
+
+
+def histograma_lab(pixels_u8, bins=BINS):
+    """(índices das células ocupadas em ordem crescente, contagens) dos pixels LAB uint8 (Nx3)."""
+    if pixels_u8 is None or len(pixels_u8) == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    desloca = 8 - int(np.log2(bins))
+    q = pixels_u8.astype(np.int64) >> desloca
+    celulas = (q[:, 0] * bins + q[:, 1]) * bins + q[:, 2]
+    contagens = np.bincount(celulas, minlength=bins ** 3)
+    indices = np.flatnonzero(contagens)
+    return indices, contagens[indices]
+
+
+def resumir_regiao(pixels_u8, bins=BINS):
+    """Resumo JSON de uma região: {"bins", "indices", "contagens"}."""
+    indices, contagens = histograma_lab(pixels_u8, bins)
+    return {"bins": bins, "indices": indices.tolist(), "contagens": contagens.tolist()}
+
+
+def resumir_fotos(data_rosto, data_braco, data_cabelo, data_papel=None, bins=BINS):
+    """
+    Implementação de referência do app: o corpo JSON de /analisar/features para as mesmas fotos do /analisar
+    (correção de branco da foto com papel, quando houver, já aplicada nos histogramas).
+    """
+    from processing.pipeline import region_pixels, white_balance_from_paper
+    wb = white_balance_from_paper(data_papel) if data_papel else None
+    corpo = {"wb_correction": list(wb) if wb else None, "wb_aplicado": True}
+    for (campo, role), data in zip(REGIOES, (data_rosto, data_braco, data_cabelo)):
+        corpo[campo] = resumir_regiao(region_pixels(data, role, wb), bins)
+    return corpo
+
+
+def conferir(regiao):
+    """(bins, índices int64, contagens int64) validados de um resumo de região; levanta ResumoInvalido."""
+    bins = regiao.get("bins", BINS)
+    if bins not in BINS_ACEITOS:
+        raise ResumoInvalido("bins deve ser um de %s." % ", ".join(str(b) for b in BINS_ACEITOS))
+    try:
+        indices = np.asarray(regiao.get("indices") or [], dtype=np.int64)
+        contagens = np.asarray(regiao.get("contagens") or [], dtype=np.int64)
+    except (TypeError, ValueError, OverflowError):
+        raise ResumoInvalido("indices e contagens devem ser listas de inteiros.")
+    if indices.ndim != 1 or indices.shape != contagens.shape:
+        raise ResumoInvalido("indices e contagens devem ter o mesmo tamanho.")
+    if len(indices) and (indices.min() < 0 or indices.max() >= bins ** 3):
+        raise ResumoInvalido("Índice de célula fora de 0..bins³-1.")
+    if len(np.unique(indices)) != len(indices):
+        raise ResumoInvalido("Índice de célula repetido.")
+    # Teto por célula antes da soma: contagens enormes somadas em int64 dão a volta e passariam no teto
+    if len(contagens) and (contagens.min() <= 0 or contagens.max() > MAX_PIXELS or contagens.sum() > MAX_PIXELS):
+        raise ResumoInvalido("Contagens devem ser positivas (até %d pixels por região)." % MAX_PIXELS)
+    return bins, indices, contagens
+
+
+def _niveis(bins, wb_correction=None):
+    """
+    Valor LAB (unidades do pipeline) do centro de cada nível por canal, (3, bins). Com wb_correction
+    (histograma sem a correção aplicada), desloca a,b como preprocess._shift_ab_inplace (com clip em 0-255).
+    """
+    largura = 256 // bins
+    centro = np.arange(bins, dtype=np.float64) * largura + (largura - 1) / 2.0
+    a8, b8 = centro.copy(), centro.copy()
+    if wb_correction is not None:
+        a8 = np.clip(a8 - wb_correction[0], 0, 255)
+        b8 = np.clip(b8 - wb_correction[1], 0, 255)
+    return np.stack([centro * (100 / 255), a8 - 128, b8 - 128])
+
+
+def features_de_resumo(regiao, wb_correction=None):
+    """
+    extract_region_features_uint8 a partir do resumo de uma região: mesmo dict de saída, ou None se vazio.
+    Cada célula entra com o valor do seu centro e a contagem como peso; o agrupamento é sempre o ponderado
+    do motor "histograma" (kmeans/minibatch precisariam dos pixels), qualquer que seja COLORIMETRIA_CLUSTER.
+    wb_correction: (delta_a, delta_b) a aplicar, quando o histograma veio sem correção (wb_aplicado=false).
+    """
+    bins, indices, contagens = conferir(regiao)
+    if len(indices) == 0:
+        return None
+    q = np.stack([indices // (bins * bins), (indices // bins) % bins, indices % bins], axis=1)
+    niveis = _niveis(bins, wb_correction)
+    centros = np.stack([niveis[c][q[:, c]] for c in range(3)], axis=1)
+
+    # Descarte como discard_outliers: L fora de [15, 95] ou croma > 80; se sobrar <= 10 pixels, fica tudo
+    croma = np.hypot(centros[:, 1], centros[:, 2])
+    manter = (centros[:, 0] >= 15) & (centros[:, 0] <= 95) & (croma <= 80)
+    if contagens[manter].sum() > 10:
+        q, centros, contagens = q[manter], centros[manter], contagens[manter]
+
+    # Histogramas por canal (bins níveis) → as mesmas estatísticas de histograma.resumo
+    hist = np.stack([np.bincount(q[:, c], weights=contagens, minlength=bins) for c in range(3)]).astype(np.int64)
+    mean_lab = histograma.media(hist, niveis)
+    if len(centros) >= 3:
+        centers, props = extract.dominant_clusters(
+            centros.astype(np.float32), n_clusters=3, engine="histograma", sample_weight=contagens.astype(np.float64)
+        )
+    else:
+        centers, props = [], []
+    a, b = mean_lab[1], mean_lab[2]
+    return {
+        "mean_lab": mean_lab,
+        "median_lab": histograma.mediana(hist, niveis),
+        "trimmed_mean_lab": histograma.media_aparada(hist, histograma.APARAR, niveis),
+        "percentiles_lab": histograma.percentis(hist, histograma.PERCENTIS, niveis),
+        "clusters": centers,
+        "cluster_proportions": props,
+        "chroma_mean": float(np.sqrt(a * a + b * b)),
+        "n_pixels": int(contagens.sum()),
+    }
+
+
+def analisar_resumo(pedido, calib=None):
+    """
+    Resposta do /analisar a partir do corpo de /analisar/features (dict já validado pelo pydantic).
+    Roda no pool do servidor, como pipeline.analisar (o agrupamento usa sklearn).
+    """
+    from processing.pipeline import montar_resposta
+    t0 = time.perf_counter()
+    wb = pedido.get("wb_correction")
+    corrigir = None if pedido.get("wb_aplicado", True) or not wb else wb
+    feats = [
+        features_de_resumo(pedido[campo], wb_correction=corrigir) if pedido.get(campo) else None
+        for campo, _ in REGIOES
+    ]
+    t1 = time.perf_counter()
+    resposta = montar_resposta(*feats, calib)
+    resposta["metadados"]["entrada"] = "resumo"
+    resposta["metadados"]["tempos_ms"] = {
+        "extracao": round((t1 - t0) * 1000, 2),
+        "classificacao": round((time.perf_counter() - t1) * 1000, 2),
+    }
+    resposta["metadados"]["n_pixels"] = {campo: (f or {}).get("n_pixels", 0) for (campo, _), f in zip(REGIOES, feats)}
+    return resposta
@@ -1,81 +1,210 @@
 """
 Segmentação: rosto, pele, cabelo usando MediaPipe + OpenCV.
 """
+import os
+import threading
 import numpy as np
 import cv2
 
+from processing import metrics, skin_lut
 
+# Pool de FaceMesh: uma instância por thread (o grafo do MediaPipe não é thread-safe) e por processo,
+# criada sob demanda e reutilizada entre chamadas. Montar o grafo custa mais que processar uma foto.
+_FACE_MESH_LOCAL = threading.local()
+_FACE_MESH_LOCK = threading.Lock()
+_FACE_MESH_TODOS = []
+_FACE_MESH_GERACAO = 0
+
+# Folga mínima (px) da caixa do rosto: maior que o fechamento + abertura da pele (elipse de 5 px), para a
+# morfologia no recorte dar o mesmo resultado que na imagem inteira
+_MARGEM_MIN_PX = 12
+
+
+def _create_face_mesh():
+    import mediapipe as mp
+    return mp.solutions.face_mesh.FaceMesh(
+        static_image_mode=True,
+        max_num_faces=1,
+        refine_landmarks=True,
+        min_detection_confidence=0.5,
+    )
+
+
+def get_face_mesh():
+    """FaceMesh da thread atual (cria na primeira chamada; recria após close_face_meshes ou fork)."""
+    chave = (os.getpid(), _FACE_MESH_GERACAO)
+    if getattr(_FACE_MESH_LOCAL, "chave", None) != chave:
+        face_mesh = _create_face_mesh()
+        with _FACE_MESH_LOCK:
+            _FACE_MESH_TODOS.append(face_mesh)
+        _FACE_MESH_LOCAL.face_mesh = face_mesh
+        _FACE_MESH_LOCAL.chave = chave
+    return _FACE_MESH_LOCAL.face_mesh
+
+
+def close_face_meshes():
+    """Fecha todas as instâncias do pool (encerramento do app/worker). Chamadas seguintes recriam."""
+    global _FACE_MESH_GERACAO
+    with _FACE_MESH_LOCK:
+        _FACE_MESH_GERACAO += 1
+        todos = list(_FACE_MESH_TODOS)
+        _FACE_MESH_TODOS.clear()
+    for face_mesh in todos:
+        try:
+            face_mesh.close()
+        except Exception:
+            pass
+
+
+def warmup_face_mesh():
+    """Cria o FaceMesh da thread atual e roda uma inferência em imagem vazia (aquecimento)."""
+    try:
+        get_face_mesh().process(np.zeros((64, 64, 3), dtype=np.uint8))
+        return True
+    except Exception:
+        return False
+
+
+def _landmarks(img_bgr, mp_face=None):
+    """Pontos (N×2 int32, px) dos landmarks do primeiro rosto, ou None se o FaceMesh não achou rosto."""
+    if mp_face is None:
+        mp_face = get_face_mesh()
+    rgb = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2RGB)
+    h, w = img_bgr.shape[:2]
+    results = mp_face.process(rgb)
+    if not results.multi_face_landmarks:
+        return None
+    pts = []
+    for lm in results.multi_face_landmarks[0].landmark:
+        x, y = int(lm.x * w), int(lm.y * h)
+        pts.append([x, y])
+    return np.array(pts, dtype=np.int32)
+
+
+def _contorno(pts):
+    """
+    Envoltória convexa dos landmarks. fillConvexPoly precisa de um polígono convexo em ordem: com os 468
+    pontos na ordem do FaceMesh, o preenchimento sai recortado e muda com a resolução.
+    """
+    return cv2.convexHull(pts)
+
+
+def _mascara_central(h, w):
+    """Fallback sem MediaPipe: centro 60% da imagem (assume rosto no centro)."""
+    x1, x2 = int(w * 0.2), int(w * 0.8)
+    y1, y2 = int(h * 0.2), int(h * 0.75)
+    mask = np.zeros((h, w), dtype=np.uint8)
+    mask[y1:y2, x1:x2] = 255
+    return mask
+
+
+@metrics.medir()
 def segment_face_mediapipe(img_bgr, mp_face=None):
     """
     Retorna máscara do rosto (região facial) usando MediaPipe Face Mesh.
-    Se mp_face for None, usa região central como fallback (retângulo).
+    Se mp_face for None, usa o FaceMesh do pool (get_face_mesh); sem MediaPipe, região central (retângulo).
     """
     try:
-        import mediapipe as mp
-        if mp_face is None:
-            mp_face = mp.solutions.face_mesh.FaceMesh(
-                static_image_mode=True,
-                max_num_faces=1,
-                refine_landmarks=True,
-                min_detection_confidence=0.5,
-            )
-        rgb = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2RGB)
+        pts = _landmarks(img_bgr, mp_face)
         h, w = img_bgr.shape[:2]
-        results = mp_face.process(rgb)
         mask = np.zeros((h, w), dtype=np.uint8)
-        if results.multi_face_landmarks:
-            pts = []
-            for lm in results.multi_face_landmarks[0].landmark:
-                x, y = int(lm.x * w), int(lm.y * h)
-                pts.append([x, y])
-            pts = np.array(pts, dtype=np.int32)
-            cv2.fillConvexPoly(mask, pts, 255)
+        if pts is not None:
+            cv2.fillConvexPoly(mask, _contorno(pts), 255)
         return mask
     except Exception:
-        h, w = img_bgr.shape[:2]
-        # Fallback: centro 60% da imagem (assume rosto no centro)
-        x1, x2 = int(w * 0.2), int(w * 0.8)
-        y1, y2 = int(h * 0.2), int(h * 0.75)
-        mask = np.zeros((h, w), dtype=np.uint8)
-        mask[y1:y2, x1:x2] = 255
-        return mask
+        return _mascara_central(*img_bgr.shape[:2])
 
 
-def segment_skin_region(img_bgr, face_mask=None):
+@metrics.medir()
+def segment_face_roi(img_bgr, margem=0.1, mp_face=None):
+    """
+    Como segment_face_mediapipe, mas devolve (máscara, caixa): caixa = (x0, y0, x1, y1) dos landmarks com
+    margem (proporção do lado da caixa, no mínimo _MARGEM_MIN_PX), cortada na imagem, e a máscara só do
+    recorte img_bgr[y0:y1, x0:x1]. segment_skin_region e get_region_pixels* recebem a mesma caixa e trabalham
+    só no recorte: o custo acompanha o tamanho do rosto, não o da foto.
+    Sem rosto ou sem MediaPipe: (máscara da imagem inteira, None), como segment_face_mediapipe.
+    """
+    h, w = img_bgr.shape[:2]
+    try:
+        pts = _landmarks(img_bgr, mp_face)
+    except Exception:
+        return _mascara_central(h, w), None
+    if pts is None:
+        return np.zeros((h, w), dtype=np.uint8), None
+    x0, y0 = pts.min(axis=0)
+    x1, y1 = pts.max(axis=0) + 1
+    folga_x = max(int(round((x1 - x0) * margem)), _MARGEM_MIN_PX)
+    folga_y = max(int(round((y1 - y0) * margem)), _MARGEM_MIN_PX)
+    x0, y0 = max(0, int(x0) - folga_x), max(0, int(y0) - folga_y)
+    x1, y1 = min(w, int(x1) + folga_x), min(h, int(y1) + folga_y)
+    if x1 <= x0 or y1 <= y0:
+        return np.zeros((h, w), dtype=np.uint8), None
+    mask = np.zeros((y1 - y0, x1 - x0), dtype=np.uint8)
+    cv2.fillConvexPoly(mask, _contorno(pts - np.array([x0, y0], dtype=np.int32)), 255)
+    return mask, (x0, y0, x1, y1)
+
+
+def recortar(img, caixa):
+    """img[y0:y1, x0:x1] (uma view, sem cópia); caixa None = img inteira."""
+    if caixa is None:
+        return img
+    x0, y0, x1, y1 = caixa
+    return img[y0:y1, x0:x1]
+
+
+def _kernel(size, scale=1.0):
+    """Elemento estruturante elíptico de size px na resolução original; None se some na escala dada."""
+    k = int(round(size * scale))
+    if k < 2:
+        return None
+    return cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (k, k))
+
+
+@metrics.medir()
+def segment_skin_region(img_bgr, face_mask=None, scale=1.0, hsv=None, modelo=None, caixa=None):
     """
     Região de pele: dentro do rosto, excluindo cores muito escuras/claras (olhos, sombras).
-    Usa range HSV para pele.
+    Usa range HSV para pele, ou a tabela de cores de skin_lut quando houver modelo.
+    scale: resolução analisada / original (pre["scale"]); ajusta a morfologia à imagem reduzida.
+    hsv: HSV já calculado (pre["hsv"]); se None, converte img_bgr (só nas regras HSV).
+    modelo: skin_lut.TabelaPele; None = o de COLORIMETRIA_PELE_LUT (sem arquivo, regras HSV).
+    caixa: (x0, y0, x1, y1) de segment_face_roi; face_mask é a do recorte e a máscara devolvida também
+    (mesmos pixels que na imagem inteira, que fora da caixa seriam 0). img_bgr e hsv são os da imagem inteira.
     """
-    hsv = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2HSV)
+    if modelo is None:
+        modelo = skin_lut.padrao()
+    h, w = img_bgr.shape[:2]
+    img_bgr = recortar(img_bgr, caixa)
+    hsv = recortar(hsv, caixa) if hsv is not None else None
     if face_mask is None:
         face_mask = np.ones((img_bgr.shape[0], img_bgr.shape[1]), dtype=np.uint8) * 255
-    # Range típico para pele em HSV (OpenCV: H 0-180)
-    lower = np.array([0, 20, 70], dtype=np.uint8)
-    upper = np.array([25, 180, 255], dtype=np.uint8)
-    mask_hsv = cv2.inRange(hsv, lower, upper)
-    # Também H 160-180 (tom vermelho)
-    lower2 = np.array([160, 20, 70], dtype=np.uint8)
-    upper2 = np.array([180, 180, 255], dtype=np.uint8)
-    mask_hsv2 = cv2.inRange(hsv, lower2, upper2)
-    skin_mask = cv2.bitwise_or(mask_hsv, mask_hsv2)
+    if modelo is not None:
+        skin_mask = modelo.mascara(img_bgr)
+    else:
+        if hsv is None:
+            hsv = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2HSV)
+        # Range típico para pele em HSV (OpenCV: H 0-180, e 160-180 para o tom vermelho)
+        skin_mask = skin_lut.mascara_hsv(hsv)
     skin_mask = cv2.bitwise_and(skin_mask, face_mask)
-    kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (5, 5))
-    skin_mask = cv2.morphologyEx(skin_mask, cv2.MORPH_CLOSE, kernel)
-    skin_mask = cv2.morphologyEx(skin_mask, cv2.MORPH_OPEN, kernel)
+    kernel = _kernel(5, scale)
+    if kernel is not None:
+        skin_mask = cv2.morphologyEx(skin_mask, cv2.MORPH_CLOSE, kernel)
+        skin_mask = cv2.morphologyEx(skin_mask, cv2.MORPH_OPEN, kernel)
     # Fallback: se não encontrou pele (ex.: braço externo mais bronzeado), usa região central
     if np.sum(skin_mask) < 500:
-        h, w = img_bgr.shape[:2]
         fallback = np.zeros((h, w), dtype=np.uint8)
         x1, x2 = int(w * 0.1), int(w * 0.9)
         y1, y2 = int(h * 0.1), int(h * 0.9)
         fallback[y1:y2, x1:x2] = 255
-        skin_mask = cv2.bitwise_and(fallback, face_mask)
+        skin_mask = cv2.bitwise_and(recortar(fallback, caixa), face_mask)
     return skin_mask
 
 
-def segment_hair_region(img_bgr, face_mask=None):
+@metrics.medir()
+def segment_hair_region(img_bgr, face_mask=None, scale=1.0):
     """
     Região de cabelo: geralmente mais escura que a pele, bordas superiores/laterais.
+    scale: como em segment_skin_region.
     """
     gray = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2GRAY)
     h, w = gray.shape[:2]
@@ -87,15 +216,25 @@ def segment_hair_region(img_bgr, face_mask=None):
     top_region[: int(h * 0.6), :] = 255
     hair_mask = cv2.bitwise_and(dark_mask, top_region)
     hair_mask = cv2.bitwise_and(hair_mask, face_mask)
-    kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (7, 7))
-    hair_mask = cv2.morphologyEx(hair_mask, cv2.MORPH_CLOSE, kernel)
+    kernel = _kernel(7, scale)
+    if kernel is not None:
+        hair_mask = cv2.morphologyEx(hair_mask, cv2.MORPH_CLOSE, kernel)
     return hair_mask
 
 
-def get_region_pixels(lab, mask):
-    """Retorna pixels LAB onde mask > 0 (em formato Nx3)."""
+def get_region_pixels(lab, mask, caixa=None):
+    """Retorna pixels LAB onde mask > 0 (em formato Nx3). caixa: mask é a do recorte (segment_face_roi)."""
+    lab = recortar(lab, caixa)
     h, w = lab.shape[:2]
     if mask.shape[:2] != (h, w):
         mask = cv2.resize(mask, (w, h), interpolation=cv2.INTER_NEAREST)
-    pts = np.where(mask.flatten() > 0)[0]
-    return lab.reshape(-1, 3)[pts]
+    return lab[mask > 0]
+
+
+def get_region_pixels_uint8(lab_uint8, mask, caixa=None):
+    """Como get_region_pixels, para o LAB uint8 do OpenCV: Nx3 uint8 (3 bytes por pixel da região)."""
+    lab_uint8 = recortar(lab_uint8, caixa)
+    h, w = lab_uint8.shape[:2]
+    if mask.shape[:2] != (h, w):
+        mask = cv2.resize(mask, (w, h), interpolation=cv2.INTER_NEAREST)
+    return lab_uint8[mask > 0]
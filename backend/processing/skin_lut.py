@@ -0,0 +1,162 @@
+"""
+Modelo de pele por tabela de cores: uma tabela 3-D de bits (pele sim/não) indexada pela cor quantizada em BGR
+ou YCrCb, gravada em .npz e carregada com COLORIMETRIA_PELE_LUT. Substitui as regras HSV de
+segment_skin_region (dois inRange + OR) por uma consulta por pixel.
+
+A tabela guarda 2^bits níveis por canal (bits=6: 64³ células, 32 KB empacotados). Ao carregar, ela é expandida
+para 2^24 entradas uint8 (16 MB por processo), indexadas pela cor inteira: o pixel BGRA visto como uint32, sem
+o alfa. A consulta é então um cvtColor + um np.take, sem montar índices quantizados em NumPy.
+Treino offline: scripts/treinar_pele_lut.py (fotos de referencia_cor); comparação com as regras HSV:
+benchmarks/pele_lut.py.
+"""
+import hashlib
+import json
+import sys
+import threading
+
+import numpy as np
+
+from processing import config
+
+# cv2 é importado dentro das funções: pipeline/main usam padrao()/assinatura_padrao() no processo do servidor,
+# que não carrega OpenCV (arranque a frio).
+
+ESPACOS = ("bgr", "ycrcb")
+
+# Regras HSV de segment_skin_region (OpenCV: H 0-180): pele = qualquer uma das faixas
+FAIXAS_HSV = (
+    ((0, 20, 70), (25, 180, 255)),
+    ((160, 20, 70), (180, 180, 255)),    # tom vermelho
+)
+
+
+def mascara_hsv(hsv):
+    """Máscara de pele (uint8 0/255) das regras HSV sobre uma imagem HSV."""
+    import cv2
+    mask = None
+    for lower, upper in FAIXAS_HSV:
+        faixa = cv2.inRange(hsv, np.array(lower, dtype=np.uint8), np.array(upper, dtype=np.uint8))
+        mask = faixa if mask is None else cv2.bitwise_or(mask, faixa)
+    return mask
+
+
+def centros(espaco, bits):
+    """Cor BGR do centro de cada célula da tabela, como imagem (2^bits, 4^bits, 3) na ordem da tabela."""
+    import cv2
+    n = 1 << bits
+    niveis = (np.arange(n, dtype=np.uint16) << (8 - bits)) + ((1 << (8 - bits)) >> 1)
+    grade = np.stack(np.meshgrid(niveis, niveis, niveis, indexing="ij"), axis=-1).astype(np.uint8)
+    img = grade.reshape(n, n * n, 3)
+    if espaco == "ycrcb":
+        img = cv2.cvtColor(img, cv2.COLOR_YCrCb2BGR)
+    return img
+
+
+def tabela_hsv(espaco="bgr", bits=8):
+    """Tabela (2^bits)³ bool com as regras HSV avaliadas no centro de cada célula (bgr com 8 bits: exata)."""
+    import cv2
+    n = 1 << bits
+    hsv = cv2.cvtColor(centros(espaco, bits), cv2.COLOR_BGR2HSV)
+    return (mascara_hsv(hsv) > 0).reshape(n, n, n)
+
+
+def quantizar(pixels, bits):
+    """Índices (N, 3) da célula de cada cor (N, 3 uint8) no espaço da tabela."""
+    return (np.asarray(pixels, dtype=np.uint8) >> (8 - bits)).astype(np.intp)
+
+
+def converter(img_bgr, espaco):
+    """Imagem no espaço da tabela (3 canais uint8)."""
+    import cv2
+    return cv2.cvtColor(img_bgr, cv2.COLOR_BGR2YCrCb) if espaco == "ycrcb" else img_bgr
+
+
+class TabelaPele:
+    """Tabela de pele (espaco, bits, tabela bool (2^bits)³ indexada [c0, c1, c2]) com a consulta por pixel."""
+
+    def __init__(self, tabela, espaco="bgr", bits=6, meta=None):
+        if espaco not in ESPACOS:
+            raise ValueError("espaço de cor desconhecido: %s (use %s)" % (espaco, ", ".join(ESPACOS)))
+        if not 1 <= bits <= 8:
+            raise ValueError("bits deve estar entre 1 e 8.")
+        n = 1 << bits
+        self.tabela = np.asarray(tabela, dtype=bool).reshape(n, n, n)
+        self.espaco = espaco
+        self.bits = bits
+        self.meta = dict(meta or {})
+        self._cheia = None
+        self._lock = threading.Lock()
+
+    @property
+    def assinatura(self):
+        """Hash curto do conteúdo (entra na chave do cache: trocar o modelo não reaproveita máscaras antigas)."""
+        h = hashlib.sha256(("%s:%d:" % (self.espaco, self.bits)).encode())
+        h.update(np.packbits(self.tabela).tobytes())
+        return h.hexdigest()[:16]
+
+    def _tabela_cheia(self):
+        """2^24 uint8 (0/255) indexadas por c0 | c1 << 8 | c2 << 16 (o pixel BGRA como uint32 little-endian)."""
+        if self._cheia is None:
+            with self._lock:
+                if self._cheia is None:
+                    r = 1 << (8 - self.bits)
+                    cheia = self.tabela
+                    for eixo in range(3):
+                        cheia = np.repeat(cheia, r, axis=eixo)
+                    # Eixos invertidos: c2 varia mais devagar no índice uint32
+                    cheia = np.ascontiguousarray(cheia.transpose(2, 1, 0)).reshape(-1)
+                    self._cheia = cheia.view(np.uint8) * np.uint8(255)
+        return self._cheia
+
+    def mascara(self, img_bgr):
+        """Máscara de pele (uint8 0/255, H×W) da imagem BGR."""
+        import cv2
+        cheia = self._tabela_cheia()
+        # BGRA (alfa 255) visto como uint32: o índice é a cor inteira depois de zerar o alfa
+        indices = cv2.cvtColor(converter(img_bgr, self.espaco), cv2.COLOR_BGR2BGRA).view(np.uint32)[:, :, 0]
+        np.bitwise_and(indices, np.uint32(0xFFFFFF), out=indices)
+        return np.take(cheia, indices)
+
+    def salvar(self, path):
+        np.savez_compressed(
+            path, bits=np.packbits(self.tabela), espaco=np.array(self.espaco), n_bits=np.array(self.bits),
+            meta=np.array(json.dumps(self.meta, ensure_ascii=False)),
+        )
+
+    @classmethod
+    def carregar(cls, path):
+        with np.load(path, allow_pickle=False) as dados:
+            bits = int(dados["n_bits"])
+            n = 1 << bits
+            tabela = np.unpackbits(dados["bits"], count=n ** 3).astype(bool)
+            meta = json.loads(str(dados["meta"])) if "meta" in dados else {}
+            return cls(tabela, espaco=str(dados["espaco"]), bits=bits, meta=meta)
+
+
+_PADRAO = None
+_PADRAO_LOCK = threading.Lock()
+
+
+def padrao():
+    """
+    TabelaPele de COLORIMETRIA_PELE_LUT (carregada uma vez por processo) ou None: regras HSV.
+    Arquivo ausente ou inválido: avisa uma vez e segue com as regras HSV.
+    """
+    global _PADRAO
+    if not config.PELE_LUT:
+        return None
+    if _PADRAO is None:
+        with _PADRAO_LOCK:
+            if _PADRAO is None:
+                try:
+                    _PADRAO = TabelaPele.carregar(config.PELE_LUT)
+                except (OSError, KeyError, ValueError) as e:
+                    print("Modelo de pele %s ignorado: %s" % (config.PELE_LUT, e), file=sys.stderr)
+                    _PADRAO = False
+    return _PADRAO or None
+
+
+def assinatura_padrao():
+    """Identifica o modelo de pele em uso nas chaves de cache ("hsv" sem tabela)."""
+    modelo = padrao()
+    return "hsv" if modelo is None else modelo.assinatura
@@ -0,0 +1,121 @@
+"""
+Ingestão das fotos enviadas: teto de bytes por foto e por requisição e reconhecimento do formato pelos
+primeiros bytes (assinatura), para recusar o que não é imagem antes de ler o arquivo inteiro.
+Sem OpenCV/PIL: roda no processo do servidor.
+"""
+from fastapi import HTTPException
+
+# Assinaturas (magic bytes) dos formatos que cv2.imdecode lê
+_ASSINATURAS = (
+    (b"\xff\xd8\xff", "jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "png"),
+    (b"BM", "bmp"),
+    (b"II*\x00", "tiff"),
+    (b"MM\x00*", "tiff"),
+)
+# Bytes necessários para reconhecer qualquer formato acima (WEBP: "RIFF" + tamanho + "WEBP")
+TAMANHO_CABECALHO = 16
+# Tamanho dos blocos lidos do upload
+_BLOCO = 1024 * 1024
+
+
+class UploadRecusado(ValueError):
+    """Foto/requisição recusada antes do pipeline. status: 413 (grande demais) ou 415 (não é imagem)."""
+
+    def __init__(self, mensagem, status=415):
+        super().__init__(mensagem)
+        self.status = status
+
+
+def formato_imagem(cabecalho):
+    """Formato ("jpeg", "png", "webp", "bmp", "tiff") pelos primeiros bytes; None se não reconhecer."""
+    cabecalho = bytes(cabecalho[:TAMANHO_CABECALHO])
+    if cabecalho[:4] == b"RIFF" and cabecalho[8:12] == b"WEBP":
+        return "webp"
+    for assinatura, formato in _ASSINATURAS:
+        if cabecalho.startswith(assinatura):
+            return formato
+    return None
+
+
+def conferir_foto(campo, cabecalho, tamanho, max_bytes):
+    """Levanta UploadRecusado se tamanho (bytes, ou None se desconhecido) passa do teto ou se não é imagem."""
+    if tamanho is not None and max_bytes and tamanho > max_bytes:
+        raise UploadRecusado(
+            "%s: foto grande demais (%.1f MB; máximo %.1f MB)." % (campo, tamanho / 1048576.0, max_bytes / 1048576.0),
+            status=413,
+        )
+    if formato_imagem(cabecalho) is None:
+        raise UploadRecusado("%s: o arquivo não é uma imagem JPEG, PNG, WEBP, BMP ou TIFF." % campo, status=415)
+
+
+async def ler_foto(upload, campo, max_bytes):
+    """
+    Bytes de um UploadFile, recusando (UploadRecusado) pelo cabeçalho e pelo tamanho antes de ler o resto.
+    Lê direto do arquivo temporário do upload para um único buffer, sem cópias intermediárias.
+    """
+    cabecalho = await upload.read(TAMANHO_CABECALHO)
+    conferir_foto(campo, cabecalho, upload.size, max_bytes)
+    if upload.size is not None:
+        await upload.seek(0)
+        return await upload.read(upload.size)
+    # Tamanho desconhecido: lê em blocos, parando no teto
+    partes = [cabecalho]
+    total = len(cabecalho)
+    while True:
+        bloco = await upload.read(_BLOCO)
+        if not bloco:
+            break
+        total += len(bloco)
+        conferir_foto(campo, cabecalho, total, max_bytes)
+        partes.append(bloco)
+    return b"".join(partes)
+
+
+class LimiteCorpo:
+    """
+    Middleware ASGI: recusa com 413 requisições cujo corpo passa do teto da rota, pelo Content-Length
+    (sem ler nada) ou contando os bytes recebidos (upload sem Content-Length).
+    limites: lista de (prefixo do caminho, teto em bytes); vale o primeiro prefixo que casar.
+    """
+
+    def __init__(self, app, limites):
+        self.app = app
+        self.limites = limites
+
+    def _limite(self, caminho):
+        for prefixo, limite in self.limites:
+            if caminho.startswith(prefixo):
+                return limite
+        return 0
+
+    async def _recusar(self, send, limite):
+        corpo = ('{"detail":"Requisição grande demais (máximo %.1f MB)."}' % (limite / 1048576.0)).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": 413,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(corpo)).encode())],
+        })
+        await send({"type": "http.response.body", "body": corpo})
+
+    async def __call__(self, scope, receive, send):
+        limite = self._limite(scope.get("path", "")) if scope["type"] == "http" else 0
+        if not limite:
+            return await self.app(scope, receive, send)
+        tamanho = dict(scope.get("headers") or ()).get(b"content-length")
+        if tamanho is not None and tamanho.isdigit() and int(tamanho) > limite:
+            return await self._recusar(send, limite)
+
+        recebidos = 0
+
+        async def receber():
+            nonlocal recebidos
+            mensagem = await receive()
+            if mensagem["type"] == "http.request":
+                recebidos += len(mensagem.get("body", b""))
+                if recebidos > limite:
+                    raise HTTPException(status_code=413, detail="Requisição grande demais (máximo %.1f MB)." % (
+                        limite / 1048576.0))
+            return mensagem
+
+        return await self.app(scope, receber, send)
@@ -0,0 +1,95 @@
+"""
+Benchmark do arranque a frio: em processos Python novos, mede o tempo de `import main` (com orçamento),
+confere que as dependências pesadas (OpenCV, sklearn, scikit-image, colormath, MediaPipe) não foram
+importadas pelo servidor e, opcionalmente, o tempo até /prontidao responder 200 e até a primeira
+resposta de /analisar (referencia_cor), com e sem COLORIMETRIA_AQUECER.
+Sai com código 1 se o import passar do orçamento ou puxar algum módulo pesado.
+Execute na raiz do projeto: python -m backend.scripts.bench_arranque [--orcamento-ms 1000] [--primeira-analise]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+BACKEND = os.path.join(ROOT, "backend")
+REF_DIR = os.path.join(ROOT, "referencia_cor")
+
+# Não podem ser importados por `import main` (só nos workers, sob demanda)
+MODULOS_PESADOS = ("cv2", "sklearn", "skimage", "scipy", "colormath", "mediapipe")
+# Orçamento de `import main` (mediana), medido com FastAPI + NumPy sozinhos em ~0.5 s
+ORCAMENTO_IMPORT_MS = 1000
+
+_IMPORT = """
+import json, sys, time
+t0 = time.perf_counter()
+import main
+ms = (time.perf_counter() - t0) * 1000
+print(json.dumps({"ms": ms, "pesados": [m for m in %r if m in sys.modules]}))
+""" % (MODULOS_PESADOS,)
+
+_PRIMEIRA = """
+import json, time
+t0 = time.perf_counter()
+import main
+from fastapi.testclient import TestClient
+R = %r
+with TestClient(main.app) as c:
+    t_startup = time.perf_counter()
+    while c.get("/prontidao").status_code != 200:
+        time.sleep(0.05)
+    t_pronto = time.perf_counter()
+    files = {nome: (arq, open(R + "/" + arq, "rb")) for nome, arq in (
+        ("rosto", "rosto.png"), ("rosto_com_papel", "rosto_papel.jpg"),
+        ("braco_interno", "interno_braco.png"), ("cabelo", "cabelo.png"))}
+    status = c.post("/analisar", files=files).status_code
+    t_resp = time.perf_counter()
+print(json.dumps({"startup_s": t_startup - t0, "pronto_s": t_pronto - t0, "primeira_resposta_s": t_resp - t0,
+                  "status": status}))
+""" % (REF_DIR,)
+
+
+def run_python(code, env_extra=None):
+    env = dict(os.environ, **(env_extra or {}))
+    # Cache desligado: a primeira análise tem de rodar o pipeline de verdade
+    env.setdefault("COLORIMETRIA_CACHE_MB", "0")
+    env.pop("COLORIMETRIA_CACHE_SQLITE", None)
+    out = subprocess.run([sys.executable, "-c", code], cwd=BACKEND, env=env, capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeticoes", type=int, default=5)
+    parser.add_argument("--orcamento-ms", type=float, default=ORCAMENTO_IMPORT_MS)
+    parser.add_argument("--primeira-analise", action="store_true",
+                        help="mede também /prontidao e a primeira /analisar (com e sem aquecimento)")
+    args = parser.parse_args()
+
+    amostras = [run_python(_IMPORT) for _ in range(args.repeticoes)]
+    tempos = sorted(a["ms"] for a in amostras)
+    pesados = sorted({m for a in amostras for m in a["pesados"]})
+    mediana = statistics.median(tempos)
+    print("import main: mediana %.0f ms (mín %.0f, máx %.0f; orçamento %.0f ms)" % (
+        mediana, tempos[0], tempos[-1], args.orcamento_ms))
+    print("módulos pesados importados: %s" % (", ".join(pesados) or "nenhum"))
+    ok = mediana <= args.orcamento_ms and not pesados
+
+    if args.primeira_analise:
+        print("%-22s %10s %10s %16s" % ("modo", "startup", "pronto", "1ª resposta"))
+        for nome, env in (("sem aquecimento", {"COLORIMETRIA_AQUECER": "0"}),
+                          ("com aquecimento", {"COLORIMETRIA_AQUECER": "1"})):
+            r = run_python(_PRIMEIRA, env)
+            print("%-22s %9.2fs %9.2fs %15.2fs%s" % (
+                nome, r["startup_s"], r["pronto_s"], r["primeira_resposta_s"],
+                "" if r["status"] == 200 else " (HTTP %d)" % r["status"]))
+            ok = ok and r["status"] == 200
+
+    print("OK" if ok else "FALHOU")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
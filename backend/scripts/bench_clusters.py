@@ -0,0 +1,60 @@
+"""
+Checagem de qualidade e tempo dos motores de dominant_clusters: roda o pipeline nas imagens de
+referencia_cor (opcionalmente ampliadas) e compara cada motor com o KMeans exato (comportamento original):
+maior delta E76 entre centros casados e maior diferença de proporção.
+Execute na raiz do projeto: python -m backend.scripts.bench_clusters [--mp 12] [--max-samples 20000]
+"""
+import argparse
+import os
+import sys
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+sys.path.insert(0, os.path.join(ROOT, "backend"))
+
+from processing.preprocess import preprocess_pipeline
+from processing.segment import segment_face_mediapipe, segment_skin_region, segment_hair_region, get_region_pixels
+from processing.extract import CLUSTER_ENGINES, discard_outliers, dominant_clusters, compare_clusters
+from scripts.bench_resolucao import REF_DIR, CASES, upscale_to_jpeg
+
+
+def region_pixels(data, region):
+    pre = preprocess_pipeline(data)
+    bgr, lab = pre["bgr"], pre["lab"]
+    if region == "skin_face":
+        mask = segment_skin_region(bgr, segment_face_mediapipe(bgr))
+    elif region == "skin_arm":
+        mask = segment_skin_region(bgr, None)
+    else:
+        mask = segment_hair_region(bgr, None)
+    return discard_outliers(get_region_pixels(lab, mask))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--mp", type=float, default=0, help="amplia as imagens para N megapixels (0 = original)")
+    parser.add_argument("--max-samples", type=int, default=None)
+    args = parser.parse_args()
+
+    print("%-18s %9s %-11s %9s %9s %9s" % ("imagem", "pixels", "motor", "tempo (s)", "dE76 máx", "dProp máx"))
+    for name, region in CASES:
+        path = os.path.join(REF_DIR, name)
+        if args.mp:
+            data = upscale_to_jpeg(path, args.mp)[0]
+        else:
+            with open(path, "rb") as f:
+                data = f.read()
+        pixels = region_pixels(data, region)
+        ref = None
+        for engine in CLUSTER_ENGINES:
+            t0 = time.perf_counter()
+            centers, props = dominant_clusters(pixels, 3, engine=engine, max_samples=args.max_samples)
+            dt = time.perf_counter() - t0
+            if ref is None:
+                ref = (centers, props)
+            de, dp = compare_clusters(ref[0], ref[1], centers, props)
+            print("%-18s %9d %-11s %9.3f %9.2f %9.3f" % (name, len(pixels), engine, dt, de, dp))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Benchmark da resolução de análise: roda preprocess + segmentação + extração nas imagens de
+referencia_cor ampliadas para 12/24/48 MP (JPEG, como sai do celular), em resolução cheia e com
+max_side, e mostra o tempo de cada um e o delta E (CIE76) do mean_lab entre os dois.
+Execute na raiz do projeto: python -m backend.scripts.bench_resolucao [--max-side 1280] [--mp 12 24 48]
+"""
+import argparse
+import math
+import os
+import sys
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+REF_DIR = os.path.join(ROOT, "referencia_cor")
+sys.path.insert(0, os.path.join(ROOT, "backend"))
+
+import cv2
+import numpy as np
+
+from processing.preprocess import preprocess_pipeline
+from processing.segment import segment_face_mediapipe, segment_skin_region, segment_hair_region, get_region_pixels
+from processing.extract import extract_region_features
+
+# (imagem, região)
+CASES = [
+    ("rosto.png", "skin_face"),
+    ("interno_braco.png", "skin_arm"),
+    ("cabelo.png", "hair"),
+]
+
+
+def upscale_to_jpeg(img_path, megapixels, quality=92):
+    """Amplia a imagem (INTER_CUBIC) até ~megapixels e devolve os bytes JPEG."""
+    img = cv2.imread(img_path, cv2.IMREAD_COLOR)
+    h, w = img.shape[:2]
+    scale = math.sqrt(megapixels * 1e6 / float(h * w))
+    big = cv2.resize(img, (int(w * scale), int(h * scale)), interpolation=cv2.INTER_CUBIC)
+    ok, buf = cv2.imencode(".jpg", big, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    return buf.tobytes(), big.shape
+
+
+def run_region(data, region, max_side=None):
+    """Pipeline de uma foto até o mean_lab; retorna (mean_lab, segundos)."""
+    t0 = time.perf_counter()
+    pre = preprocess_pipeline(data, max_side=max_side)
+    bgr, lab = pre["bgr"], pre["lab"]
+    if region == "skin_face":
+        mask = segment_skin_region(bgr, segment_face_mediapipe(bgr), scale=pre["scale"])
+    elif region == "skin_arm":
+        mask = segment_skin_region(bgr, None, scale=pre["scale"])
+    else:
+        mask = segment_hair_region(bgr, None, scale=pre["scale"])
+    feat = extract_region_features(get_region_pixels(lab, mask))
+    return (feat["mean_lab"] if feat else None), time.perf_counter() - t0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--max-side", type=int, default=1280)
+    parser.add_argument("--mp", type=float, nargs="+", default=[12, 24, 48])
+    args = parser.parse_args()
+
+    print("max_side=%d" % args.max_side)
+    print("%-18s %6s %11s %10s %10s %8s %8s" % ("imagem", "MP", "tamanho", "cheia (s)", "análise (s)", "ganho", "dE76"))
+    worst = 0.0
+    for name, region in CASES:
+        for mp in args.mp:
+            data, shape = upscale_to_jpeg(os.path.join(REF_DIR, name), mp)
+            full_lab, t_full = run_region(data, region)
+            small_lab, t_small = run_region(data, region, max_side=args.max_side)
+            de = float(np.linalg.norm(np.subtract(full_lab, small_lab))) if full_lab and small_lab else float("nan")
+            worst = max(worst, de)
+            print("%-18s %6.0f %11s %10.2f %10.3f %7.1fx %8.2f" % (
+                name, mp, "%dx%d" % (shape[1], shape[0]), t_full, t_small, t_full / max(t_small, 1e-9), de))
+    print("Pior delta E (mean_lab, resolução cheia vs análise): %.2f" % worst)
+
+
+if __name__ == "__main__":
+    main()
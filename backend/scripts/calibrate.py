@@ -3,22 +3,50 @@ Script de calibração: roda o pipeline nas imagens de referencia_cor e compara
 com as cores dos .txt (extraídas por ferramenta profissional). Calcula offset
 LAB para aplicar no pipeline e deixar resultados condizentes.
 Execute na raiz do projeto: python -m backend.scripts.calibrate
+
+Os casos vêm de um manifesto JSON (padrão: referencia_cor/manifesto.json), um por foto:
+    {"imagem": "ana_rosto.jpg", "referencia": "ana_rosto.txt", "regiao": "skin_face",
+     "papel": "ana_papel.jpg", "calibrar": true, "rotulos": {"tom": "medio", "luz": "janela"}}
+regiao: skin_face, skin_arm ou hair. papel (opcional): foto com folha branca cuja correção de branco
+vale para o caso. calibrar=false: o caso entra no relatório mas não no offset. rotulos: livres; o
+relatório resume o delta E por rótulo. Caminhos relativos à pasta do manifesto.
+
+Cada foto roda no mesmo caminho do servidor (pipeline.region_features), num pool de processos.
+As leituras ficam num cache SQLite (chave = bytes da foto + região + correção de branco + versão do
+código), então só fotos novas ou código alterado são reprocessados. O offset de cada região é uma
+estimativa robusta sobre todos os casos (descarte por MAD + média dos restantes); calib.json e o
+relatório são gravados de forma atômica (arquivo temporário + os.replace).
 """
-import io
+import argparse
+import json
+import multiprocessing
 import os
 import re
 import sys
-import json
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
 
 # raiz do repositório (pasta que contém backend/ e referencia_cor/)
 ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
 REF_DIR = os.path.join(ROOT, "referencia_cor")
 sys.path.insert(0, os.path.join(ROOT, "backend"))
 
-from processing.preprocess import preprocess_pipeline
-from processing.segment import segment_face_mediapipe, segment_skin_region, segment_hair_region, get_region_pixels
-from processing.extract import extract_region_features
-from processing.recommend import hex_to_lab, lab_to_hex
+from processing import config
+from processing.cache import ResultCache, hash_bytes
+from processing.recommend import hex_to_lab_batch, lab_to_hex
+
+MANIFESTO_PADRAO = os.path.join(REF_DIR, "manifesto.json")
+CALIB_PADRAO = os.path.join(ROOT, "backend", "processing", "calib.json")
+RELATORIO_PADRAO = os.path.join(ROOT, "backend", "scripts", "calib_report.json")
+CACHE_PADRAO = os.path.join(ROOT, "backend", "scripts", ".calibracao_cache.sqlite")
+REGIOES = ("skin_face", "skin_arm", "hair")
+# Módulos cujo código entra na chave do cache: mudou o código, as leituras são refeitas
+_MODULOS_DO_PIPELINE = ("config.py", "preprocess.py", "segment.py", "extract.py", "colorspace.py", "pipeline.py")
+# Desvio (em MADs) a partir do qual um caso é descartado da estimativa da região
+CORTE_MAD = 3.5
 
 
 def parse_hex_from_txt(txt_path, exclude_white=True):
@@ -53,141 +81,246 @@ def match_percent(delta_e):
     return max(0.0, min(100.0, 100.0 - delta_e * 5.0))
 
 
-def run_pipeline_on_image(img_path, region="skin", face_mask=None, wb_correction=None):
-    """Roda preprocess + segment + extract e retorna mean_lab (L 0-100, a,b float) ou None."""
-    if not os.path.isfile(img_path):
-        return None
-    with open(img_path, "rb") as f:
-        data = f.read()
-    pre = preprocess_pipeline(io.BytesIO(data), wb_correction=wb_correction)
-    if not pre:
+def versao_codigo():
+    """Versão do pipeline + opções de análise + hash do código dos módulos usados na leitura."""
+    pasta = os.path.join(ROOT, "backend", "processing")
+    fontes = []
+    for nome in _MODULOS_DO_PIPELINE:
+        with open(os.path.join(pasta, nome), "rb") as f:
+            fontes.append(f.read())
+    from processing.pipeline import VERSAO_PIPELINE
+    return hash_bytes(VERSAO_PIPELINE, str(config.MAX_LADO), config.CLUSTER_ENGINE, *fontes)
+
+
+def ler_manifesto(path):
+    """Lista de casos (dicts com caminhos absolutos), validada. Levanta ValueError se o manifesto for inválido."""
+    with open(path, "r", encoding="utf-8") as f:
+        dados = json.load(f)
+    base = os.path.dirname(os.path.abspath(path))
+    casos = []
+    for i, item in enumerate(dados.get("casos", []) if isinstance(dados, dict) else dados):
+        if item.get("regiao") not in REGIOES:
+            raise ValueError("Caso %d: regiao deve ser uma de %s." % (i, ", ".join(REGIOES)))
+        if not item.get("imagem") or not item.get("referencia"):
+            raise ValueError("Caso %d: imagem e referencia são obrigatórios." % i)
+        casos.append({
+            "imagem": os.path.join(base, item["imagem"]),
+            "referencia": os.path.join(base, item["referencia"]),
+            "regiao": item["regiao"],
+            "papel": os.path.join(base, item["papel"]) if item.get("papel") else None,
+            "calibrar": bool(item.get("calibrar", True)),
+            "rotulos": item.get("rotulos") or {},
+        })
+    return casos
+
+
+def _ler(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def _wb_do_papel(path):
+    """(No worker) correção de branco da foto com folha, ou None."""
+    from processing.pipeline import white_balance_from_paper
+    wb = white_balance_from_paper(_ler(path))
+    return list(wb) if wb else None
+
+
+def _leitura(path, regiao, wb):
+    """(No worker) leitura da foto pelo mesmo caminho do servidor: mean_lab/median_lab/n_pixels, ou None."""
+    from processing.pipeline import ImagemInvalida, region_features
+    try:
+        feat, _ = region_features(_ler(path), regiao, tuple(wb) if wb else None)
+    except ImagemInvalida:
         return None
-    bgr, lab = pre["bgr"], pre["lab"]
-    if region == "skin":
-        if face_mask is None:
-            face_mask = segment_face_mediapipe(bgr)
-        skin_mask = segment_skin_region(bgr, face_mask)
-        pixels = get_region_pixels(lab, skin_mask)
-    else:
-        hair_mask = segment_hair_region(bgr, None)
-        pixels = get_region_pixels(lab, hair_mask)
-    feat = extract_region_features(pixels)
     if not feat or not feat.get("mean_lab"):
         return None
-    return feat["mean_lab"]
+    return {"mean_lab": feat["mean_lab"], "median_lab": feat["median_lab"], "n_pixels": feat["n_pixels"]}
+
+
+def _rodar(tarefas, pool, cache, versao):
+    """
+    tarefas: {chave_local: (fn, args, bytes_para_chave)}. Busca no cache e manda só as faltantes ao pool
+    (ou roda no processo, se pool=None). Retorna ({chave_local: resultado}, nº de acertos do cache).
+    """
+    resultados, faltando, acertos = {}, {}, 0
+    for local, (fn, args, conteudo) in tarefas.items():
+        chave = hash_bytes(versao, fn.__name__, json.dumps(args[1:]), conteudo) if cache is not None else None
+        hit = cache.get(chave) if chave is not None else None
+        if hit is not None:
+            resultados[local] = hit["valor"]
+            acertos += 1
+        else:
+            faltando[local] = (fn, args, chave)
+    if pool is None:
+        for local, (fn, args, chave) in faltando.items():
+            resultados[local] = fn(*args)
+            if chave is not None:
+                cache.set(chave, {"valor": resultados[local]})
+        return resultados, acertos
+    futuros = {pool.submit(fn, *args): (local, chave) for local, (fn, args, chave) in faltando.items()}
+    for i, futuro in enumerate(as_completed(futuros), 1):
+        local, chave = futuros[futuro]
+        resultados[local] = futuro.result()
+        if chave is not None:
+            cache.set(chave, {"valor": resultados[local]})
+        if i % 25 == 0 or i == len(futuros):
+            print("  %d/%d processadas" % (i, len(futuros)), flush=True)
+    return resultados, acertos
+
+
+def estimar_offset(offsets):
+    """
+    Offset robusto de uma região: mediana e MAD por canal; casos a mais de CORTE_MAD MADs da mediana
+    (em qualquer canal) são descartados e o offset é a média dos restantes. Com menos de 3 casos, a mediana.
+    Retorna (offset [dL, da, db], índices descartados, MAD por canal).
+    """
+    arr = np.asarray(offsets, dtype=np.float64)
+    mediana = np.median(arr, axis=0)
+    mad = 1.4826 * np.median(np.abs(arr - mediana), axis=0)
+    if len(arr) < 3:
+        return mediana.tolist(), [], mad.tolist()
+    desvio = np.abs(arr - mediana) / np.where(mad > 1e-9, mad, np.inf)
+    manter = (desvio <= CORTE_MAD).all(axis=1) | (np.abs(arr - mediana) <= 1e-9).all(axis=1)
+    if not manter.any():
+        return mediana.tolist(), [], mad.tolist()
+    return arr[manter].mean(axis=0).tolist(), np.flatnonzero(~manter).tolist(), mad.tolist()
+
+
+def gravar_json_atomico(path, obj):
+    """Grava JSON em path sem deixar arquivo pela metade: temporário na mesma pasta + os.replace."""
+    pasta = os.path.dirname(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(prefix=".%s." % os.path.basename(path), suffix=".tmp", dir=pasta)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(obj, f, indent=2, ensure_ascii=False)
+            f.write("\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
 
 
 def main():
-    # (imagem, arquivo_txt, região)
-    # (imagem, txt, região pipeline, região calibração para API)
-    cases = [
-        (os.path.join(REF_DIR, "rosto_papel.jpg"), os.path.join(REF_DIR, "rosto_papel.txt"), "skin", "skin_face"),
-        (os.path.join(REF_DIR, "rosto.png"), os.path.join(REF_DIR, "rosto.txt"), "skin", "skin_face"),
-        (os.path.join(REF_DIR, "interno_braco.png"), os.path.join(REF_DIR, "interno_braco.txt"), "skin", "skin_arm"),
-        (os.path.join(REF_DIR, "externo_braco.png"), os.path.join(REF_DIR, "externo_braco.txt"), "skin", "skin_arm"),
-        (os.path.join(REF_DIR, "cabelo.png"), os.path.join(REF_DIR, "cor_cabelo.txt"), "hair", "hair"),
-    ]
-    offsets_by_region = {"skin_face": [], "skin_arm": [], "hair": []}  # list of (dL, da, db)
-    results = []
+    parser = argparse.ArgumentParser(description="Calibração LAB por região a partir de referencia_cor.")
+    parser.add_argument("--manifesto", default=MANIFESTO_PADRAO)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="processos (0 = no próprio processo)")
+    parser.add_argument("--cache", default=CACHE_PADRAO, help="SQLite com as leituras por foto")
+    parser.add_argument("--sem-cache", action="store_true", help="reprocessa tudo (não lê nem grava o cache)")
+    parser.add_argument("--saida", default=CALIB_PADRAO, help="calib.json gerado")
+    parser.add_argument("--relatorio", default=RELATORIO_PADRAO)
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    casos = ler_manifesto(args.manifesto)
+    versao = versao_codigo()
+    cache = None if args.sem_cache else ResultCache(0, sqlite_path=args.cache, sqlite_max_items=0)
+    pool = None
+    if args.workers > 0:
+        from processing.pipeline import init_worker
+        pool = ProcessPoolExecutor(
+            max_workers=args.workers, mp_context=multiprocessing.get_context("spawn"), initializer=init_worker
+        )
+    try:
+        # 1) Correção de branco de cada foto com folha (uma vez por foto, compartilhada pelos casos)
+        papeis = sorted({c["papel"] for c in casos if c["papel"] and os.path.isfile(c["papel"])})
+        wbs, acertos_wb = _rodar({p: (_wb_do_papel, (p,), _ler(p)) for p in papeis}, pool, cache, versao)
+        for p in papeis:
+            if wbs[p]:
+                print("WB a partir de %s: delta_a=%.1f delta_b=%.1f" % (os.path.basename(p), wbs[p][0], wbs[p][1]))
 
-    # Usar rosto_papel para extrair WB e aplicar em todas (simula fluxo real)
-    from processing.preprocess import get_white_balance_correction, load_image
-    wb_correction = None
-    rosto_papel_path = os.path.join(REF_DIR, "rosto_papel.jpg")
-    if os.path.isfile(rosto_papel_path):
-        with open(rosto_papel_path, "rb") as f:
-            img_papel = load_image(io.BytesIO(f.read()))
-        if img_papel is not None:
-            da, db = get_white_balance_correction(img_papel)
-            if abs(da) > 0.5 or abs(db) > 0.5:
-                wb_correction = (da, db)
-                print("WB a partir de rosto_papel.jpg: delta_a=%.1f delta_b=%.1f" % (da, db))
-
-    for img_path, txt_path, region, region_key in cases:
-        # rosto_papel é a fonte do WB; as outras imagens usam essa correção
-        use_wb = wb_correction if os.path.basename(img_path) != "rosto_papel.jpg" else None
-        our_lab = run_pipeline_on_image(img_path, region, wb_correction=use_wb)
-        ref_hexes = parse_hex_from_txt(txt_path)
+        # 2) Leitura de cada caso com a correção da sua folha
+        tarefas = {}
+        for i, caso in enumerate(casos):
+            if not os.path.isfile(caso["imagem"]):
+                print("Skip (imagem não encontrada):", caso["imagem"])
+                continue
+            wb = wbs.get(caso["papel"]) if caso["papel"] else None
+            tarefas[i] = (_leitura, (caso["imagem"], caso["regiao"], wb), _ler(caso["imagem"]))
+        leituras, acertos = _rodar(tarefas, pool, cache, versao)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    print("%d casos, %d do cache (+%d folhas), %.1fs" % (len(tarefas), acertos, acertos_wb, time.perf_counter() - t0))
+
+    offsets_by_region = {rk: [] for rk in REGIOES}  # (índice em results, (dL, da, db)) dos casos que calibram
+    results = []
+    for i, caso in enumerate(casos):
+        if i not in leituras:
+            continue
+        nome = os.path.relpath(caso["imagem"], os.path.dirname(os.path.abspath(args.manifesto)))
+        ref_hexes = parse_hex_from_txt(caso["referencia"])
+        leitura = leituras[i]
         if not ref_hexes:
-            if our_lab is not None:
-                our_hex = lab_to_hex(our_lab[0], our_lab[1], our_lab[2])
-                print(os.path.basename(img_path), "our", our_hex, "(sem ref em", os.path.basename(txt_path) + ")")
+            if leitura is not None:
+                print(nome, "our", lab_to_hex(*leitura["mean_lab"][:3]), "(sem ref em", os.path.basename(caso["referencia"]) + ")")
             else:
-                print("Skip (no ref hex):", txt_path)
+                print("Skip (no ref hex):", caso["referencia"])
             continue
-        ref_labs = [hex_to_lab(h) for h in ref_hexes]
-        ref_L = sum(l[0] for l in ref_labs) / len(ref_labs)
-        ref_a = sum(l[1] for l in ref_labs) / len(ref_labs)
-        ref_b = sum(l[2] for l in ref_labs) / len(ref_labs)
-        if our_lab is None:
-            print("Skip (pipeline failed):", img_path)
+        if leitura is None:
+            print("Skip (pipeline failed):", caso["imagem"])
             continue
+        ref_L, ref_a, ref_b = (float(v) for v in hex_to_lab_batch(ref_hexes).mean(axis=0))
+        our_lab = leitura["mean_lab"]
         oL, oa, ob = our_lab[0], our_lab[1], our_lab[2]
-        dL = ref_L - oL
-        da = ref_a - oa
-        db = ref_b - ob
-        offsets_by_region[region_key].append((dL, da, db))
+        dL, da, db = ref_L - oL, ref_a - oa, ref_b - ob
+        if caso["calibrar"]:
+            offsets_by_region[caso["regiao"]].append((len(results), (dL, da, db)))
         our_hex = lab_to_hex(oL, oa, ob)
         ref_hex_approx = lab_to_hex(ref_L, ref_a, ref_b)
         de = delta_e_lab(our_lab, [ref_L, ref_a, ref_b])
         pct = match_percent(de)
         results.append({
-            "image": os.path.basename(img_path),
-            "region_key": region_key,
+            "image": nome,
+            "region_key": caso["regiao"],
+            "calibrar": caso["calibrar"],
+            "rotulos": caso["rotulos"],
             "our_lab": our_lab,
             "our_hex": our_hex,
+            "n_pixels": leitura["n_pixels"],
             "ref_lab": [ref_L, ref_a, ref_b],
             "ref_hex": ref_hex_approx,
             "offset": [round(dL, 2), round(da, 2), round(db, 2)],
             "delta_e": round(de, 2),
             "match_percent": round(pct, 1),
         })
-        print(os.path.basename(img_path), "our", our_hex, "ref~", ref_hex_approx, "offset L,a,b:", round(dL, 1), round(da, 1), round(db, 1), "| delta_E=%.1f coincidência=%.0f%%" % (de, pct))
+        print(nome, "our", our_hex, "ref~", ref_hex_approx, "offset L,a,b:", round(dL, 1), round(da, 1), round(db, 1), "| delta_E=%.1f coincidência=%.0f%%" % (de, pct))
 
-    import numpy as np
-    # Calibração por região (skin_face, skin_arm, hair)
-    # skin_face: offset de rosto_papel (cenário com papel)
-    # skin_arm: offset só de interno_braco.png (referência confiável; externo_braco pode ter fallback impreciso)
+    # Calibração por região (skin_face, skin_arm, hair): estimativa robusta sobre os casos da região
     by_region = {}
-    for rk, offsets in offsets_by_region.items():
-        if not offsets:
+    estimativas = {}
+    for rk, itens in offsets_by_region.items():
+        if not itens:
             continue
-        if rk == "skin_face" and len(offsets) >= 1:
-            first = offsets[0]
-            by_region[rk] = [round(first[0], 4), round(first[1], 4), round(first[2], 4)]
-        elif rk == "skin_arm":
-            # Usar só o primeiro (interno_braco) para não estragar com externo_braco
-            first = offsets[0]
-            by_region[rk] = [round(first[0], 4), round(first[1], 4), round(first[2], 4)]
-        else:
-            dLs = [x[0] for x in offsets]
-            dAs = [x[1] for x in offsets]
-            dBs = [x[2] for x in offsets]
-            by_region[rk] = [
-                round(float(np.median(dLs)), 4),
-                round(float(np.median(dAs)), 4),
-                round(float(np.median(dBs)), 4),
-            ]
-    # Fallback global (mediana de todos os offsets)
-    all_offsets = []
-    for off_list in offsets_by_region.values():
-        all_offsets.extend(off_list)
+        offset, descartados, mad = estimar_offset([off for _, off in itens])
+        by_region[rk] = [round(v, 4) for v in offset]
+        estimativas[rk] = {
+            "casos": len(itens),
+            "descartados": [results[itens[j][0]]["image"] for j in descartados],
+            "mad": [round(v, 3) for v in mad],
+        }
+        for j in descartados:
+            results[itens[j][0]]["descartado"] = True
+    # Fallback global (mesma estimativa sobre todos os casos que calibram)
+    all_offsets = [off for itens in offsets_by_region.values() for _, off in itens]
     if not all_offsets:
-        print("Nenhum par nosso/ref válido. Verifique imagens e .txt em referencia_cor/")
-        return
-    calib_L = float(np.median([x[0] for x in all_offsets]))
-    calib_a = float(np.median([x[1] for x in all_offsets]))
-    calib_b = float(np.median([x[2] for x in all_offsets]))
+        print("Nenhum par nosso/ref válido. Verifique imagens e .txt em", os.path.dirname(os.path.abspath(args.manifesto)))
+        return 1
+    (calib_L, calib_a, calib_b), _, _ = estimar_offset(all_offsets)
     calibration = {
         "offset_L": round(calib_L, 4),
         "offset_a": round(calib_a, 4),
         "offset_b": round(calib_b, 4),
         "by_region": by_region,
     }
-    out_path = os.path.join(ROOT, "backend", "processing", "calib.json")
-    with open(out_path, "w", encoding="utf-8") as f:
-        json.dump(calibration, f, indent=2)
-    print("\nCalibração salva em", out_path, ":", calibration)
+    gravar_json_atomico(args.saida, calibration)
+    print("\nCalibração salva em", args.saida, ":", calibration)
+    for rk, est in estimativas.items():
+        if est["descartados"]:
+            print("  %s: %d casos, descartados (MAD): %s" % (rk, est["casos"], ", ".join(est["descartados"])))
 
     # Coincidência após aplicar calibração por região
     print("\nCoincidência após calibração (por região):")
@@ -195,22 +328,37 @@ def main():
         o = r["our_lab"]
         rk = r.get("region_key", "skin_face")
         off = by_region.get(rk, [calib_L, calib_a, calib_b])
-        calib_L_app = o[0] + off[0]
-        calib_a_app = o[1] + off[1]
-        calib_b_app = o[2] + off[2]
         ref = r["ref_lab"]
-        de_after = delta_e_lab([calib_L_app, calib_a_app, calib_b_app], ref)
+        de_after = delta_e_lab([o[0] + off[0], o[1] + off[1], o[2] + off[2]], ref)
         pct_after = match_percent(de_after)
         r["delta_e_after_calib"] = round(de_after, 2)
         r["match_percent_after_calib"] = round(pct_after, 1)
-        print("  %s (%s): delta_E=%.1f coincidência=%.0f%%" % (r["image"], rk, de_after, pct_after))
+        if len(results) <= 50:
+            print("  %s (%s): delta_E=%.1f coincidência=%.0f%%" % (r["image"], rk, de_after, pct_after))
     avg_match = sum(r.get("match_percent_after_calib", 0) for r in results) / max(1, len(results))
     print("  Média coincidência: %.0f%% (objetivo >= 95%%)" % avg_match)
 
-    with open(os.path.join(ROOT, "backend", "scripts", "calib_report.json"), "w", encoding="utf-8") as f:
-        json.dump({"calibration": calibration, "per_image": results}, f, indent=2)
-    print("\nRelatório por imagem: backend/scripts/calib_report.json")
+    # delta E médio após a calibração por valor de cada rótulo (tom de pele, iluminação...)
+    por_rotulo = {}
+    for r in results:
+        for chave, valor in r["rotulos"].items():
+            por_rotulo.setdefault(chave, {}).setdefault(str(valor), []).append(r["delta_e_after_calib"])
+    por_rotulo = {
+        chave: {valor: {"casos": len(des), "delta_e_medio": round(float(np.mean(des)), 2)} for valor, des in sorted(valores.items())}
+        for chave, valores in por_rotulo.items()
+    }
+    for chave, valores in por_rotulo.items():
+        print("  %s: %s" % (chave, ", ".join("%s=%.1f (%d)" % (v, m["delta_e_medio"], m["casos"]) for v, m in valores.items())))
+
+    gravar_json_atomico(args.relatorio, {
+        "calibration": calibration,
+        "estimativas": estimativas,
+        "por_rotulo": por_rotulo,
+        "per_image": results,
+    })
+    print("\nRelatório por imagem:", args.relatorio)
+    return 0
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
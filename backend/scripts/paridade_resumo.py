@@ -0,0 +1,112 @@
+"""
+Paridade entre o /analisar (fotos) e o /analisar/features (resumos das regiões, processing/resumo.py) sobre as
+fotos de referencia_cor (originais ou ampliadas):
+  histograma: o resumo de referência (resumo.resumir_fotos) é igual ao np.histogramdd dos pixels da região
+              que o /analisar usa (pipeline.region_pixels);
+  features:   features_de_resumo contra extract_region_features_uint8 (motor "histograma") sobre esses
+              pixels: delta E76 de média, mediana e média aparada (mediana e percentis caem no centro de uma
+              célula: erro de até meia célula; a média é o que a classificação usa);
+  resposta:   /analisar contra /analisar/features (TestClient): rótulos do perfil cromático, delta E de
+              skin_mean_lab/hair_mean_lab e tamanho do que sobe (fotos x JSON).
+Sai com código 1 se algum histograma diferir, algum rótulo mudar ou o delta E de alguma média passar de
+--tolerancia-de.
+
+Execute na raiz do projeto:
+  python -m backend.scripts.paridade_resumo [--mp 0 12] [--bins 16 32 64] [--tolerancia-de 2.0]
+"""
+import argparse
+import json
+import os
+import sys
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+BACKEND = os.path.join(ROOT, "backend")
+sys.path.insert(0, BACKEND)
+
+import numpy as np
+
+ROTULOS = ("subtom", "valor", "croma", "contraste", "estacao")
+
+
+def _de(a, b):
+    return float(np.linalg.norm(np.subtract(a[:3], b[:3])))
+
+
+def histograma_independente(pixels_u8, bins):
+    """(índices, contagens) do mesmo histograma por np.histogramdd, para conferir resumo.histograma_lab."""
+    bordas = [np.arange(bins + 1) * (256 // bins)] * 3
+    hist, _ = np.histogramdd(pixels_u8.astype(np.float64), bins=bordas)
+    hist = hist.astype(np.int64).ravel()
+    indices = np.flatnonzero(hist)
+    return indices, hist[indices]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--mp", type=float, nargs="+", default=[0], help="0 = imagens originais")
+    parser.add_argument("--bins", type=int, nargs="+", default=[32])
+    parser.add_argument("--tolerancia-de", type=float, default=2.0, help="delta E76 máximo das médias")
+    parser.add_argument("--cache-dir", default=None, help="guarda as ampliações em disco entre execuções")
+    args = parser.parse_args()
+
+    # Sem caches (cada chamada roda o caminho inteiro) e tudo no próprio processo
+    os.environ["COLORIMETRIA_CACHE_MB"] = "0"
+    os.environ["COLORIMETRIA_FEATURES_CACHE_MB"] = "0"
+    os.environ.pop("COLORIMETRIA_CACHE_SQLITE", None)
+    os.environ["COLORIMETRIA_WORKERS"] = "0"
+    os.chdir(BACKEND)
+
+    from fastapi.testclient import TestClient
+    import main as app_main
+    from benchmarks.fixtures import CASOS, carregar, rotulo_mp
+    from processing import resumo
+    from processing.extract import extract_region_features_uint8
+    from processing.pipeline import region_pixels, white_balance_from_paper
+
+    falhou = False
+    with TestClient(app_main.app) as cliente:
+        for mp in args.mp:
+            fotos = carregar(mp, args.cache_dir)
+            campos = {campo: fotos[nome] for nome, _, campo in CASOS}
+            arquivos = {campo: (nome, fotos[nome]) for nome, _, campo in CASOS}
+            r = cliente.post("/analisar", files=arquivos)
+            r.raise_for_status()
+            ref = r.json()["perfil_cromatico"]
+            wb = white_balance_from_paper(campos["rosto_com_papel"])
+            tamanho_fotos = sum(len(fotos[nome]) for nome, _, _ in CASOS)
+
+            for bins in args.bins:
+                rotulo = "%s, %d bins" % (rotulo_mp(mp), bins)
+                corpo = resumo.resumir_fotos(
+                    campos["rosto"], campos["braco_interno"], campos["cabelo"], campos["rosto_com_papel"], bins
+                )
+                for campo, role in resumo.REGIOES:
+                    pixels = region_pixels(campos[campo], role, wb)
+                    indices, contagens = histograma_independente(pixels, bins)
+                    igual = (indices.tolist() == corpo[campo]["indices"]
+                             and contagens.tolist() == corpo[campo]["contagens"])
+                    exato = extract_region_features_uint8(pixels, cluster_engine="histograma")
+                    aprox = resumo.features_de_resumo(corpo[campo])
+                    des = [_de(exato[k], aprox[k]) for k in ("mean_lab", "median_lab", "trimmed_mean_lab")]
+                    falhou = falhou or not igual or des[0] > args.tolerancia_de
+                    print("%-16s %-14s células %6d  histograma %s  dE média %.3f mediana %.3f aparada %.3f" % (
+                        rotulo, campo, len(indices), "igual" if igual else "DIFERENTE", *des,
+                    ))
+
+                texto = json.dumps(corpo, separators=(",", ":"))
+                r = cliente.post("/analisar/features", content=texto, headers={"Content-Type": "application/json"})
+                r.raise_for_status()
+                obtido = r.json()["perfil_cromatico"]
+                mudou = [k for k in ROTULOS if obtido[k] != ref[k]]
+                de_pele = _de(obtido["skin_mean_lab"], ref["skin_mean_lab"])
+                de_cabelo = _de(obtido["hair_mean_lab"], ref["hair_mean_lab"])
+                falhou = falhou or bool(mudou) or max(de_pele, de_cabelo) > args.tolerancia_de
+                print("%-16s resposta: %s; dE pele %.3f cabelo %.3f; upload %.1f KB (fotos %.0f KB)" % (
+                    rotulo, "rótulos iguais" if not mudou else "MUDOU " + ", ".join(mudou), de_pele, de_cabelo,
+                    len(texto) / 1024.0, tamanho_fotos / 1024.0,
+                ))
+    sys.exit(1 if falhou else 0)
+
+
+if __name__ == "__main__":
+    main()
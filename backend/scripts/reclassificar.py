@@ -0,0 +1,171 @@
+"""
+Reclassifica um arquivo JSONL de análises antigas com a tabela de regras atual (ou outra, via --regras),
+sem rodar o pipeline de imagem: classify.classificar_lote sobre as features guardadas.
+Cada linha: {"skin_mean_lab": [L, a, b], "braco_mean_lab": [...], "hair_mean_lab": [...], "chroma_mean": x, ...}
+(mean_lab já calibrados; braco/hair/chroma opcionais). Sem eles na raiz, lê de "perfil_cromatico" (resposta
+guardada do /analisar), que não traz chroma_mean nem o braço: croma sai "ausente" e o subtom usa só o rosto.
+As demais chaves (id etc.) são mantidas; a saída ganha "classificacao" e, se a
+linha tinha perfil_cromatico, "mudou" com os campos cujo rótulo trocou.
+Execute na raiz do projeto:
+  python -m backend.scripts.reclassificar analises.jsonl --saida reclassificadas.jsonl [--regras regras.json]
+  python -m backend.scripts.reclassificar --sintetico 500000 --conferir    (tempo e paridade com as escalares)
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+sys.path.insert(0, os.path.join(ROOT, "backend"))
+
+from processing import classify
+
+CAMPOS = ("subtom", "valor", "croma", "contraste", "estacao")
+
+
+def carregar_regras(path):
+    """REGRAS com as seções do JSON em path no lugar das originais (ex.: só {"valor": {...}})."""
+    regras = dict(classify.REGRAS)
+    if path:
+        with open(path, "r", encoding="utf-8") as f:
+            regras.update(json.load(f))
+    return regras
+
+
+def _feature(registro, chave):
+    valor = registro.get(chave)
+    if valor is None:
+        valor = (registro.get("perfil_cromatico") or {}).get(chave)
+    return valor
+
+
+def _lab(valor):
+    return [float(v) for v in valor[:3]] if valor is not None and len(valor) >= 3 else [np.nan] * 3
+
+
+def montar_arrays(registros):
+    """(skin, braco, hair (N, 3), chroma (N,)) com NaN onde a linha não tem a feature."""
+    skin = np.array([_lab(_feature(r, "skin_mean_lab")) for r in registros], dtype=np.float64).reshape(-1, 3)
+    braco = np.array([_lab(_feature(r, "braco_mean_lab")) for r in registros], dtype=np.float64).reshape(-1, 3)
+    hair = np.array([_lab(_feature(r, "hair_mean_lab")) for r in registros], dtype=np.float64).reshape(-1, 3)
+    chroma = np.array(
+        [np.nan if _feature(r, "chroma_mean") is None else float(_feature(r, "chroma_mean")) for r in registros],
+        dtype=np.float64,
+    )
+    return skin, braco, hair, chroma
+
+
+def classificar_escalar(skin, braco, hair, chroma, regras):
+    """Uma linha pelas funções escalares, com None no lugar de NaN (referência da paridade)."""
+    skin = None if np.isnan(skin).any() else list(skin)
+    braco = None if np.isnan(braco).any() else list(braco)
+    hair = None if np.isnan(hair).any() else list(hair)
+    chroma = None if np.isnan(chroma) else float(chroma)
+    subtom = classify.infer_subtom(skin, braco, regras)
+    valor = classify.infer_valor(skin[0] if skin else None, regras)
+    croma = classify.infer_croma(chroma, regras)
+    contraste = classify.infer_contrast(skin, hair, regras)
+    estacao = classify.classify_season(subtom, valor, croma, contraste, regras)
+    return {"subtom": subtom, "valor": valor, "croma": croma, "contraste": contraste, "estacao": estacao}
+
+
+def conferir(skin, braco, hair, chroma, rotulos, regras, maximo=None):
+    """Compara o lote com as funções escalares linha a linha. Retorna (linhas conferidas, divergências)."""
+    n = len(skin) if maximo is None else min(len(skin), maximo)
+    divergencias = []
+    for i in range(n):
+        esperado = classificar_escalar(skin[i], braco[i], hair[i], chroma[i], regras)
+        obtido = {campo: str(rotulos[campo][i]) for campo in CAMPOS}
+        if obtido != esperado:
+            divergencias.append((i, esperado, obtido))
+    return n, divergencias
+
+
+def sintetico(n, semente=0):
+    """N perfis aleatórios cobrindo as faixas, com limiares exatos e ausências (NaN) misturados."""
+    rng = np.random.default_rng(semente)
+    skin = np.column_stack([rng.uniform(20, 90, n), rng.uniform(-8, 12, n), rng.uniform(-8, 25, n)])
+    braco = np.column_stack([rng.uniform(20, 90, n), rng.uniform(-8, 12, n), rng.uniform(-8, 25, n)])
+    hair = np.column_stack([rng.uniform(5, 80, n), rng.uniform(-5, 10, n), rng.uniform(-5, 20, n)])
+    chroma = rng.uniform(-2, 40, n)
+    # Valores exatamente nos limiares (onde < e <= se distinguem), arredondando parte das linhas
+    inteiros = rng.random(n) < 0.3
+    for arr in (skin, braco, hair):
+        arr[inteiros] = np.round(arr[inteiros])
+    chroma[inteiros] = np.round(chroma[inteiros])
+    braco[rng.random(n) < 0.2] = np.nan
+    hair[rng.random(n) < 0.05] = np.nan
+    skin[rng.random(n) < 0.02] = np.nan
+    chroma[rng.random(n) < 0.1] = np.nan
+    return skin, braco, hair, chroma
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("arquivo", nargs="?", help="JSONL de análises (uma por linha)")
+    parser.add_argument("--saida", default=None, help="JSONL reclassificado (padrão: só o resumo)")
+    parser.add_argument("--regras", default=None, help="JSON com seções da tabela de regras a substituir")
+    parser.add_argument("--sintetico", type=int, default=0, help="classifica N perfis aleatórios em vez de um arquivo")
+    parser.add_argument("--conferir", action="store_true", help="confere cada linha com as funções escalares")
+    parser.add_argument("--conferir-max", type=int, default=None, help="confere só as N primeiras linhas")
+    args = parser.parse_args()
+    if not args.arquivo and not args.sintetico:
+        parser.error("informe o arquivo JSONL ou --sintetico N")
+    regras = carregar_regras(args.regras)
+
+    registros = None
+    t0 = time.perf_counter()
+    if args.sintetico:
+        skin, braco, hair, chroma = sintetico(args.sintetico)
+    else:
+        with open(args.arquivo, "r", encoding="utf-8") as f:
+            registros = [json.loads(linha) for linha in f if linha.strip()]
+        skin, braco, hair, chroma = montar_arrays(registros)
+    t_leitura = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    rotulos = classify.classificar_lote(skin, braco, hair, chroma, regras)
+    t_lote = time.perf_counter() - t0
+    n = len(skin)
+    print("%d perfis: leitura %.2f s, classificação %.1f ms (%.0f perfis/s)"
+          % (n, t_leitura, t_lote * 1000, n / t_lote if t_lote > 0 else float("inf")))
+    for campo in CAMPOS:
+        nomes, contagens = np.unique(rotulos[campo], return_counts=True)
+        print("  %-10s %s" % (campo, ", ".join("%s=%d" % (k, c) for k, c in zip(nomes, contagens))))
+
+    if registros is not None:
+        mudaram = 0
+        saida = open(args.saida, "w", encoding="utf-8") if args.saida else None
+        try:
+            for i, registro in enumerate(registros):
+                novo = {campo: str(rotulos[campo][i]) for campo in CAMPOS}
+                antigo = registro.get("perfil_cromatico") or {}
+                mudou = [campo for campo in CAMPOS if campo in antigo and antigo[campo] != novo[campo]]
+                mudaram += bool(mudou)
+                if saida is not None:
+                    registro = dict(registro, classificacao=novo)
+                    if antigo:
+                        registro["mudou"] = mudou
+                    saida.write(json.dumps(registro, ensure_ascii=False) + "\n")
+        finally:
+            if saida is not None:
+                saida.close()
+        print("%d perfis mudaram de rótulo em relação ao perfil_cromatico guardado" % mudaram)
+
+    if args.conferir:
+        t0 = time.perf_counter()
+        conferidas, divergencias = conferir(skin, braco, hair, chroma, rotulos, regras, args.conferir_max)
+        t_escalar = time.perf_counter() - t0
+        print("paridade com as funções escalares: %d linhas em %.2f s, %d divergências"
+              % (conferidas, t_escalar, len(divergencias)))
+        for i, esperado, obtido in divergencias[:10]:
+            print("  linha %d: escalar %s, lote %s" % (i, esperado, obtido))
+        if divergencias:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+Treina o modelo de pele em tabela de cores (processing/skin_lut.py) a partir das fotos do manifesto de
+referencia_cor (o mesmo de scripts/calibrate.py).
+
+Cada foto passa pelo pré-processamento do servidor (resolução COLORIMETRIA_MAX_LADO, correção de branco da
+foto com papel). Rótulos: pele = máscara final das regras HSV (segment_skin_region, com o rosto do FaceMesh
+em skin_face); não pele = o resto da foto (fundo, cabelo, olhos, roupa) e a região de cabelo dos casos hair.
+Cada célula da tabela conta pixels de pele e de não pele; é pele se a proporção de pele passa de --limiar.
+Células com menos de --minimo pixels ficam com as regras HSV no centro da célula (--semente hsv) ou como
+não pele (--semente vazia). Assim a tabela aprende o contexto que as regras não veem (cores de pele que só
+aparecem fora do rosto) e se comporta como as regras nas cores que as fotos não cobrem.
+
+Execute na raiz do projeto:
+  python -m backend.scripts.treinar_pele_lut --saida pele_lut.npz [--espaco ycrcb] [--bits 6]
+  COLORIMETRIA_PELE_LUT=pele_lut.npz ...        (usa no servidor)
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+REF_DIR = os.path.join(ROOT, "referencia_cor")
+sys.path.insert(0, os.path.join(ROOT, "backend"))
+
+from processing import config, skin_lut
+
+MANIFESTO_PADRAO = os.path.join(REF_DIR, "manifesto.json")
+SAIDA_PADRAO = os.path.join(ROOT, "backend", "scripts", "pele_lut.npz")
+
+
+def _ler(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def rotular(caso, pasta, professor):
+    """
+    (imagem BGR pré-processada, máscara de pele bool, máscara de não pele bool) de um caso do manifesto.
+    professor: TabelaPele das regras HSV (explícita, para não rotular com uma tabela já configurada).
+    None se é skin_face e o FaceMesh não achou o rosto (a pele do rosto viraria "não pele").
+    """
+    from processing.pipeline import white_balance_from_paper
+    from processing.preprocess import preprocess_pipeline
+    from processing.segment import segment_face_mediapipe, segment_hair_region, segment_skin_region
+
+    wb = white_balance_from_paper(_ler(os.path.join(pasta, caso["papel"]))) if caso.get("papel") else None
+    pre = preprocess_pipeline(_ler(os.path.join(pasta, caso["imagem"])), wb_correction=wb,
+                              max_side=config.MAX_LADO, lab_float=False)
+    bgr, scale = pre["bgr"], pre["scale"]
+    if caso["regiao"] == "hair":
+        cabelo = segment_hair_region(bgr, None, scale=scale) > 0
+        return bgr, np.zeros_like(cabelo), cabelo
+    face = segment_face_mediapipe(bgr) if caso["regiao"] == "skin_face" else None
+    if face is not None and not face.any():
+        return None
+    pele = segment_skin_region(bgr, face, scale=scale, modelo=professor) > 0
+    return bgr, pele, ~pele
+
+
+def treinar(amostras, espaco="ycrcb", bits=6, limiar=0.5, minimo=5, semente="hsv"):
+    """
+    Tabela (2^bits)³ bool a partir de [(bgr, pele, nao_pele)]. Retorna (tabela, estatísticas).
+    """
+    n = 1 << bits
+    contagem_pele = np.zeros(n ** 3, dtype=np.int64)
+    contagem_outras = np.zeros(n ** 3, dtype=np.int64)
+    for bgr, pele, nao_pele in amostras:
+        q = skin_lut.quantizar(skin_lut.converter(bgr, espaco).reshape(-1, 3), bits)
+        celula = (q[:, 0] * n + q[:, 1]) * n + q[:, 2]
+        contagem_pele += np.bincount(celula[pele.ravel()], minlength=n ** 3)
+        contagem_outras += np.bincount(celula[nao_pele.ravel()], minlength=n ** 3)
+    total = contagem_pele + contagem_outras
+    vistas = total >= minimo
+    tabela = skin_lut.tabela_hsv(espaco, bits).ravel() if semente == "hsv" else np.zeros(n ** 3, dtype=bool)
+    tabela[vistas] = contagem_pele[vistas] > limiar * total[vistas]
+    estatisticas = {
+        "pixels_pele": int(contagem_pele.sum()),
+        "pixels_nao_pele": int(contagem_outras.sum()),
+        "celulas_vistas": int(vistas.sum()),
+        "celulas_pele": int(tabela.sum()),
+    }
+    return tabela.reshape(n, n, n), estatisticas
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Treina o modelo de pele em tabela de cores (skin_lut).")
+    parser.add_argument("--manifesto", default=MANIFESTO_PADRAO)
+    parser.add_argument("--saida", default=SAIDA_PADRAO, help=".npz para COLORIMETRIA_PELE_LUT")
+    parser.add_argument("--espaco", default="ycrcb", choices=skin_lut.ESPACOS)
+    parser.add_argument("--bits", type=int, default=6, help="níveis por canal = 2^bits (1-8)")
+    parser.add_argument("--limiar", type=float, default=0.5, help="proporção de pele para a célula ser pele")
+    parser.add_argument("--minimo", type=int, default=5, help="pixels para a célula sair das fotos")
+    parser.add_argument("--semente", default="hsv", choices=("hsv", "vazia"), help="células pouco vistas")
+    args = parser.parse_args()
+
+    with open(args.manifesto, "r", encoding="utf-8") as f:
+        casos = json.load(f)["casos"]
+    pasta = os.path.dirname(os.path.abspath(args.manifesto))
+    t0 = time.perf_counter()
+    professor = skin_lut.TabelaPele(skin_lut.tabela_hsv("bgr", 8), "bgr", 8)
+    amostras, usados = [], []
+    for caso in casos:
+        amostra = rotular(caso, pasta, professor)
+        if amostra is None:
+            print("%-22s %-9s sem rosto detectado: ignorada" % (caso["imagem"], caso["regiao"]))
+            continue
+        bgr, pele, nao_pele = amostra
+        print("%-22s %-9s pele %7d  não pele %7d" % (caso["imagem"], caso["regiao"], pele.sum(), nao_pele.sum()))
+        amostras.append((bgr, pele, nao_pele))
+        usados.append(caso["imagem"])
+    tabela, estatisticas = treinar(amostras, args.espaco, args.bits, args.limiar, args.minimo, args.semente)
+    meta = dict(
+        estatisticas, espaco=args.espaco, bits=args.bits, limiar=args.limiar, minimo=args.minimo,
+        semente=args.semente, casos=usados, max_lado=config.MAX_LADO,
+        data=time.strftime("%Y-%m-%dT%H:%M:%S"),
+    )
+    modelo = skin_lut.TabelaPele(tabela, args.espaco, args.bits, meta)
+    modelo.salvar(args.saida)
+    print("%s: %d células de pele de %d (%d vistas nas fotos), assinatura %s, %.1f s" % (
+        args.saida, estatisticas["celulas_pele"], tabela.size, estatisticas["celulas_vistas"],
+        modelo.assinatura, time.perf_counter() - t0,
+    ))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Validação de processing/colorspace.py contra as funções escalares de recommend (lab_to_hex, hex_to_lab),
+contra o colormath (se instalado) e contra os 34 pares de teste do CIEDE2000 (Sharma, Wu & Dalal 2005).
+Sai com código 1 se alguma comparação passar da tolerância.
+Execute na raiz do projeto: python -m backend.scripts.valida_colorspace
+"""
+import os
+import sys
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+sys.path.insert(0, os.path.join(ROOT, "backend"))
+
+import numpy as np
+
+from processing import colorspace
+from processing.recommend import HAS_COLORMATH, hex_to_lab, lab_to_hex
+
+# (L1, a1, b1, L2, a2, b2, delta E 2000 esperado)
+SHARMA_PAIRS = [
+    (50.0000, 2.6772, -79.7751, 50.0000, 0.0000, -82.7485, 2.0425),
+    (50.0000, 3.1571, -77.2803, 50.0000, 0.0000, -82.7485, 2.8615),
+    (50.0000, 2.8361, -74.0200, 50.0000, 0.0000, -82.7485, 3.4412),
+    (50.0000, -1.3802, -84.2814, 50.0000, 0.0000, -82.7485, 1.0000),
+    (50.0000, -1.1848, -84.8006, 50.0000, 0.0000, -82.7485, 1.0000),
+    (50.0000, -0.9009, -85.5211, 50.0000, 0.0000, -82.7485, 1.0000),
+    (50.0000, 0.0000, 0.0000, 50.0000, -1.0000, 2.0000, 2.3669),
+    (50.0000, -1.0000, 2.0000, 50.0000, 0.0000, 0.0000, 2.3669),
+    (50.0000, 2.4900, -0.0010, 50.0000, -2.4900, 0.0009, 7.1792),
+    (50.0000, 2.4900, -0.0010, 50.0000, -2.4900, 0.0010, 7.1792),
+    (50.0000, 2.4900, -0.0010, 50.0000, -2.4900, 0.0011, 7.2195),
+    (50.0000, 2.4900, -0.0010, 50.0000, -2.4900, 0.0012, 7.2195),
+    (50.0000, -0.0010, 2.4900, 50.0000, 0.0009, -2.4900, 4.8045),
+    (50.0000, -0.0010, 2.4900, 50.0000, 0.0010, -2.4900, 4.8045),
+    (50.0000, -0.0010, 2.4900, 50.0000, 0.0011, -2.4900, 4.7461),
+    (50.0000, 2.5000, 0.0000, 50.0000, 0.0000, -2.5000, 4.3065),
+    (50.0000, 2.5000, 0.0000, 73.0000, 25.0000, -18.0000, 27.1492),
+    (50.0000, 2.5000, 0.0000, 61.0000, -5.0000, 29.0000, 22.8977),
+    (50.0000, 2.5000, 0.0000, 56.0000, -27.0000, -3.0000, 31.9030),
+    (50.0000, 2.5000, 0.0000, 58.0000, 24.0000, 15.0000, 19.4535),
+    (50.0000, 2.5000, 0.0000, 50.0000, 3.1736, 0.5854, 1.0000),
+    (50.0000, 2.5000, 0.0000, 50.0000, 3.2972, 0.0000, 1.0000),
+    (50.0000, 2.5000, 0.0000, 50.0000, 1.8634, 0.5757, 1.0000),
+    (50.0000, 2.5000, 0.0000, 50.0000, 3.2592, 0.3350, 1.0000),
+    (60.2574, -34.0099, 36.2677, 60.4626, -34.1751, 39.4387, 1.2644),
+    (63.0109, -31.0961, -5.8663, 62.8187, -29.7946, -4.0864, 1.2630),
+    (61.2901, 3.7196, -5.3901, 61.4292, 2.2480, -4.9620, 1.8731),
+    (35.0831, -44.1164, 3.7933, 35.0232, -40.0716, 1.5901, 1.8645),
+    (22.7233, 20.0904, -46.6940, 23.0331, 14.9730, -42.5619, 2.0373),
+    (36.4612, 47.8580, 18.3852, 36.2715, 50.5065, 21.2231, 1.4146),
+    (90.8027, -2.0831, 1.4410, 91.1528, -1.6435, 0.0447, 1.4441),
+    (90.9257, -0.5406, -0.9208, 88.6381, -0.8985, -0.7239, 1.5381),
+    (6.7747, -0.2908, -2.4247, 5.8714, -0.0985, -2.2286, 0.6377),
+    (2.0776, 0.0795, -1.1350, 0.9033, -0.0636, -0.5514, 0.9082),
+]
+
+
+def check(nome, erro, tolerancia):
+    ok = erro <= tolerancia
+    print("%-52s erro=%-12.3g tol=%-8g %s" % (nome, erro, tolerancia, "ok" if ok else "FALHOU"))
+    return ok
+
+
+def main():
+    rng = np.random.default_rng(0)
+    n = 20000
+    lab = np.column_stack([rng.uniform(0, 100, n), rng.uniform(-128, 127, n), rng.uniform(-128, 127, n)])
+    rgb = rng.integers(0, 256, (n, 3), dtype=np.uint8)
+    hexes = colorspace.hex_encode(rgb)
+    ok = True
+
+    # HEX ida e volta
+    ok &= check("hex_decode(hex_encode(rgb)) == rgb", float(np.abs(colorspace.hex_decode(hexes).astype(int) - rgb).max()), 0)
+
+    # Contra as funções escalares
+    scalar_hex = [lab_to_hex(*row) for row in lab.tolist()]
+    mismatches = sum(1 for x, y in zip(colorspace.lab_to_hex(lab), scalar_hex) if x != y)
+    ok &= check("lab_to_hex vs recommend.lab_to_hex (nº diferentes)", float(mismatches), 0 if HAS_COLORMATH else n * 0.5)
+    scalar_lab = np.array([hex_to_lab(h) for h in hexes])
+    ok &= check("hex_to_lab vs recommend.hex_to_lab (máx |dif|)", float(np.abs(colorspace.hex_to_lab(hexes) - scalar_lab).max()), 1e-9)
+
+    # CIEDE2000: pares de referência
+    pairs = np.array(SHARMA_PAIRS)
+    de2000 = np.array([colorspace.delta_e_ciede2000(p[0:3], p[3:6])[0, 0] for p in pairs])
+    ok &= check("delta_e_ciede2000 vs Sharma et al. (34 pares)", float(np.abs(de2000 - pairs[:, 6]).max()), 1e-4)
+    # N×M igual a par a par
+    m = colorspace.delta_e_ciede2000(pairs[:, 0:3], pairs[:, 3:6])
+    ok &= check("delta_e_ciede2000 N×M diagonal == par a par", float(np.abs(np.diag(m) - de2000).max()), 1e-12)
+    de76 = colorspace.delta_e_cie76(lab[:500], lab[:300])
+    direct = np.linalg.norm(lab[:500, None, :] - lab[None, :300, :], axis=2)
+    # Expansão |a|² + |b|² - 2a·b: erro de arredondamento ~1e-5, irrelevante para delta E
+    ok &= check("delta_e_cie76 N×M vs norma direta", float(np.abs(de76 - direct).max()), 1e-4)
+
+    # Contra o colormath
+    if HAS_COLORMATH:
+        from colormath.color_objects import LabColor, sRGBColor
+        from colormath.color_conversions import convert_color
+        sample = lab[:2000]
+        ref = np.array([[c.rgb_r, c.rgb_g, c.rgb_b] for c in
+                        (convert_color(LabColor(*row), sRGBColor) for row in sample.tolist())])
+        ok &= check("lab_to_rgb vs colormath (sem clip, máx |dif|)",
+                    float(np.abs(colorspace.lab_to_rgb(sample, clip=False) - ref).max()), 1e-9)
+        from colormath import color_diff_matrix
+        cm = np.array([color_diff_matrix.delta_e_cie1976(p[0:3], p[None, 3:6])[0] for p in pairs])
+        ok &= check("delta_e_cie76 vs colormath (pares Sharma)",
+                    float(np.abs(np.diag(colorspace.delta_e_cie76(pairs[:, 0:3], pairs[:, 3:6])) - cm).max()), 1e-4)
+    else:
+        print("colormath não instalado: comparações com colormath puladas")
+
+    print("OK" if ok else "FALHOU")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())